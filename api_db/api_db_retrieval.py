@@ -1,16 +1,13 @@
-from asyncio import current_task
 import os
 import sys
 import json
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional
 
-import tree_sitter_java
-from tree_sitter import Language, Parser, Query
-
-
-# Set up Tree-sitter parser and language
-JAVA_LANGUAGE = Language(tree_sitter_java.language())
-parser = Parser(JAVA_LANGUAGE)
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import retrieval_utils as utils
+import java_parser
 
 
 # Retrieve all imported APIs from the original code file
@@ -18,45 +15,87 @@ def retrieve_existing_apis(java_file_path: str):
     # Read code (bytes)
     with open(java_file_path, 'rb') as f:
         code = f.read()
-    tree = parser.parse(code)
+    tree = java_parser.parse(code)
 
-    # Query for all import declarations
-    query = Query(JAVA_LANGUAGE, "(import_declaration) @import")
-    captures = query.captures(tree.root_node)
-
-    # Add all import declarations to list
+    # Add all imported names to list, e.g. 'java.util.List', 'java.lang.Math.max' (static) or 'java.io.*'
     imported_apis = []
-    for name, nodes in captures.items():
-        for node in nodes:
-            snippet = code[node.start_byte:node.end_byte].decode('utf8')
-            snippet = snippet[7:-1]
-            imported_apis.append(snippet)
+    for imported_name, is_static, is_wildcard in utils.get_import_declarations(tree.root_node, code):
+        imported_apis.append(imported_name + '.*' if is_wildcard else imported_name)
 
     return imported_apis
 
 
 def get_api_db_path():
-    # Set working directory to script's parent directory
+    # Path to the API database next to this script
     ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
-    sys.path.insert(0, ROOT_DIR)
-
-    # Set path to API database
     API_DB_PATH = os.path.join(ROOT_DIR, "api_db.json")
     return API_DB_PATH
 
 
+class ApiDatabase:
+    """
+    In-memory index of the API database, loaded once per process.
+    All lookups are dict/set lookups, independent of the size of the database.
+    """
+
+    def __init__(self, api_db: Dict[str, List[str]]):
+        # Category -> APIs, deduplicated but in database order (the order is kept for prompts)
+        self.categories: Dict[str, tuple] = {
+            category: tuple(dict.fromkeys(apis)) for category, apis in api_db.items()
+        }
+        # Category -> set of APIs
+        self.category_sets: Dict[str, frozenset] = {
+            category: frozenset(apis) for category, apis in self.categories.items()
+        }
+        # Fully-qualified class -> category
+        self.class_to_category: Dict[str, str] = {}
+        # Simple class name (e.g. 'List') -> fully-qualified classes
+        self.simple_name_to_classes: Dict[str, List[str]] = {}
+        for category, apis in self.categories.items():
+            for api in apis:
+                self.class_to_category.setdefault(api, category)
+                self.simple_name_to_classes.setdefault(api.rsplit('.', 1)[-1], []).append(api)
+
+    @classmethod
+    def load(cls, api_db_path: str) -> 'ApiDatabase':
+        with open(api_db_path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def get_category(self, api: str) -> Optional[str]:
+        return self.class_to_category.get(api)
+
+    def get_apis(self, api_category: str) -> tuple:
+        return self.categories.get(api_category, ())
+
+    def get_classes_by_simple_name(self, simple_name: str) -> List[str]:
+        return self.simple_name_to_classes.get(simple_name, [])
+
+
+_api_db: Optional[ApiDatabase] = None
+_api_db_lock = threading.Lock()
+
+
+def get_api_db() -> ApiDatabase:
+    """
+    Return the process-wide ApiDatabase, loading api_db.json on first use.
+    """
+    global _api_db
+    with _api_db_lock:
+        if _api_db is None:
+            _api_db = ApiDatabase.load(get_api_db_path())
+    return _api_db
+
+
 # Retrieve APIs by category and add to a list
 def query_api_db(apis_to_retrieve: list, current_apis: list):
-    API_DB_PATH = get_api_db_path()
-    updated_apis = current_apis[:]
+    api_db = get_api_db()
+    updated_apis = list(current_apis)
+    seen_apis = set(current_apis)
 
-    with open(API_DB_PATH, "r", encoding="utf-8") as f:
-        api_db = json.load(f)
     for api_category in apis_to_retrieve:
-        if api_db[api_category][0] in updated_apis:
-            continue
-        else:
-            for api in api_db[api_category]:
+        for api in api_db.get_apis(api_category):
+            if api not in seen_apis:
+                seen_apis.add(api)
                 updated_apis.append(api)
-    
-    return updated_apis
\ No newline at end of file
+
+    return updated_apis
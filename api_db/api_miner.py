@@ -0,0 +1,359 @@
+"""
+Offline miner for a method-level API signature database.
+
+Walks Java source roots (e.g. the source directory of a Defects4J checkout) and optionally a JDK src.zip,
+extracts the public classes, methods and constructors with their parameters and return types, and writes
+them to a compact store that ApiSignatureStore reads through mmap.
+
+Mining is incremental: extracted signatures are cached by file hash, so only new or changed files are parsed.
+
+Usage:
+    python api_miner.py --source-root <checkout>/source --jdk-src-zip $JAVA_HOME/lib/src.zip
+"""
+import os
+import json
+import mmap
+import struct
+import bisect
+import hashlib
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import api_db_retrieval as adb
+import java_parser
+
+STORE_VERSION = 1
+STORE_MAGIC = b'APISIG'
+# magic, version, record count, offset of the record index
+STORE_HEADER = struct.Struct('<6sHIQ')
+STORE_OFFSET = struct.Struct('<Q')
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STORE_PATH = os.path.join(ROOT_DIR, 'api_signatures.store')
+DEFAULT_CACHE_PATH = os.path.join(ROOT_DIR, 'api_miner_cache.json')
+
+TYPE_DECLARATIONS = {
+    'class_declaration': 'class',
+    'interface_declaration': 'interface',
+    'enum_declaration': 'enum',
+    'record_declaration': 'record',
+}
+
+# A record is (fully-qualified class, kind, name, return type, parameters)
+Record = Tuple[str, str, str, str, str]
+
+
+########################
+# SIGNATURE EXTRACTION
+########################
+
+def get_modifiers(node, code: bytes) -> str:
+    for child in node.children:
+        if child.type == 'modifiers':
+            return code[child.start_byte:child.end_byte].decode('utf8')
+    return ''
+
+
+def is_public(node, code: bytes, in_interface: bool) -> bool:
+    modifiers = get_modifiers(node, code)
+    if in_interface:
+        # Interface members are implicitly public
+        return 'private' not in modifiers.split()
+    return 'public' in modifiers.split()
+
+
+def get_field_text(node, field_name: str, code: bytes) -> str:
+    child = node.child_by_field_name(field_name)
+    if child is None:
+        return ''
+    return code[child.start_byte:child.end_byte].decode('utf8')
+
+
+def format_parameters(parameters_node, code: bytes) -> str:
+    if parameters_node is None:
+        return ''
+    parameters = []
+    for parameter in parameters_node.named_children:
+        if parameter.type in ('formal_parameter', 'spread_parameter'):
+            # Collapse whitespace so that each record stays on one line
+            parameters.append(' '.join(code[parameter.start_byte:parameter.end_byte].decode('utf8').split()))
+    return ', '.join(parameters)
+
+
+def extract_signatures(code: bytes) -> List[Record]:
+    """
+    Extract the public types, methods and constructors of a Java compilation unit.
+    """
+    tree = java_parser.parse(code)
+    root = tree.root_node
+
+    package = ''
+    for child in root.named_children:
+        if child.type == 'package_declaration':
+            package = ' '.join(code[child.start_byte:child.end_byte].decode('utf8').split())
+            package = package[len('package '):].rstrip(';').strip()
+            break
+
+    records = []
+    # Stack of (type declaration node, enclosing fully-qualified name, enclosing type is an interface)
+    stack = [(child, package, False) for child in reversed(root.named_children) if child.type in TYPE_DECLARATIONS]
+    while stack:
+        type_node, enclosing_name, in_interface = stack.pop()
+        if not is_public(type_node, code, in_interface):
+            continue
+
+        type_name = get_field_text(type_node, 'name', code)
+        fqcn = f'{enclosing_name}.{type_name}' if enclosing_name else type_name
+        kind = TYPE_DECLARATIONS[type_node.type]
+        records.append((fqcn, kind, type_name, '', ''))
+
+        body = type_node.child_by_field_name('body')
+        if body is None:
+            continue
+        members = list(body.named_children)
+        # Enum constants come first; the members are in the enum_body_declarations child
+        for member in list(members):
+            if member.type == 'enum_body_declarations':
+                members.extend(member.named_children)
+
+        is_interface = kind == 'interface'
+        nested_types = []
+        for member in members:
+            if member.type == 'method_declaration' and is_public(member, code, is_interface):
+                records.append((
+                    fqcn, 'method',
+                    get_field_text(member, 'name', code),
+                    ' '.join(get_field_text(member, 'type', code).split()),
+                    format_parameters(member.child_by_field_name('parameters'), code)
+                ))
+            elif member.type == 'constructor_declaration' and is_public(member, code, is_interface):
+                records.append((
+                    fqcn, 'constructor',
+                    get_field_text(member, 'name', code),
+                    '',
+                    format_parameters(member.child_by_field_name('parameters'), code)
+                ))
+            elif member.type in TYPE_DECLARATIONS:
+                nested_types.append((member, fqcn, is_interface))
+        stack.extend(reversed(nested_types))
+
+    return records
+
+
+_open_zip_files: dict[str, zipfile.ZipFile] = {}
+
+
+def mine_source_file(source: Tuple[str, Optional[str], str]) -> Tuple[str, List[Record]]:
+    """
+    Worker function: read one source file (or src.zip entry) and extract its signatures.
+
+    Args:
+        source: (file hash, zip path or None, file path or zip entry name)
+    """
+    file_hash, zip_path, file_path = source
+    try:
+        if zip_path:
+            # Keep src.zip open in each worker instead of re-reading its central directory per entry
+            if zip_path not in _open_zip_files:
+                _open_zip_files[zip_path] = zipfile.ZipFile(zip_path)
+            code = _open_zip_files[zip_path].read(file_path)
+        else:
+            with open(file_path, 'rb') as f:
+                code = f.read()
+        return file_hash, extract_signatures(code)
+    except Exception as e:
+        print(f"Error mining {file_path}: {e}")
+        return file_hash, []
+
+
+########################
+# SOURCE DISCOVERY
+########################
+
+def hash_file(file_path: str) -> str:
+    with open(file_path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def find_source_files(source_roots: List[str], jdk_src_zip: Optional[str] = None) -> Iterator[Tuple[str, Optional[str], str]]:
+    """
+    Yield (file hash, zip path or None, file path or zip entry name) for every Java source file.
+    src.zip entries are hashed by their stored CRC and size, which needs no decompression.
+    """
+    for source_root in source_roots:
+        for directory, _, file_names in os.walk(source_root):
+            for file_name in file_names:
+                if file_name.endswith('.java'):
+                    file_path = os.path.join(directory, file_name)
+                    yield hash_file(file_path), None, file_path
+
+    if jdk_src_zip:
+        with zipfile.ZipFile(jdk_src_zip) as zip_file:
+            for info in zip_file.infolist():
+                # Skip package-info/module-info and anything outside the public java.*/javax.* APIs
+                entry_name = info.filename.split('/', 1)[-1] if info.filename.startswith('java.') else info.filename
+                if not info.filename.endswith('.java') or '-' in os.path.basename(info.filename):
+                    continue
+                if not entry_name.startswith(('java/', 'javax/')):
+                    continue
+                yield f'zip-{info.CRC:08x}-{info.file_size}', jdk_src_zip, info.filename
+
+
+########################
+# STORE
+########################
+
+def write_store(records: List[Record], store_path: str):
+    """
+    Write the records to a versioned store: a fixed header, the records as tab-separated UTF-8 lines
+    sorted by class and member name, and an index of record offsets so readers can binary search through mmap.
+    """
+    records = sorted(set(records), key=lambda record: (record[0], record[1] not in TYPE_DECLARATIONS.values(), record[2], record[4]))
+
+    temp_path = store_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(b'\0' * STORE_HEADER.size)
+        offsets = []
+        for record in records:
+            offsets.append(f.tell())
+            f.write(('\t'.join(record) + '\n').encode('utf8'))
+        index_offset = f.tell()
+        for offset in offsets:
+            f.write(STORE_OFFSET.pack(offset))
+        f.seek(0)
+        f.write(STORE_HEADER.pack(STORE_MAGIC, STORE_VERSION, len(records), index_offset))
+    # Replace atomically so readers never see a half-written store
+    os.replace(temp_path, store_path)
+
+
+class ApiSignatureStore:
+    """
+    Read-only view of a store written by write_store. Records are decoded on access from the mmap,
+    so opening the store costs nothing regardless of its size.
+    """
+
+    def __init__(self, store_path: str = DEFAULT_STORE_PATH):
+        self.file = open(store_path, 'rb')
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.record_count, self.index_offset = STORE_HEADER.unpack_from(self.data, 0)
+        if magic != STORE_MAGIC:
+            raise ValueError(f"{store_path} is not an API signature store")
+        if version != STORE_VERSION:
+            raise ValueError(f"{store_path} has store version {version}, expected {STORE_VERSION}")
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def __getitem__(self, index: int) -> Record:
+        if not 0 <= index < self.record_count:
+            raise IndexError(index)
+        offset = STORE_OFFSET.unpack_from(self.data, self.index_offset + index * STORE_OFFSET.size)[0]
+        end = self.data.find(b'\n', offset)
+        return tuple(self.data[offset:end].decode('utf8').split('\t'))
+
+    def __iter__(self) -> Iterator[Record]:
+        for index in range(self.record_count):
+            yield self[index]
+
+    def get_class(self, fqcn: str) -> List[Record]:
+        """
+        Return the records of a class (the type record first, then its members).
+        """
+        class_names = _ClassNameView(self)
+        index = bisect.bisect_left(class_names, fqcn)
+        records = []
+        while index < self.record_count:
+            record = self[index]
+            if record[0] != fqcn:
+                break
+            records.append(record)
+            index += 1
+        return records
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+
+class _ClassNameView:
+    """
+    Sequence of the class names of a store, for bisect.
+    """
+
+    def __init__(self, store: ApiSignatureStore):
+        self.store = store
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __getitem__(self, index: int) -> str:
+        return self.store[index][0]
+
+
+########################
+# MINING
+########################
+
+def load_cache(cache_path: str) -> dict:
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == STORE_VERSION:
+            return cache
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Ignoring unreadable miner cache {cache_path}: {e}")
+    return {'version': STORE_VERSION, 'files': {}}
+
+
+def mine_api_signatures(source_roots: List[str], jdk_src_zip: Optional[str] = None, store_path: str = DEFAULT_STORE_PATH,
+                        cache_path: str = DEFAULT_CACHE_PATH, max_workers: Optional[int] = None) -> int:
+    """
+    Mine the signatures of all source files and write the store. Only files whose hash is not in the cache are parsed.
+
+    Returns: number of records written
+    """
+    cache = load_cache(cache_path)
+    cached_files = cache['files']
+
+    sources = list(find_source_files(source_roots, jdk_src_zip))
+    current_hashes = {file_hash for file_hash, _, _ in sources}
+    to_mine = [source for source in sources if source[0] not in cached_files]
+    # Deduplicate identical files so each content is parsed once
+    to_mine = list({source[0]: source for source in to_mine}.values())
+
+    if to_mine:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for file_hash, records in executor.map(mine_source_file, to_mine, chunksize=64):
+                cached_files[file_hash] = records
+
+    # Drop cache entries of files that no longer exist so the cache does not grow forever
+    cache['files'] = {file_hash: records for file_hash, records in cached_files.items() if file_hash in current_hashes}
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+
+    records = [tuple(record) for file_hash in current_hashes for record in cache['files'][file_hash]]
+    write_store(records, store_path)
+    print(f"Mined {len(to_mine)} new files out of {len(sources)}; wrote {len(set(records))} records to {store_path}")
+    return len(set(records))
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Mine a method-level API signature database.')
+    argument_parser.add_argument('--source-root', action='append', default=[], help='Java source root (repeatable)')
+    argument_parser.add_argument('--jdk-src-zip', help='Path to the JDK src.zip')
+    argument_parser.add_argument('--output', default=DEFAULT_STORE_PATH, help='Path of the store to write')
+    argument_parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='Path of the incremental mining cache')
+    argument_parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    args = argument_parser.parse_args()
+
+    if not args.source_root and not args.jdk_src_zip:
+        argument_parser.error('Provide at least one --source-root or --jdk-src-zip')
+    mine_api_signatures(args.source_root, args.jdk_src_zip, args.output, args.cache, args.workers)
+
+
+if __name__ == '__main__':
+    main()
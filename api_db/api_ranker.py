@@ -0,0 +1,177 @@
+"""
+Ranked API retrieval for a buggy node.
+
+API signatures are indexed with an inverted index over their camel-case terms and scored with BM25 against the
+identifiers, types and invoked method names of the buggy node. Query terms that are not in the vocabulary match
+the vocabulary terms they are a prefix of (e.g. 'arr' -> 'array', 'arraylist').
+"""
+import os
+import re
+import math
+import bisect
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from tree_sitter import Node
+
+import api_db_retrieval as adb
+import api_miner
+
+# Node types whose text is an identifier worth searching for
+IDENTIFIER_NODE_TYPES = {'identifier', 'type_identifier', 'scoped_type_identifier', 'field_identifier'}
+
+CAMEL_CASE_PATTERN = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+# Prefix matches are worth less than exact term matches
+PREFIX_MATCH_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 20
+
+
+def split_identifier(identifier: str) -> List[str]:
+    """
+    Split an identifier into lowercase terms: the camel-case/snake-case parts and the whole identifier.
+    e.g. 'getDomainAxisIndex' -> ['get', 'domain', 'axis', 'index', 'getdomainaxisindex']
+    """
+    terms = [part.lower() for part in CAMEL_CASE_PATTERN.findall(identifier)]
+    whole = identifier.lower()
+    if whole.isidentifier() and whole not in terms:
+        terms.append(whole)
+    return terms
+
+
+def extract_query_terms(buggy_node: Node, code: bytes) -> List[str]:
+    """
+    Extract the terms of the identifiers, types and invoked method names in the buggy node.
+    """
+    terms = []
+    stack = [buggy_node]
+    while stack:
+        node = stack.pop()
+        if node.type in IDENTIFIER_NODE_TYPES and node.child_count == 0:
+            terms.extend(split_identifier(code[node.start_byte:node.end_byte].decode('utf8')))
+        else:
+            stack.extend(node.children)
+    return terms
+
+
+def format_signature(record: api_miner.Record) -> str:
+    fqcn, kind, name, return_type, parameters = record
+    if kind == 'method':
+        return f'{return_type} {fqcn}.{name}({parameters})'
+    if kind == 'constructor':
+        return f'{fqcn}({parameters})'
+    return f'{kind} {fqcn}'
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for code
+    return len(text) // 4 + 1
+
+
+class ApiRanker:
+    """
+    BM25 ranking of API signatures. The index is built once; a query touches only the postings of its terms.
+    """
+
+    def __init__(self, records: Iterable[api_miner.Record], k1: float = 1.2, b: float = 0.75):
+        self.signatures: List[str] = []
+        document_terms: List[Counter] = []
+        for record in records:
+            fqcn, kind, name, return_type, parameters = record
+            terms = split_identifier(name)
+            # Class name parts are part of every member, so "domain axis" finds the members of DomainAxis
+            terms += split_identifier(fqcn.rsplit('.', 1)[-1])
+            for identifier in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', f'{return_type} {parameters}'):
+                terms += split_identifier(identifier)
+            self.signatures.append(format_signature(record))
+            document_terms.append(Counter(terms))
+
+        document_count = len(document_terms)
+        average_length = sum(sum(terms.values()) for terms in document_terms) / max(document_count, 1)
+
+        # term -> list of (document id, BM25 weight of the term in the document)
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for document_id, terms in enumerate(document_terms):
+            length_norm = k1 * (1 - b + b * sum(terms.values()) / max(average_length, 1))
+            for term, frequency in terms.items():
+                postings.setdefault(term, []).append((document_id, frequency * (k1 + 1) / (frequency + length_norm)))
+
+        self.postings: Dict[str, List[Tuple[int, float]]] = {}
+        for term, term_postings in postings.items():
+            idf = math.log(1 + (document_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            self.postings[term] = [(document_id, weight * idf) for document_id, weight in term_postings]
+        # Sorted vocabulary for prefix matching with bisect
+        self.vocabulary: List[str] = sorted(self.postings)
+
+    def expand_term(self, term: str) -> List[Tuple[str, float]]:
+        """
+        Return the vocabulary terms that match a query term, with their match weight.
+        """
+        if term in self.postings:
+            return [(term, 1.0)]
+        if len(term) < MIN_PREFIX_LENGTH:
+            return []
+        expansions = []
+        index = bisect.bisect_left(self.vocabulary, term)
+        while index < len(self.vocabulary) and len(expansions) < MAX_PREFIX_EXPANSIONS:
+            vocabulary_term = self.vocabulary[index]
+            if not vocabulary_term.startswith(term):
+                break
+            expansions.append((vocabulary_term, PREFIX_MATCH_WEIGHT))
+            index += 1
+        return expansions
+
+    def rank(self, query_terms: Iterable[str], top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Return the top_k (signature, score) pairs for the query terms.
+        """
+        scores: Dict[int, float] = {}
+        for term, query_frequency in Counter(query_terms).items():
+            for vocabulary_term, match_weight in self.expand_term(term):
+                for document_id, weight in self.postings[vocabulary_term]:
+                    scores[document_id] = scores.get(document_id, 0.0) + query_frequency * match_weight * weight
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(self.signatures[document_id], score) for document_id, score in best]
+
+    def retrieve(self, query_terms: Iterable[str], top_k: int = 10, token_budget: int = 300) -> List[str]:
+        """
+        Return the most relevant signatures, best first, that fit within the token budget.
+        """
+        result = []
+        used_tokens = 0
+        for signature, _ in self.rank(query_terms, top_k):
+            tokens = estimate_tokens(signature)
+            if used_tokens + tokens > token_budget:
+                continue
+            result.append(signature)
+            used_tokens += tokens
+        return result
+
+
+_api_rankers: Dict[str, ApiRanker] = {}
+_api_ranker_lock = threading.Lock()
+
+
+def get_api_ranker(store_path: str = api_miner.DEFAULT_STORE_PATH) -> ApiRanker:
+    """
+    Return the process-wide ApiRanker of the store path. It indexes the mined signature store if there is one,
+    and otherwise the class names of api_db.json.
+    """
+    store_path = os.path.abspath(store_path)
+    with _api_ranker_lock:
+        ranker = _api_rankers.get(store_path)
+        if ranker is None:
+            if os.path.exists(store_path):
+                store = api_miner.ApiSignatureStore(store_path)
+                ranker = ApiRanker(store)
+                store.close()
+            else:
+                api_db = adb.get_api_db()
+                ranker = ApiRanker(
+                    (api, 'class', api.rsplit('.', 1)[-1], '', '') for api in api_db.class_to_category
+                )
+            _api_rankers[store_path] = ranker
+    return ranker
@@ -0,0 +1,276 @@
+"""
+Micro-benchmark of the context retrieval hot paths on Java files of increasing size.
+
+For every (file, number of bug locations) case it times retrieve_buggy_node, retrieve_code_by_line_number,
+get_comments_before_node, retrieve_existing_apis and format_context, and reports latency percentiles, the number of
+tree-sitter parses per call and the peak memory of one call. Results can be saved as a JSON baseline, and later runs
+are compared against it.
+
+Usage:
+    python benchmarks/context_retrieval_benchmark.py [--sizes 1000 5000 20000 50000] [--bug-counts 1 10 50]
+        [--java-file Real.java ...] [--save-baseline] [--baseline benchmarks/baselines/context_retrieval.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Add the context_retrieval, api_db and patching_agents directories to the path
+sys.path.append(os.path.join(ROOT_DIR, 'context_retrieval'))
+sys.path.append(os.path.join(ROOT_DIR, 'api_db'))
+sys.path.append(os.path.join(ROOT_DIR, 'patching_agents'))
+import isolate_bug as ib
+import java_parser
+import retrieval_utils as utils
+import api_db_retrieval as adb
+import format_context_retrieval as fcr
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines', 'context_retrieval.json')
+DEFAULT_SIZES = [1000, 5000, 20000, 50000]
+DEFAULT_BUG_COUNTS = [1, 10, 50]
+# A case regresses if its median latency or peak memory grows by more than this fraction, or it parses more often
+DEFAULT_THRESHOLD = 0.25
+
+
+########################
+# GENERATED JAVA FILES
+########################
+
+def generate_java_file(num_lines: int, seed: int = 0) -> str:
+    """
+    Generate a compilable-looking Java class of about num_lines lines: imports, fields, and documented methods
+    with loops, conditionals and calls, so tree sizes resemble real project files.
+    """
+    rng = random.Random(seed)
+    lines = ['package org.benchmark.generated;', '']
+    for package in ['java.util', 'java.io', 'java.util.concurrent', 'java.util.function']:
+        for name in ['List', 'Map', 'Set', 'Iterator']:
+            lines.append(f'import {package}.{name};')
+    lines.append('import static java.lang.Math.max;')
+    lines += ['', '/**', ' * Generated benchmark class.', ' */', 'public class Generated {', '']
+    for index in range(20):
+        lines.append(f'    private int field{index} = {rng.randint(0, 100)};')
+    lines.append('')
+
+    method_index = 0
+    while len(lines) < num_lines - 2:
+        lines += [
+            '    /**',
+            f'     * Computes value {method_index}.',
+            '     */',
+            f'    public int method{method_index}(int a, List<Integer> values) {{',
+            '        int total = 0;',
+            '        for (int i = 0; i < values.size(); i++) {',
+            f'            if (values.get(i) > {rng.randint(0, 50)}) {{',
+            f'                total += max(values.get(i), field{rng.randint(0, 19)});',
+            '            } else {',
+            f'                total -= helper{method_index}(a, i);',
+            '            }',
+            '        }',
+            '        return total;',
+            '    }',
+            '',
+            f'    // Helper for method{method_index}',
+            f'    private int helper{method_index}(int a, int b) {{',
+            f'        return a * b + {rng.randint(1, 9)};',
+            '    }',
+            '',
+        ]
+        method_index += 1
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def pick_bug_locations(java_file_path: str, bug_count: int, seed: int = 0) -> List[Tuple[int, int]]:
+    """
+    Pick bug_count single-statement bug locations inside methods, spread over the file.
+    """
+    with open(java_file_path, 'rb') as f:
+        code = f.read()
+    tree = java_parser.parse(code)
+    statement_lines = []
+    stack = [tree.root_node]
+    while stack:
+        node = stack.pop()
+        if node.type.endswith('_statement') and node.start_point[0] == node.end_point[0]:
+            statement_lines.append(node.start_point[0] + 1)
+        stack.extend(node.children)
+    statement_lines.sort()
+    if not statement_lines:
+        return [(1, 1)] * bug_count
+    rng = random.Random(seed)
+    return [(line, line) for line in sorted(rng.sample(statement_lines, min(bug_count, len(statement_lines))))]
+
+
+########################
+# MEASUREMENT
+########################
+
+class CountingParse:
+    """
+    Stands in for java_parser.parse, which every retrieval module parses through, and counts the parses.
+    """
+
+    def __init__(self, parse: Callable, counter: Dict[str, int]):
+        self.parse = parse
+        self.counter = counter
+
+    def __call__(self, *args, **kwargs):
+        self.counter['parses'] += 1
+        return self.parse(*args, **kwargs)
+
+
+def install_parse_counter() -> Dict[str, int]:
+    counter = {'parses': 0}
+    if not isinstance(java_parser.parse, CountingParse):
+        java_parser.parse = CountingParse(java_parser.parse, counter)
+    java_parser.parse.counter = counter
+    return counter
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(function: Callable[[], object], iterations: int, counter: Dict[str, int]) -> dict:
+    """
+    Time function over iterations (after one warm-up call), then measure the parses and peak memory of one call.
+    """
+    function()
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    # tracemalloc slows Python code down, so memory is measured in a separate call
+    counter['parses'] = 0
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p90_ms': round(percentile(timings, 0.9), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'max_ms': round(timings[-1], 3),
+        'parses': counter['parses'],
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def get_benchmarks(java_file_path: str, bug_locations: List[Tuple[int, int]]) -> Dict[str, Callable[[], object]]:
+    """
+    The benchmarked operations for one case. Each call handles every bug location, as the agents do.
+    """
+    buggy_nodes = [ib.retrieve_buggy_node(java_file_path, bug_location) for bug_location in bug_locations]
+    buggy_nodes = [buggy_node for _, buggy_node in filter(None, buggy_nodes)]
+
+    return {
+        'retrieve_buggy_node': lambda: [ib.retrieve_buggy_node(java_file_path, bug_location) for bug_location in bug_locations],
+        'retrieve_code_by_line_number': lambda: [utils.retrieve_code_by_line_number(java_file_path, bug_location) for bug_location in bug_locations],
+        'get_comments_before_node': lambda: [utils.get_comments_before_node(java_file_path, buggy_node) for buggy_node in buggy_nodes],
+        'retrieve_existing_apis': lambda: adb.retrieve_existing_apis(java_file_path),
+        # The basic context only; the context retrieval variant also queries Joern, which is not benchmarked here
+        'format_context': lambda: fcr.format_context('basic', [(java_file_path, bug_locations)]),
+    }
+
+
+def run_benchmarks(cases: List[Tuple[str, str, int]], iterations: int) -> Dict[str, dict]:
+    """
+    Run every benchmark for each (case name, Java file, bug count) case.
+
+    Returns: {'<case name>/bugs=<count>/<benchmark>': measurement}
+    """
+    counter = install_parse_counter()
+    results = {}
+    for case_name, java_file_path, bug_count in cases:
+        bug_locations = pick_bug_locations(java_file_path, bug_count)
+        for benchmark_name, function in get_benchmarks(java_file_path, bug_locations).items():
+            key = f'{case_name}/bugs={bug_count}/{benchmark_name}'
+            results[key] = measure(function, iterations, counter)
+            print(f"{key:<60} p50 {results[key]['p50_ms']:>10.2f} ms  p99 {results[key]['p99_ms']:>10.2f} ms  "
+                  f"parses {results[key]['parses']:>4}  peak {results[key]['peak_kb']:>10.1f} KB")
+    return results
+
+
+########################
+# BASELINES
+########################
+
+def find_regressions(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Compare results with a baseline and describe every case that got slower, parses more, or uses more memory.
+    Cases missing from either side are skipped.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        expected = baseline[key]
+        if result['p50_ms'] > expected['p50_ms'] * (1 + threshold):
+            regressions.append(f"{key}: p50 {expected['p50_ms']:.2f} ms -> {result['p50_ms']:.2f} ms")
+        if result['parses'] > expected['parses']:
+            regressions.append(f"{key}: parses {expected['parses']} -> {result['parses']}")
+        if result['peak_kb'] > expected['peak_kb'] * (1 + threshold):
+            regressions.append(f"{key}: peak memory {expected['peak_kb']:.1f} KB -> {result['peak_kb']:.1f} KB")
+    return regressions
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Benchmark the context retrieval hot paths.')
+    argument_parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='Lines of the generated Java files')
+    argument_parser.add_argument('--bug-counts', type=int, nargs='+', default=DEFAULT_BUG_COUNTS, help='Bug locations per case')
+    argument_parser.add_argument('--java-file', action='append', default=[], help='Real Java file to benchmark (repeatable)')
+    argument_parser.add_argument('--iterations', type=int, default=5, help='Timed calls per benchmark')
+    argument_parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH, help='Baseline JSON to compare with or save to')
+    argument_parser.add_argument('--save-baseline', action='store_true', help='Save the results as the new baseline')
+    argument_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Allowed relative slowdown')
+    args = argument_parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='context_retrieval_benchmark_') as temp_dir:
+        cases = []
+        for size in args.sizes:
+            java_file_path = os.path.join(temp_dir, f'Generated{size}.java')
+            with open(java_file_path, 'w') as f:
+                f.write(generate_java_file(size))
+            cases += [(f'generated-{size}', java_file_path, bug_count) for bug_count in args.bug_counts]
+        for java_file_path in args.java_file:
+            cases += [(os.path.basename(java_file_path), java_file_path, bug_count) for bug_count in args.bug_counts]
+
+        results = run_benchmarks(cases, args.iterations)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"    {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+"""
+End-to-end repair throughput benchmark with local stand-ins for the LLM API and Defects4J.
+
+Generated bugs are repaired by BasicAgent.run against the mock chat completions server (mock_llm_server.py), the
+responses are spliced into patches, and every candidate is validated with run_defects4j_test against the fake
+`defects4j` executable (fake_defects4j/defects4j). Agent calls and validations run in separate worker pools, as in a
+sweep, and every candidate records when it was queued and served at each stage.
+
+Reports bugs/hour, candidate validations/hour, per-stage service and queueing times, and the bottleneck: the stage
+whose workers were busy for the largest fraction of the run.
+
+Usage:
+    python benchmarks/end_to_end_benchmark.py [--bugs 20] [--candidates-per-bug 5] [--agent-workers 8]
+        [--validation-workers 4] [--llm-latency 1.0] [--test-s 10] [--output results.json]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+FAKE_DEFECTS4J_DIR = os.path.join(BENCHMARK_DIR, 'fake_defects4j')
+
+from mock_llm_server import MockLLMServer
+from context_retrieval_benchmark import generate_java_file, pick_bug_locations
+
+PROJECT_NAME = 'Lang'
+SOURCE_DIR = 'src/main/java'
+TEST_DIR = 'src/test/java'
+PACKAGE_NAME = 'org.benchmark.generated'
+TRIGGER_TEST = 'org.benchmark.generated.GeneratedTest::testBug'
+STAGES = ('agent', 'splice', 'validation')
+
+
+########################
+# BUGS AND CANNED RESPONSES
+########################
+
+def create_bugs(bugs_dir: str, bug_count: int, file_lines: int) -> List[dict]:
+    """
+    Create the fake Defects4J bugs: a generated class per bug and its bug.json.
+    """
+    bugs = []
+    for index in range(bug_count):
+        bug_id = str(index + 1)
+        bug_dir = os.path.join(bugs_dir, f'{PROJECT_NAME}-{bug_id}')
+        package_dir = os.path.join(bug_dir, 'checkout', SOURCE_DIR, *PACKAGE_NAME.split('.'))
+        os.makedirs(package_dir, exist_ok=True)
+        os.makedirs(os.path.join(bug_dir, 'checkout', TEST_DIR), exist_ok=True)
+        java_file_path = os.path.join(package_dir, 'Generated.java')
+        with open(java_file_path, 'w') as f:
+            f.write(generate_java_file(file_lines, seed=index))
+        with open(os.path.join(bug_dir, 'bug.json'), 'w') as f:
+            json.dump({
+                'modified_classes': [f'{PACKAGE_NAME}.Generated'],
+                'trigger_tests': [TRIGGER_TEST],
+                'source_dir': SOURCE_DIR,
+                'test_dir': TEST_DIR
+            }, f)
+        bugs.append({
+            'bug_id': bug_id,
+            'java_file_path': java_file_path,
+            'modified_class': f'{PACKAGE_NAME}.Generated',
+            'bug_locations': pick_bug_locations(java_file_path, 1, seed=index)
+        })
+    return bugs
+
+
+def create_responses(bug: dict, candidate_count: int, pass_rate: float, compile_error_rate: float, rng: random.Random) -> List[str]:
+    """
+    Canned model responses for a bug: NODE blocks that rewrite the buggy node with an outcome marker the fake
+    defects4j reads.
+    """
+    import isolate_bug as ib
+    import retrieval_utils as utils
+
+    with open(bug['java_file_path'], 'rb') as f:
+        code = f.read()
+    _, buggy_node = ib.retrieve_buggy_node(bug['java_file_path'], bug['bug_locations'][0])
+    buggy_node_text = utils.get_node_text(buggy_node, code)
+
+    responses = []
+    for candidate_index in range(candidate_count):
+        draw = rng.random()
+        outcome = 'pass' if draw < pass_rate else 'compile-error' if draw < pass_rate + compile_error_rate else 'fail'
+        # The brace of the declaration opens the body; put the marker right inside it
+        body_start = buggy_node_text.index('{') + 1
+        patched_node = (buggy_node_text[:body_start] + f' /* outcome: {outcome} */ /* candidate {candidate_index} */'
+                        + buggy_node_text[body_start:])
+        responses.append(f'Here is the fix.\n<<<<<<< NODE 1\n{patched_node}\n>>>>>>> END\n')
+    return responses
+
+
+########################
+# PIPELINE
+########################
+
+class CandidateTiming:
+    def __init__(self, bug_id: str, candidate_index: int):
+        self.bug_id = bug_id
+        self.candidate_index = candidate_index
+        self.events: Dict[str, float] = {}
+        self.outcome = None
+
+    def mark(self, event: str):
+        self.events[event] = time.perf_counter()
+
+    def service_time(self, stage: str) -> float:
+        return self.events.get(f'{stage} end', 0.0) - self.events.get(f'{stage} start', 0.0)
+
+    def queue_time(self, stage: str) -> float:
+        return self.events.get(f'{stage} start', 0.0) - self.events.get(f'{stage} queued', 0.0)
+
+
+def run_pipeline(bugs: List[dict], candidates_per_bug: int, agent_workers: int, validation_workers: int,
+                 work_dir: str, test_mode: str) -> tuple:
+    # Imported here, after main() pointed the environment at the stand-ins
+    import info_dict
+    import test_suites as ts
+    from basic_agent import BasicAgent
+    from patch_splicer import EDIT_BLOCK_INSTRUCTIONS, splice_edit_blocks, write_patched_files
+
+    timings: List[CandidateTiming] = []
+    timings_lock = threading.Lock()
+    agent_executor = ThreadPoolExecutor(max_workers=agent_workers, thread_name_prefix='agent')
+    validation_executor = ThreadPoolExecutor(max_workers=validation_workers, thread_name_prefix='validation')
+    validation_futures = []
+    validation_futures_lock = threading.Lock()
+
+    def validate(bug: dict, timing: CandidateTiming, java_patch_files: dict):
+        timing.mark('validation start')
+        working_dir = os.path.join(work_dir, 'checkouts', f'{bug["bug_id"]}-{timing.candidate_index}')
+        result = ts.run_defects4j_test(PROJECT_NAME, bug['bug_id'], working_dir, java_patch_files, test_mode=test_mode)
+        timing.mark('validation end')
+        if isinstance(result, dict):
+            timing.outcome = 'error'
+        else:
+            timing.outcome = 'plausible' if result[0]['success'] else 'rejected'
+
+    def repair(bug: dict, timing: CandidateTiming):
+        timing.mark('agent start')
+        information = info_dict.InfoDict()
+        information.create_info_dict('basic', EDIT_BLOCK_INSTRUCTIONS, [(bug['java_file_path'], bug['bug_locations'])])
+        response, _ = BasicAgent(information).run('Fix the buggy code.')
+        timing.mark('agent end')
+
+        timing.mark('splice start')
+        try:
+            patched_code = splice_edit_blocks([(bug['java_file_path'], bug['bug_locations'])], response or '')
+        except ValueError:
+            timing.mark('splice end')
+            timing.outcome = 'unparsable'
+            return
+        output_dir = os.path.join(work_dir, 'patches', f'{bug["bug_id"]}-{timing.candidate_index}')
+        patch_files = write_patched_files(patched_code, output_dir)
+        java_patch_files = {bug['modified_class']: patch_files[bug['java_file_path']]}
+        timing.mark('splice end')
+
+        timing.mark('validation queued')
+        future = validation_executor.submit(validate, bug, timing, java_patch_files)
+        with validation_futures_lock:
+            validation_futures.append(future)
+
+    start_time = time.perf_counter()
+    agent_futures = []
+    for bug in bugs:
+        for candidate_index in range(candidates_per_bug):
+            timing = CandidateTiming(bug['bug_id'], candidate_index)
+            timing.mark('agent queued')
+            with timings_lock:
+                timings.append(timing)
+            agent_futures.append(agent_executor.submit(repair, bug, timing))
+
+    for future in as_completed(agent_futures):
+        future.result()
+    agent_executor.shutdown()
+    for future in as_completed(validation_futures):
+        future.result()
+    validation_executor.shutdown()
+    return timings, time.perf_counter() - start_time
+
+
+########################
+# REPORT
+########################
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(fraction * (len(values) - 1))))]
+
+
+def summarize(timings: List[CandidateTiming], wall_time: float, workers: Dict[str, int], bug_count: int) -> dict:
+    validated = [timing for timing in timings if 'validation end' in timing.events]
+    stages = {}
+    for stage in STAGES:
+        served = [timing for timing in timings if f'{stage} end' in timing.events]
+        service_times = [timing.service_time(stage) for timing in served]
+        queue_times = [timing.queue_time(stage) for timing in served if f'{stage} queued' in timing.events]
+        stages[stage] = {
+            'count': len(served),
+            'service_p50_s': round(percentile(service_times, 0.5), 3),
+            'service_p90_s': round(percentile(service_times, 0.9), 3),
+            'queue_p50_s': round(percentile(queue_times, 0.5), 3),
+            'queue_p90_s': round(percentile(queue_times, 0.9), 3),
+            # Splicing runs on the agent workers
+            'utilization': round(sum(service_times) / (workers['validation' if stage == 'validation' else 'agent'] * wall_time), 3)
+        }
+    outcomes = {}
+    for timing in timings:
+        outcomes[timing.outcome] = outcomes.get(timing.outcome, 0) + 1
+    bottleneck = max(('agent', 'validation'), key=lambda stage: stages[stage]['utilization']
+                     + (stages['splice']['utilization'] if stage == 'agent' else 0))
+    return {
+        'wall_time_s': round(wall_time, 2),
+        'bugs': bug_count,
+        'candidates': len(timings),
+        'bugs_per_hour': round(bug_count / wall_time * 3600, 1),
+        'validations_per_hour': round(len(validated) / wall_time * 3600, 1),
+        'outcomes': outcomes,
+        'workers': workers,
+        'stages': stages,
+        'bottleneck': bottleneck
+    }
+
+
+def print_summary(summary: dict):
+    print(f"Wall time: {summary['wall_time_s']} s for {summary['bugs']} bugs / {summary['candidates']} candidates")
+    print(f"Throughput: {summary['bugs_per_hour']} bugs/hour, {summary['validations_per_hour']} validations/hour")
+    print(f"Outcomes: {summary['outcomes']}")
+    print(f"{'stage':<12}{'count':>7}{'service p50':>13}{'service p90':>13}{'queue p50':>11}{'queue p90':>11}{'busy':>7}")
+    for stage, stats in summary['stages'].items():
+        print(f"{stage:<12}{stats['count']:>7}{stats['service_p50_s']:>12.2f}s{stats['service_p90_s']:>12.2f}s"
+              f"{stats['queue_p50_s']:>10.2f}s{stats['queue_p90_s']:>10.2f}s{stats['utilization'] * 100:>6.0f}%")
+    print(f"Bottleneck: {summary['bottleneck']} (add {summary['bottleneck']} workers to raise throughput)")
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Benchmark repair throughput with a mock LLM and a fake defects4j.')
+    argument_parser.add_argument('--bugs', type=int, default=20)
+    argument_parser.add_argument('--candidates-per-bug', type=int, default=5)
+    argument_parser.add_argument('--file-lines', type=int, default=2000, help='Lines of each generated buggy file')
+    argument_parser.add_argument('--agent-workers', type=int, default=8)
+    argument_parser.add_argument('--validation-workers', type=int, default=4)
+    argument_parser.add_argument('--test-mode', choices=('full', 'fail-fast'), default='full')
+    argument_parser.add_argument('--pass-rate', type=float, default=0.2, help='Fraction of candidates that pass')
+    argument_parser.add_argument('--compile-error-rate', type=float, default=0.2, help='Fraction of candidates that do not compile')
+    argument_parser.add_argument('--llm-latency', type=float, default=1.0, help='Seconds before the first token')
+    argument_parser.add_argument('--prompt-tokens-per-s', type=float, default=5000.0)
+    argument_parser.add_argument('--output-tokens-per-s', type=float, default=50.0)
+    argument_parser.add_argument('--checkout-s', type=float, default=1.0)
+    argument_parser.add_argument('--compile-s', type=float, default=2.0)
+    argument_parser.add_argument('--test-s', type=float, default=10.0, help='Seconds of a full test suite run')
+    argument_parser.add_argument('--single-test-s', type=float, default=1.0)
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument('--output', help='Write the summary as JSON to this file')
+    args = argument_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='end_to_end_benchmark_')
+    bugs_dir = os.path.join(work_dir, 'bugs')
+
+    # Point everything at the stand-ins before the pipeline modules read their configuration
+    os.environ['PATH'] = FAKE_DEFECTS4J_DIR + os.pathsep + os.environ.get('PATH', '')
+    os.environ.update({
+        'FAKE_D4J_BUGS_DIR': bugs_dir,
+        'FAKE_D4J_CHECKOUT_S': str(args.checkout_s),
+        'FAKE_D4J_COMPILE_S': str(args.compile_s),
+        'FAKE_D4J_TEST_S': str(args.test_s),
+        'FAKE_D4J_SINGLE_TEST_S': str(args.single_test_s),
+        'FAKE_D4J_RELEVANT_TEST_S': str(args.test_s / 3),
+        'DEFECTS4J_METADATA_PATH': os.path.join(work_dir, 'defects4j_metadata.sqlite'),
+        'PATCH_MEMO_PATH': os.path.join(work_dir, 'patch_memo.sqlite'),
+        'CHECKOUT_CACHE_DIR': os.path.join(work_dir, 'checkout_cache'),
+        'OPENAI_API_KEY': 'mock',
+        'GPT_MODEL': 'mock',
+    })
+    for directory in ('context_retrieval', 'patching_agents', 'test_suites'):
+        sys.path.append(os.path.join(ROOT_DIR, directory))
+
+    bugs = create_bugs(bugs_dir, args.bugs, args.file_lines)
+    rng = random.Random(args.seed)
+    responses = {
+        bug['java_file_path']: create_responses(bug, args.candidates_per_bug, args.pass_rate, args.compile_error_rate, rng)
+        for bug in bugs
+    }
+    server = MockLLMServer(0, responses, args.llm_latency, args.prompt_tokens_per_s, args.output_tokens_per_s)
+    server.start()
+    os.environ['OPENAI_BASE_URL'] = server.base_url
+    try:
+        timings, wall_time = run_pipeline(bugs, args.candidates_per_bug, args.agent_workers, args.validation_workers,
+                                          work_dir, args.test_mode)
+    finally:
+        server.stop()
+
+    summary = summarize(timings, wall_time, {'agent': args.agent_workers, 'validation': args.validation_workers}, args.bugs)
+    print_summary(summary)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    print(f"Work files are in {work_dir}")
+
+
+if __name__ == '__main__':
+    main()
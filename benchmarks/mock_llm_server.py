@@ -0,0 +1,121 @@
+"""
+Local OpenAI-compatible chat completions server with canned responses, for benchmarking without API calls.
+
+Responses are chosen by key: the first key that appears in the prompt selects its list of responses, which is
+cycled through. The simulated service time is latency + prompt tokens / prompt rate + completion tokens / output
+rate, with tokens estimated as 4 characters each.
+
+Usage:
+    python benchmarks/mock_llm_server.py --port 8000 --responses responses.json [--latency 1.0]
+Then point the client at it with OPENAI_BASE_URL=http://127.0.0.1:8000/v1.
+"""
+import json
+import time
+import argparse
+import itertools
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+CHARS_PER_TOKEN = 4
+DEFAULT_RESPONSE = 'No change.'
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_error(404)
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        prompt = '\n'.join(str(message.get('content', '')) for message in request.get('messages', []))
+
+        server: MockLLMServer = self.server
+        content = server.choose_response(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(content)
+        time.sleep(server.latency + prompt_tokens / server.prompt_tokens_per_s + completion_tokens / server.output_tokens_per_s)
+
+        body = json.dumps({
+            'id': f'chatcmpl-mock-{next(server.request_ids)}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        }).encode('utf8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server answering /v1/chat/completions; requests are served concurrently, like a hosted API.
+    """
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, responses: Dict[str, List[str]] = None, latency: float = 1.0,
+                 prompt_tokens_per_s: float = 5000.0, output_tokens_per_s: float = 50.0):
+        super().__init__(('127.0.0.1', port), MockLLMHandler)
+        self.latency = latency
+        self.prompt_tokens_per_s = prompt_tokens_per_s
+        self.output_tokens_per_s = output_tokens_per_s
+        self.responses = {key: itertools.cycle(values) for key, values in (responses or {}).items() if values}
+        self.responses_lock = threading.Lock()
+        self.request_ids = itertools.count(1)
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}/v1'
+
+    def choose_response(self, prompt: str) -> str:
+        with self.responses_lock:
+            for key, responses in self.responses.items():
+                if key in prompt:
+                    return next(responses)
+            if '' in self.responses:
+                return next(self.responses[''])
+        return DEFAULT_RESPONSE
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Serve canned chat completions.')
+    argument_parser.add_argument('--port', type=int, default=8000)
+    argument_parser.add_argument('--responses', help='JSON file of {prompt key: [responses]}; the key "" matches any prompt')
+    argument_parser.add_argument('--latency', type=float, default=1.0, help='Seconds before the first token')
+    argument_parser.add_argument('--prompt-tokens-per-s', type=float, default=5000.0)
+    argument_parser.add_argument('--output-tokens-per-s', type=float, default=50.0)
+    args = argument_parser.parse_args()
+
+    responses = {}
+    if args.responses:
+        with open(args.responses, 'r') as f:
+            responses = json.load(f)
+    server = MockLLMServer(args.port, responses, args.latency, args.prompt_tokens_per_s, args.output_tokens_per_s)
+    print(f"Serving mock chat completions at {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
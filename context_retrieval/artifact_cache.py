@@ -0,0 +1,177 @@
+"""
+Content-addressed cache of per-file analysis results, shared across Defects4J versions, checkouts and runs.
+
+Results are keyed by (sha256 of the file content, analysis name, analysis version). Versions of a project share
+almost all of their files, so analysing a new version only computes the files that differ. Bump the version of an
+analysis whenever its output changes; old entries are then never read again and age out.
+
+The cache is size-capped: once it holds more than ARTIFACT_CACHE_MAX_MB, the least recently used entries are
+evicted. Values must be JSON-serializable.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Optional
+
+DEFAULT_CACHE_PATH = os.getenv(
+    'ARTIFACT_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'artifact_cache.sqlite')
+)
+DEFAULT_MAX_BYTES = int(float(os.getenv('ARTIFACT_CACHE_MAX_MB', '512')) * 1024 * 1024)
+
+# Evict down to this fraction of the cap, so eviction does not run again on the next put
+EVICTION_TARGET = 0.9
+# Recording every read would turn reads into writes; the last use is only refreshed when it is older than this
+LAST_USED_RESOLUTION_S = 600
+
+
+def hash_content(code: bytes) -> str:
+    return hashlib.sha256(code).hexdigest()
+
+
+class ArtifactCache:
+    """
+    SQLite-backed artifact store, safe to share between threads and processes.
+    """
+
+    def __init__(self, cache_path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        self.stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Bytes written since the size was last checked; the size is only summed once this reaches a share of the cap
+        self.unchecked_bytes = max_bytes
+        connection = self.get_connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS artifacts (
+                content_hash TEXT NOT NULL,
+                analysis TEXT NOT NULL,
+                analysis_version INTEGER NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (content_hash, analysis, analysis_version)
+            )
+        """)
+        connection.execute('CREATE INDEX IF NOT EXISTS artifacts_last_used ON artifacts (last_used)')
+        connection.commit()
+
+    def get_connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads
+        if not hasattr(self.local, 'connection'):
+            connection = sqlite3.connect(self.cache_path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self.local.connection = connection
+        return self.local.connection
+
+    def get(self, content_hash: str, analysis: str, analysis_version: int):
+        """
+        Return the stored value, or None if this content has not been analysed by this version of the analysis.
+        """
+        connection = self.get_connection()
+        row = connection.execute(
+            'SELECT value, last_used FROM artifacts WHERE content_hash = ? AND analysis = ? AND analysis_version = ?',
+            (content_hash, analysis, analysis_version)
+        ).fetchone()
+        with self.stats_lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            return None
+
+        now = time.time()
+        if now - row[1] > LAST_USED_RESOLUTION_S:
+            connection.execute(
+                'UPDATE artifacts SET last_used = ? WHERE content_hash = ? AND analysis = ? AND analysis_version = ?',
+                (now, content_hash, analysis, analysis_version)
+            )
+            connection.commit()
+        return json.loads(row[0])
+
+    def put(self, content_hash: str, analysis: str, analysis_version: int, value):
+        value_bytes = json.dumps(value).encode('utf8')
+        now = time.time()
+        connection = self.get_connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (content_hash, analysis, analysis_version, value_bytes, len(value_bytes), now, now)
+        )
+        connection.commit()
+
+        with self.stats_lock:
+            self.unchecked_bytes += len(value_bytes)
+            check_size = self.unchecked_bytes >= self.max_bytes * (1 - EVICTION_TARGET) / 2
+            if check_size:
+                self.unchecked_bytes = 0
+        if check_size:
+            self.evict()
+
+    def get_or_compute(self, code: bytes, analysis: str, analysis_version: int, compute: Callable[[bytes], object]):
+        """
+        Return the value of the analysis for this code, computing and storing it on a miss.
+        """
+        content_hash = hash_content(code)
+        value = self.get(content_hash, analysis, analysis_version)
+        if value is None:
+            value = compute(code)
+            self.put(content_hash, analysis, analysis_version, value)
+        return value
+
+    def evict(self) -> int:
+        """
+        If the cache is over its size cap, delete the least recently used entries down to EVICTION_TARGET of the cap.
+
+        Returns: number of entries evicted
+        """
+        connection = self.get_connection()
+        total_bytes = connection.execute('SELECT COALESCE(SUM(size), 0) FROM artifacts').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return 0
+
+        excess = total_bytes - int(self.max_bytes * EVICTION_TARGET)
+        rowids = []
+        for rowid, size in connection.execute('SELECT rowid, size FROM artifacts ORDER BY last_used'):
+            if excess <= 0:
+                break
+            rowids.append(rowid)
+            excess -= size
+        connection.executemany('DELETE FROM artifacts WHERE rowid = ?', [(rowid,) for rowid in rowids])
+        connection.commit()
+        return len(rowids)
+
+    def get_summary(self) -> dict:
+        """
+        Returns: dict of {'entries', 'bytes', 'hits', 'misses'}; hits and misses count the reads of this process
+        """
+        entries, total_bytes = self.get_connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM artifacts'
+        ).fetchone()
+        return {'entries': entries, 'bytes': total_bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        if hasattr(self.local, 'connection'):
+            self.local.connection.close()
+            del self.local.connection
+
+
+_artifact_cache: Optional[ArtifactCache] = None
+_artifact_cache_lock = threading.Lock()
+
+
+def get_artifact_cache() -> ArtifactCache:
+    """
+    Return the process-wide artifact cache.
+    """
+    global _artifact_cache
+    with _artifact_cache_lock:
+        if _artifact_cache is None:
+            _artifact_cache = ArtifactCache()
+    return _artifact_cache
@@ -0,0 +1,259 @@
+"""
+Spectrum-based fault localization (SBFL): rank source lines by how much more often failing tests cover them than
+passing tests, and turn the top lines into bug locations for retrieve_buggy_lines_and_node.
+
+Per-test line coverage comes from `defects4j coverage` (Cobertura XML) or from a directory of Cobertura or JaCoCo
+XML reports, one per test. The coverage is kept as a sparse test x line matrix, so every formula is a few vector
+operations over all lines at once.
+
+Usage:
+    python fault_localization.py --coverage-dir reports/ --failing-tests failing.txt [--source-root src/java]
+"""
+import os
+import argparse
+import subprocess
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import scipy.sparse as sp
+
+FORMULAS = ('ochiai', 'dstar', 'tarantula')
+DSTAR_EXPONENT = 2
+
+
+########################
+# COVERAGE REPORTS
+########################
+
+def parse_coverage_xml(report_path: str, source_root: str = None) -> List[Tuple[str, int]]:
+    """
+    Return the covered (source file, line number) pairs of a Cobertura or JaCoCo XML report.
+    Source files are joined to source_root if given (or to the first <source> of a Cobertura report).
+    """
+    covered = []
+    sources = []
+    package_name = ''
+    source_file = None
+    for event, element in ET.iterparse(report_path, events=('start', 'end')):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'package':
+                # JaCoCo names packages with slashes, Cobertura with dots; only JaCoCo needs the name
+                package_name = element.get('name', '')
+            elif tag == 'class' and element.get('filename'):
+                # Cobertura: <class filename="org/foo/Bar.java"><lines><line number hits/>
+                source_file = element.get('filename')
+            elif tag == 'sourcefile':
+                # JaCoCo: <package name="org/foo"><sourcefile name="Bar.java"><line nr ci/>
+                source_file = f"{package_name}/{element.get('name')}" if package_name else element.get('name')
+            continue
+
+        if tag == 'source' and element.text:
+            sources.append(element.text.strip())
+        elif tag == 'line' and source_file is not None:
+            if element.get('hits') is not None:
+                if int(element.get('hits')) > 0:
+                    covered.append((source_file, int(element.get('number'))))
+            elif element.get('ci') is not None and int(element.get('ci')) > 0:
+                covered.append((source_file, int(element.get('nr'))))
+        elif tag in ('class', 'sourcefile'):
+            source_file = None
+        # Cobertura lists lines both per method and per class; only the innermost elements are needed
+        if tag in ('line', 'method', 'class', 'sourcefile', 'package'):
+            element.clear()
+
+    root = source_root or (sources[0] if sources else None)
+    if root:
+        covered = [(os.path.join(root, source_file), line_number) for source_file, line_number in covered]
+    return covered
+
+
+########################
+# SPECTRUM
+########################
+
+class CoverageSpectrum:
+    """
+    Sparse test x line coverage matrix plus the outcome of every test.
+    """
+
+    def __init__(self):
+        self.line_index: Dict[Tuple[str, int], int] = {}
+        self.lines: List[Tuple[str, int]] = []
+        self.test_ids: List[str] = []
+        self.test_failed: List[bool] = []
+        self.rows: List[np.ndarray] = []
+        self.matrix: Optional[sp.csr_matrix] = None
+
+    def add_test(self, test_id: str, failed: bool, covered_lines: Iterable[Tuple[str, int]]):
+        columns = []
+        for line in covered_lines:
+            column = self.line_index.get(line)
+            if column is None:
+                column = len(self.lines)
+                self.line_index[line] = column
+                self.lines.append(line)
+            columns.append(column)
+        self.test_ids.append(test_id)
+        self.test_failed.append(failed)
+        self.rows.append(np.unique(np.asarray(columns, dtype=np.int64)))
+        self.matrix = None
+
+    def get_matrix(self) -> sp.csr_matrix:
+        if self.matrix is None:
+            indptr = np.zeros(len(self.rows) + 1, dtype=np.int64)
+            np.cumsum([len(row) for row in self.rows], out=indptr[1:])
+            indices = np.concatenate(self.rows) if self.rows else np.zeros(0, dtype=np.int64)
+            data = np.ones(len(indices), dtype=np.float64)
+            self.matrix = sp.csr_matrix((data, indices, indptr), shape=(len(self.rows), len(self.lines)))
+        return self.matrix
+
+    def compute_scores(self, formula: str = 'ochiai') -> np.ndarray:
+        """
+        Suspiciousness of every line (indexed like self.lines) with one of FORMULAS.
+        """
+        if formula not in FORMULAS:
+            raise ValueError(f"Unknown SBFL formula {formula}; expected one of {FORMULAS}")
+        matrix = self.get_matrix()
+        failed = np.asarray(self.test_failed, dtype=np.float64)
+
+        # Executed by failing (ef) and passing (ep) tests, and not executed by failing tests (nf)
+        ef = matrix.T @ failed
+        ep = matrix.T @ (1.0 - failed)
+        total_failed = failed.sum()
+        total_passed = len(failed) - total_failed
+        nf = total_failed - ef
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if formula == 'ochiai':
+                scores = ef / np.sqrt(total_failed * (ef + ep))
+            elif formula == 'dstar':
+                scores = ef ** DSTAR_EXPONENT / (ep + nf)
+                # Lines covered by every failing test and no passing test are maximally suspicious
+                scores[(ep + nf) == 0] = np.inf
+                scores[ef == 0] = 0.0
+            else:
+                failed_ratio = ef / total_failed if total_failed else np.zeros_like(ef)
+                passed_ratio = ep / total_passed if total_passed else np.zeros_like(ep)
+                scores = failed_ratio / (failed_ratio + passed_ratio)
+        return np.nan_to_num(scores, nan=0.0, posinf=np.finfo(np.float64).max)
+
+    def rank_lines(self, formula: str = 'ochiai', top_n: int = 50) -> List[Tuple[str, int, float]]:
+        """
+        Return the top_n most suspicious (source file, line number, score), most suspicious first.
+        Lines no failing test covers are never returned.
+        """
+        if top_n <= 0:
+            return []
+        scores = self.compute_scores(formula)
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > top_n:
+            candidates = candidates[np.argpartition(-scores[candidates], top_n - 1)[:top_n]]
+        # Ties keep a stable order by file and line
+        candidates = sorted(candidates, key=lambda column: (-scores[column], self.lines[column]))
+        return [(self.lines[column][0], self.lines[column][1], float(scores[column])) for column in candidates]
+
+
+def group_line_ranges(ranked_lines: List[Tuple[str, int, float]], max_gap: int = 2, max_ranges: int = 5) -> List[Tuple[str, List[Tuple[int, int]]]]:
+    """
+    Merge ranked lines of the same file that are at most max_gap lines apart into (start line, end line) ranges
+    and keep the max_ranges ranges with the highest score.
+
+    Returns: [(source file, [(start line, end line), ...]), ...] in the shape InfoDict.create_info_dict and
+    retrieve_buggy_lines_and_node take, files ordered by their most suspicious range
+    """
+    lines_by_file: Dict[str, List[Tuple[int, float]]] = {}
+    for source_file, line_number, score in ranked_lines:
+        lines_by_file.setdefault(source_file, []).append((line_number, score))
+
+    ranges = []
+    for source_file, lines in lines_by_file.items():
+        lines.sort()
+        start, end, best = lines[0][0], lines[0][0], lines[0][1]
+        for line_number, score in lines[1:]:
+            if line_number - end <= max_gap + 1:
+                end, best = line_number, max(best, score)
+            else:
+                ranges.append((best, source_file, (start, end)))
+                start, end, best = line_number, line_number, score
+        ranges.append((best, source_file, (start, end)))
+
+    ranges.sort(key=lambda item: -item[0])
+    bug_locations: Dict[str, List[Tuple[int, int]]] = {}
+    for _, source_file, line_range in ranges[:max_ranges]:
+        bug_locations.setdefault(source_file, []).append(line_range)
+    return list(bug_locations.items())
+
+
+def localize_bug(spectrum: CoverageSpectrum, formula: str = 'ochiai', top_n: int = 50, max_gap: int = 2,
+                 max_ranges: int = 5) -> List[Tuple[str, List[Tuple[int, int]]]]:
+    """
+    Rank lines with SBFL and return the most suspicious line ranges as bug locations.
+    """
+    return group_line_ranges(spectrum.rank_lines(formula, top_n), max_gap, max_ranges)
+
+
+########################
+# LOADING SPECTRA
+########################
+
+def load_spectrum_from_directory(coverage_dir: str, failing_tests: Iterable[str], source_root: str = None) -> CoverageSpectrum:
+    """
+    Build a spectrum from a directory with one coverage report per test, named <test id>.xml.
+    """
+    failing_tests = set(failing_tests)
+    spectrum = CoverageSpectrum()
+    for file_name in sorted(os.listdir(coverage_dir)):
+        if not file_name.endswith('.xml'):
+            continue
+        test_id = file_name[:-len('.xml')]
+        covered_lines = parse_coverage_xml(os.path.join(coverage_dir, file_name), source_root)
+        spectrum.add_test(test_id, test_id in failing_tests, covered_lines)
+    return spectrum
+
+
+def collect_defects4j_spectrum(working_dir: str, test_ids: Iterable[str], failing_tests: Iterable[str],
+                               source_root: str = None) -> CoverageSpectrum:
+    """
+    Build a spectrum by running `defects4j coverage` for each test in a compiled checkout.
+    The checkout is instrumented once per test, so collect coverage for the relevant tests rather than the full suite.
+    """
+    failing_tests = set(failing_tests)
+    spectrum = CoverageSpectrum()
+    report_path = os.path.join(working_dir, 'coverage.xml')
+    for test_id in test_ids:
+        if os.path.exists(report_path):
+            os.remove(report_path)
+        result = subprocess.run(
+            ['defects4j', 'coverage', '-w', working_dir, '-t', test_id],
+            capture_output=True,
+            text=True,
+            cwd=working_dir
+        )
+        if result.returncode != 0 or not os.path.exists(report_path):
+            print(f"Failed to collect coverage of {test_id}: {result.stderr}")
+            continue
+        spectrum.add_test(test_id, test_id in failing_tests, parse_coverage_xml(report_path, source_root))
+    return spectrum
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Rank suspicious lines with spectrum-based fault localization.')
+    argument_parser.add_argument('--coverage-dir', required=True, help='Directory with one <test id>.xml coverage report per test')
+    argument_parser.add_argument('--failing-tests', required=True, help='File with one failing test id per line')
+    argument_parser.add_argument('--source-root', default=None, help='Directory the report file names are relative to')
+    argument_parser.add_argument('--formula', choices=FORMULAS, default='ochiai')
+    argument_parser.add_argument('--top-n', type=int, default=50, help='Number of lines to rank')
+    argument_parser.add_argument('--max-ranges', type=int, default=5, help='Number of line ranges to output')
+    args = argument_parser.parse_args()
+
+    with open(args.failing_tests, 'r') as f:
+        failing_tests = [line.strip() for line in f if line.strip()]
+    spectrum = load_spectrum_from_directory(args.coverage_dir, failing_tests, args.source_root)
+    for source_file, bug_locations in localize_bug(spectrum, args.formula, args.top_n, max_ranges=args.max_ranges):
+        print(f"{source_file}: {bug_locations}")
+
+
+if __name__ == '__main__':
+    main()
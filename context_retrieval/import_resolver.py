@@ -0,0 +1,201 @@
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+import retrieval_utils as utils
+import java_parser
+from artifact_cache import ArtifactCache, get_artifact_cache
+# Add the test_suites directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_suites'))
+import test_suites_helpers as tsh
+
+# Bump when extract_file_facts changes its output, so cached facts of the old version are not used
+FILE_FACTS_VERSION = 1
+
+
+def extract_file_facts(code: bytes) -> dict:
+    """
+    Parse a Java file and extract what name resolution needs from it.
+
+    Returns: dict of {'package', 'imports': [[imported name, is static, is wildcard]], 'static_members': [names of
+    the static fields and methods declared in the file]}
+    """
+    tree = java_parser.parse(code)
+    static_members = []
+    stack = [tree.root_node]
+    while stack:
+        node = stack.pop()
+        if node.type in ('class_body', 'interface_body', 'enum_body', 'enum_body_declarations', 'program'):
+            stack.extend(node.named_children)
+        elif node.type in ('class_declaration', 'interface_declaration', 'enum_declaration'):
+            body = node.child_by_field_name('body')
+            if body is not None:
+                stack.append(body)
+        elif node.type in ('method_declaration', 'field_declaration'):
+            modifiers = next((child for child in node.children if child.type == 'modifiers'), None)
+            if modifiers is None or 'static' not in utils.get_node_text(modifiers, code).split():
+                continue
+            if node.type == 'method_declaration':
+                static_members.append(utils.get_node_text(node.child_by_field_name('name'), code))
+            else:
+                for declarator in node.children_by_field_name('declarator'):
+                    static_members.append(utils.get_node_text(declarator.child_by_field_name('name'), code))
+    return {
+        'package': utils.get_package_name(tree.root_node, code),
+        'imports': [list(import_declaration) for import_declaration in utils.get_import_declarations(tree.root_node, code)],
+        'static_members': static_members
+    }
+
+
+class ImportResolver:
+    """
+    Resolves the simple names used in a Java file (e.g. 'XYPlot') to their fully-qualified names and defining
+    files within one checkout.
+
+    The package index is built once by walking the source roots (a Java file's package is its directory relative to
+    the source root). The resolved map of each file is cached until the file changes, so resolving a name in the
+    buggy code is a dictionary lookup.
+    """
+
+    def __init__(self, source_roots: List[str], artifact_cache: ArtifactCache = None):
+        """
+        Parameters:
+        - source_roots: Source roots of the checkout, in classpath order
+        - artifact_cache: If given, the parse facts of each file are stored by file content, so files that are the
+          same in another version or checkout are not parsed again
+        """
+        self.source_roots = source_roots
+        self.artifact_cache = artifact_cache
+        # package -> {simple type name: defining file}
+        self.package_index: Dict[str, Dict[str, str]] = {}
+        # java file -> ((mtime, size), {simple name: (fully-qualified name, defining file or None)})
+        self.resolved_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Tuple[str, Optional[str]]]]] = {}
+        # defining file -> names of its static members, for static wildcard imports
+        self.static_members_cache: Dict[str, List[str]] = {}
+        self.build_package_index()
+
+    @classmethod
+    def for_checkout(cls, project_name: str, working_dir: str) -> 'ImportResolver':
+        """
+        Create a resolver over the source and test roots of a Defects4J checkout.
+        """
+        source_root = os.path.dirname(tsh.get_full_source_path(project_name, working_dir, 'Placeholder'))
+        test_root = os.path.dirname(tsh.get_full_test_path(project_name, working_dir, 'Placeholder'))
+        return cls([root for root in (source_root, test_root) if os.path.isdir(root)])
+
+    def build_package_index(self):
+        for source_root in self.source_roots:
+            for directory, _, file_names in os.walk(source_root):
+                package = os.path.relpath(directory, source_root).replace(os.sep, '.')
+                if package == '.':
+                    package = ''
+                for file_name in file_names:
+                    if file_name.endswith('.java'):
+                        types = self.package_index.setdefault(package, {})
+                        # The first source root wins, as on a classpath
+                        types.setdefault(file_name[:-len('.java')], os.path.join(directory, file_name))
+
+    def find_type_file(self, fully_qualified_name: str) -> Optional[str]:
+        """
+        Return the file defining a fully-qualified type. Nested types (a.b.Outer.Inner) resolve to the file of
+        their top-level type.
+        """
+        parts = fully_qualified_name.split('.')
+        for split_index in range(len(parts) - 1, -1, -1):
+            package = '.'.join(parts[:split_index])
+            types = self.package_index.get(package)
+            if types and parts[split_index] in types:
+                return types[parts[split_index]]
+        return None
+
+    def get_file_facts(self, java_file_path: str) -> dict:
+        """
+        Return extract_file_facts of a file, from the artifact cache if its content was analysed before.
+        """
+        with open(java_file_path, 'rb') as f:
+            code = f.read()
+        if self.artifact_cache is None:
+            return extract_file_facts(code)
+        return self.artifact_cache.get_or_compute(code, 'java_file_facts', FILE_FACTS_VERSION, extract_file_facts)
+
+    def get_static_members(self, type_file: str) -> List[str]:
+        """
+        Return the names of the static fields and methods declared in a file.
+        """
+        if type_file not in self.static_members_cache:
+            self.static_members_cache[type_file] = self.get_file_facts(type_file)['static_members']
+        return self.static_members_cache[type_file]
+
+    def resolve_file(self, java_file_path: str) -> Dict[str, Tuple[str, Optional[str]]]:
+        """
+        Return {simple name: (fully-qualified name, defining file or None)} for the names visible in a Java file.
+
+        Names are resolved with Java's shadowing order: single-type (and single static) imports, then types of the
+        same package, then wildcard (and static wildcard) imports. The defining file is None for types outside
+        the checkout (e.g. java.util.List).
+        """
+        stat = os.stat(java_file_path)
+        file_key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.resolved_cache.get(java_file_path)
+        if cached and cached[0] == file_key:
+            return cached[1]
+
+        facts = self.get_file_facts(java_file_path)
+        package = facts['package']
+        imports = facts['imports']
+
+        resolved = {}
+        # Lowest precedence first, so higher precedence entries overwrite them
+        for imported_name, is_static, is_wildcard in imports:
+            if not is_wildcard:
+                continue
+            if is_static:
+                type_file = self.find_type_file(imported_name)
+                if type_file:
+                    for member in self.get_static_members(type_file):
+                        resolved[member] = (f'{imported_name}.{member}', type_file)
+            else:
+                for simple_name, type_file in self.package_index.get(imported_name, {}).items():
+                    resolved[simple_name] = (f'{imported_name}.{simple_name}', type_file)
+
+        for simple_name, type_file in self.package_index.get(package, {}).items():
+            resolved[simple_name] = (f'{package}.{simple_name}' if package else simple_name, type_file)
+
+        for imported_name, is_static, is_wildcard in imports:
+            if is_wildcard:
+                continue
+            simple_name = imported_name.rsplit('.', 1)[-1]
+            if is_static:
+                # The defining file is the file of the class the member is imported from
+                resolved[simple_name] = (imported_name, self.find_type_file(imported_name.rsplit('.', 1)[0]))
+            else:
+                resolved[simple_name] = (imported_name, self.find_type_file(imported_name))
+
+        self.resolved_cache[java_file_path] = (file_key, resolved)
+        return resolved
+
+    def resolve_name(self, java_file_path: str, simple_name: str) -> Optional[Tuple[str, Optional[str]]]:
+        """
+        Resolve a simple name used in a Java file to (fully-qualified name, defining file or None).
+        """
+        return self.resolve_file(java_file_path).get(simple_name)
+
+    def find_definition_file(self, java_file_path: str, simple_name: str) -> Optional[str]:
+        """
+        Return the file in the checkout that defines a name used in a Java file, or None.
+        """
+        resolved = self.resolve_name(java_file_path, simple_name)
+        return resolved[1] if resolved else None
+
+
+_import_resolvers: Dict[Tuple[str, ...], ImportResolver] = {}
+
+
+def get_import_resolver(source_roots: List[str]) -> ImportResolver:
+    """
+    Return the resolver for a set of source roots, creating (and indexing) it on first use.
+    Resolvers share the process-wide artifact cache, so checkouts of other versions reuse each other's parse facts.
+    """
+    key = tuple(os.path.abspath(source_root) for source_root in source_roots)
+    if key not in _import_resolvers:
+        _import_resolvers[key] = ImportResolver(list(key), get_artifact_cache())
+    return _import_resolvers[key]
@@ -1,35 +1,69 @@
-import tree_sitter_java
-from tree_sitter import Language, Parser, Query, Node
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tree_sitter import Node
 from typing import List, Tuple
 import retrieval_utils as utils
+import java_parser
+import tracing
 
-JAVA_LANGUAGE = Language(tree_sitter_java.language())
+# Threads used to retrieve the buggy nodes of several files at once
+RETRIEVAL_WORKERS = int(os.getenv('CONTEXT_RETRIEVAL_WORKERS', '4'))
 
-parser = Parser(JAVA_LANGUAGE)
 
-
-def retrieve_buggy_lines_and_node(java_file_path: str, bug_locations: List[Tuple[int, int]]) -> List[Tuple[Tuple[int, int], str, Tuple[Tuple[int, int], Node]]]:
+@tracing.traced('isolate_bug.retrieve_buggy_lines_and_node')
+def retrieve_buggy_lines_and_node(java_file_path: str, bug_locations: List[Tuple[int, int]], code: bytes = None) -> List[Tuple[Tuple[int, int], str, Tuple[Tuple[int, int], Node]]]:
+    """
+    Retrieve the buggy lines and the buggy node of every bug location of a file. The file is read (unless its code
+    is given) and parsed once for all of them.
+    """
+    if code is None:
+        with open(java_file_path, 'rb') as f:
+            code = f.read()
+    tree = java_parser.parse(code)
     result = []
     for bug_location in bug_locations:
-        buggy_lines = utils.retrieve_code_by_line_number(java_file_path, bug_location)
-        buggy_node = retrieve_buggy_node(java_file_path, bug_location)
+        buggy_lines = utils.retrieve_code_by_line_number(java_file_path, bug_location, code)
+        buggy_node = retrieve_buggy_node(java_file_path, bug_location, tree)
         result.append((bug_location, buggy_lines, buggy_node))
     return result
 
+
+def retrieve_buggy_lines_and_nodes_in_files(all_bug_locations: List[Tuple[str, List[Tuple[int, int]]]],
+                                            max_workers: int = RETRIEVAL_WORKERS) -> List[Tuple[str, bytes, list]]:
+    """
+    Run retrieve_buggy_lines_and_node for every (file path, bug locations) entry, one file per worker thread.
+    Each thread parses with its own parser (see java_parser), so files can be read and parsed concurrently.
+
+    Returns: [(file path, code of the file, retrieve_buggy_lines_and_node result)] in the order of all_bug_locations
+    """
+    def retrieve_file(buggy_file_info: Tuple[str, List[Tuple[int, int]]]) -> Tuple[str, bytes, list]:
+        java_file_path, bug_locations = buggy_file_info
+        with open(java_file_path, 'rb') as f:
+            code = f.read()
+        return java_file_path, code, retrieve_buggy_lines_and_node(java_file_path, bug_locations, code)
+
+    if len(all_bug_locations) < 2 or max_workers < 2:
+        return [retrieve_file(buggy_file_info) for buggy_file_info in all_bug_locations]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(all_bug_locations)), thread_name_prefix='retrieval') as executor:
+        return list(executor.map(retrieve_file, all_bug_locations))
+
 # TODO: further narrow down what's provided in retrieve_buggy_class. no need to provide all method bodies
 
 
-def retrieve_buggy_node(java_file_path: str, bug_location: Tuple[int, int]) -> Tuple[Tuple[int, int], Node]:
+@tracing.traced('isolate_bug.retrieve_buggy_node')
+def retrieve_buggy_node(java_file_path: str, bug_location: Tuple[int, int], tree=None) -> Tuple[Tuple[int, int], Node]:
     """
     Retrieve the node that contains the buggy lines of code.
+    If the parsed tree of the file is given, the file is not read again.
     """
     try:
-        with open(java_file_path, 'rb') as f:
-            code = f.read()
-        tree = parser.parse(code)
+        if tree is None:
+            with open(java_file_path, 'rb') as f:
+                code = f.read()
+            tree = java_parser.parse(code)
     
         # Most common case: try to retrieve buggy method or constructor
-        buggy_method_node = retrieve_buggy_method_or_constructor(java_file_path, bug_location)
+        buggy_method_node = retrieve_buggy_method_or_constructor(java_file_path, bug_location, tree)
         if buggy_method_node:
             # Convert back to 1-based line numbers for return
             node_start_line = buggy_method_node.start_point[0] + 1
@@ -37,7 +71,7 @@ def retrieve_buggy_node(java_file_path: str, bug_location: Tuple[int, int]) -> T
             return ((node_start_line, node_end_line), buggy_method_node)
         
         # If not in a method or constructor, the bug is most likely related to class declaration
-        buggy_class_node = retrieve_buggy_class(java_file_path, bug_location)
+        buggy_class_node = retrieve_buggy_class(java_file_path, bug_location, tree)
         if buggy_class_node:
             # Convert back to 1-based line numbers for return
             node_start_line = buggy_class_node.start_point[0] + 1
@@ -61,15 +95,16 @@ def retrieve_buggy_node(java_file_path: str, bug_location: Tuple[int, int]) -> T
 # HELPER METHODS
 ########################################################################################
 
-def retrieve_buggy_method_or_constructor(java_file_path: str, bug_location: Tuple[int, int]) -> Node:
+def retrieve_buggy_method_or_constructor(java_file_path: str, bug_location: Tuple[int, int], tree=None) -> Node:
     """
     Retrieve the method declaration node that contains the buggy lines of code.
     Assumes the start and end line both fall within the range of a method_declaration node.
     """
     try:
-        with open(java_file_path, 'rb') as f:
-            code = f.read()
-        tree = parser.parse(code)
+        if tree is None:
+            with open(java_file_path, 'rb') as f:
+                code = f.read()
+            tree = java_parser.parse(code)
         
         start_line, end_line = bug_location
         # Convert from 1-based to 0-based line numbers for tree-sitter
@@ -77,7 +112,7 @@ def retrieve_buggy_method_or_constructor(java_file_path: str, bug_location: Tupl
         end_line = end_line - 1
         
         # Find all method declarations
-        query = Query(JAVA_LANGUAGE, """
+        query = java_parser.get_query("""
         (method_declaration) @method_or_constructor
         (constructor_declaration) @method_or_constructor
         """)
@@ -109,15 +144,16 @@ def retrieve_buggy_method_or_constructor(java_file_path: str, bug_location: Tupl
 
 
 
-def retrieve_buggy_class(java_file_path: str, bug_location: Tuple[int, int]) -> Node:
+def retrieve_buggy_class(java_file_path: str, bug_location: Tuple[int, int], tree=None) -> Node:
     """
     Retrieve the class declaration node that contains the buggy lines of code.
     Assumes the start and end line both fall within the range of a class_declaration node.
     """
     try:
-        with open(java_file_path, 'rb') as f:
-            code = f.read()
-        tree = parser.parse(code)
+        if tree is None:
+            with open(java_file_path, 'rb') as f:
+                code = f.read()
+            tree = java_parser.parse(code)
         
         start_line, end_line = bug_location
         # Convert from 1-based to 0-based line numbers for tree-sitter
@@ -125,7 +161,7 @@ def retrieve_buggy_class(java_file_path: str, bug_location: Tuple[int, int]) ->
         end_line = end_line - 1
         
         # Find all class declarations
-        query = Query(JAVA_LANGUAGE, """
+        query = java_parser.get_query("""
         (class_declaration) @class
         """)
         
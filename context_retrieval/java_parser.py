@@ -0,0 +1,59 @@
+"""
+Shared tree-sitter Java language, parsers and compiled queries.
+
+Nothing is loaded at import time: the language is created on first use, and each thread gets its own parser and
+its own compiled queries, since tree-sitter parsers and query cursors must not be used from two threads at once.
+Use parse() and get_query() instead of building a Parser or Query per module or per call.
+"""
+import threading
+
+_language = None
+_language_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_language():
+    """
+    Return the tree-sitter Java language, loading it on first use.
+    """
+    global _language
+    if _language is None:
+        with _language_lock:
+            if _language is None:
+                import tree_sitter_java
+                from tree_sitter import Language
+                _language = Language(tree_sitter_java.language())
+    return _language
+
+
+def get_parser():
+    """
+    Return the Java parser of the calling thread.
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        from tree_sitter import Parser
+        parser = Parser(get_language())
+        _local.parser = parser
+    return parser
+
+
+def parse(code: bytes):
+    """
+    Parse Java source bytes with the parser of the calling thread.
+    """
+    return get_parser().parse(code)
+
+
+def get_query(source: str):
+    """
+    Return the compiled query for the source, compiling it once per thread.
+    """
+    queries = getattr(_local, 'queries', None)
+    if queries is None:
+        queries = _local.queries = {}
+    query = queries.get(source)
+    if query is None:
+        from tree_sitter import Query
+        query = queries[source] = Query(get_language(), source)
+    return query
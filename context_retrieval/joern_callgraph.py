@@ -4,6 +4,7 @@ import re
 import json
 from typing import Optional, Tuple, List
 import retrieval_utils as utils
+import tracing
 
 
 # TODO: improve CFG by providing list of nodes and edges and consider more than 1-hop distance. additionally,
@@ -353,16 +354,18 @@ class JoernSession:
             commands = f"{load_command}\n{query}\n"
             
             # Run in a new process
-            process = subprocess.Popen(
-                [self.joern_executable],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                cwd=self.joern_directory
-            )
-            
-            stdout, stderr = process.communicate(input=commands)
+            with tracing.span('joern.query', query_bytes=len(commands.encode('utf8'))) as query_span:
+                process = subprocess.Popen(
+                    [self.joern_executable],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    text=True,
+                    cwd=self.joern_directory
+                )
+                
+                stdout, stderr = process.communicate(input=commands)
+                query_span.set(stdout_bytes=len(stdout.encode('utf8')), return_code=process.returncode)
             
             if process.returncode != 0:
                 print(f"Error running query: {stderr}")
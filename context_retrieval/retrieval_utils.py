@@ -1,10 +1,7 @@
-import tree_sitter_java
-from tree_sitter import Language, Parser, Query, Node
+import io
+from tree_sitter import Node
 from typing import List, Tuple
-
-JAVA_LANGUAGE = Language(tree_sitter_java.language())
-
-parser = Parser(JAVA_LANGUAGE)
+import java_parser
 
 # Extract text from a tree-sitter node
 def get_node_text(node: Node, code: bytes) -> str:
@@ -15,13 +12,18 @@ def get_node_text(node: Node, code: bytes) -> str:
 
 
 # This retrieves the buggy code for all buggy files
-def retrieve_code_by_line_number(java_file_path: str, bug_location: Tuple[int, int]) -> List[str]:
+def retrieve_code_by_line_number(java_file_path: str, bug_location: Tuple[int, int], code: bytes = None) -> List[str]:
     """
-    Retrieve the exact code corresponding to the buggy lines of code
+    Retrieve the exact code corresponding to the buggy lines of code.
+    If the code of the file is given, the file is not read again.
     """
     try:
-        with open(java_file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        if code is None:
+            with open(java_file_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        else:
+            # Same newline handling as reading the file in text mode
+            lines = io.StringIO(code.decode('utf-8'), newline=None).readlines()
         
         buggy_code = ''
         
@@ -59,13 +61,13 @@ def get_comments_before_node(java_file_path: str, node: Node) -> Node:
         # Read the file to get the code bytes
         with open(java_file_path, 'rb') as f:
             code = f.read()
-        tree = parser.parse(code)
+        tree = java_parser.parse(code)
         
         # Get the node's start position
         node_start_point = node.start_point
         
         # Find all comment nodes in the file
-        query = Query(JAVA_LANGUAGE, """
+        query = java_parser.get_query("""
         (block_comment) @block_comment
         (line_comment) @line_comment
         """)
@@ -97,6 +99,80 @@ def get_comments_before_node(java_file_path: str, node: Node) -> Node:
         return None
 
 
+def get_import_declarations(root_node: Node, code: bytes) -> List[Tuple[str, bool, bool]]:
+    """
+    Retrieve the import declarations of a parsed Java file.
+
+    Returns: list of (imported name, is static import, is wildcard import), e.g.
+        import java.util.List;              -> ('java.util.List', False, False)
+        import static java.lang.Math.max;   -> ('java.lang.Math.max', True, False)
+        import java.io.*;                   -> ('java.io', False, True)
+    """
+    imports = []
+    for child in root_node.named_children:
+        if child.type != 'import_declaration':
+            continue
+        imported_name = ''
+        is_static = False
+        is_wildcard = False
+        for part in child.children:
+            if part.type == 'static':
+                is_static = True
+            elif part.type == 'asterisk':
+                is_wildcard = True
+            elif part.type in ('scoped_identifier', 'identifier'):
+                imported_name = get_node_text(part, code)
+        imports.append((''.join(imported_name.split()), is_static, is_wildcard))
+    return imports
+
+
+def get_package_name(root_node: Node, code: bytes) -> str:
+    """
+    Retrieve the package of a parsed Java file, or '' for the default package.
+    """
+    for child in root_node.named_children:
+        if child.type == 'package_declaration':
+            for part in child.named_children:
+                if part.type in ('scoped_identifier', 'identifier'):
+                    return ''.join(get_node_text(part, code).split())
+    return ''
+
+
+def retrieve_method_by_name(java_file_path: str, method_name: str, line_number: int = -1) -> Node:
+    """
+    Retrieve the method declaration node with the given name.
+    If line_number (1-based) is given, prefer the overload that contains that line.
+    Returns None if no method with that name exists.
+    """
+    try:
+        with open(java_file_path, 'rb') as f:
+            code = f.read()
+        tree = java_parser.parse(code)
+
+        query = java_parser.get_query("""
+        (method_declaration name: (identifier) @name) @method
+        """)
+
+        candidates = []
+        for pattern_id, captures_dict in query.matches(tree.root_node):
+            method_nodes = captures_dict.get('method', [])
+            name_nodes = captures_dict.get('name', [])
+            if method_nodes and name_nodes and get_node_text(name_nodes[0], code) == method_name:
+                candidates.append(method_nodes[0])
+
+        for node in candidates:
+            if node.start_point[0] <= line_number - 1 <= node.end_point[0]:
+                return node
+        return candidates[0] if candidates else None
+
+    except FileNotFoundError:
+        print(f"Error: File {java_file_path} not found")
+        return None
+    except Exception as e:
+        print(f"Error reading file {java_file_path}: {e}")
+        return None
+
+
 def get_name_from_tree_sitter_node(tree_sitter_node, java_file_path: str) -> Tuple[str, str]:
     """
     Extract method or constructor name from a tree-sitter node
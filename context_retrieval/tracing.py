@@ -0,0 +1,323 @@
+"""
+Lightweight spans for finding where the time of a repair goes (tree-sitter, Joern, the LLM, Defects4J).
+
+Tracing is off unless APR_TRACE_DIR is set; a disabled span costs one function call. When enabled, every finished
+span is appended to APR_TRACE_DIR/spans-<pid>.jsonl, and a Chrome trace-event file (trace-<pid>.json, open it in
+chrome://tracing or Perfetto) is written when the process exits.
+
+A span records its wall time, the CPU time of subprocesses that finished during it, and any attributes set on it
+(token counts, bytes, ...). The subprocess time is process-wide, so concurrent spans in other threads may share it.
+
+Profiling is opt-in per span name with APR_PROFILE (comma-separated span names or prefixes, or "all"):
+APR_PROFILE_MODE=cprofile (default) writes a .prof file per profiled span, APR_PROFILE_MODE=sample samples the
+span's thread every APR_PROFILE_INTERVAL_MS and writes collapsed stacks for flame graphs.
+
+Usage:
+    with tracing.span('joern.query', query_bytes=len(query)) as s:
+        ...
+        s.set(stdout_bytes=len(stdout))
+
+    @tracing.traced('isolate_bug.retrieve_buggy_node')
+    def retrieve_buggy_node(...): ...
+
+    python tracing.py --merge APR_TRACE_DIR --output trace.json   # one Chrome trace for all processes
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import itertools
+import threading
+from collections import Counter
+from typing import Optional
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; subprocess time is then not recorded
+    resource = None
+
+TRACE_DIR = os.getenv('APR_TRACE_DIR')
+PROFILE_SPANS = [name.strip() for name in os.getenv('APR_PROFILE', '').split(',') if name.strip()]
+PROFILE_MODE = os.getenv('APR_PROFILE_MODE', 'cprofile')
+PROFILE_INTERVAL_S = float(os.getenv('APR_PROFILE_INTERVAL_MS', '5')) / 1000
+
+
+def get_child_cpu_time() -> float:
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class NoopSpan:
+    """
+    Returned when tracing is disabled, so instrumented code does not need to check.
+    """
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key: str, amount: float = 1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Span:
+
+    def __init__(self, tracer: 'Tracer', name: str, attributes: dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(tracer.span_ids)
+        self.parent_id = None
+        self.start_time = 0.0
+        self.start_counter = 0.0
+        self.start_child_cpu = 0.0
+        self.profiler = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, amount: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def __enter__(self):
+        stack = self.tracer.get_stack()
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.profiler = self.tracer.start_profiler(self.name)
+        self.start_time = time.time()
+        self.start_child_cpu = get_child_cpu_time()
+        self.start_counter = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start_counter
+        child_cpu = get_child_cpu_time() - self.start_child_cpu
+        if self.profiler is not None:
+            self.tracer.stop_profiler(self.name, self.span_id, self.profiler)
+        stack = self.tracer.get_stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.attributes['error'] = f'{exc_type.__name__}: {exc_value}'
+        self.tracer.record(self, duration, child_cpu)
+        return False
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread at a fixed interval and counts the collapsed stacks.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f'{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+class Tracer:
+
+    def __init__(self, trace_dir: str):
+        self.trace_dir = trace_dir
+        os.makedirs(trace_dir, exist_ok=True)
+        self.pid = os.getpid()
+        self.spans_path = os.path.join(trace_dir, f'spans-{self.pid}.jsonl')
+        self.trace_path = os.path.join(trace_dir, f'trace-{self.pid}.json')
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.span_ids = itertools.count(1)
+        self.events = []
+        # cProfile can only profile one span per thread at a time
+        self.profiling_threads = set()
+
+    def get_stack(self) -> list:
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def should_profile(self, name: str) -> bool:
+        return any(pattern == 'all' or name.startswith(pattern) for pattern in PROFILE_SPANS)
+
+    def start_profiler(self, name: str):
+        if not PROFILE_SPANS or not self.should_profile(name):
+            return None
+        thread_id = threading.get_ident()
+        with self.lock:
+            if thread_id in self.profiling_threads:
+                return None
+            self.profiling_threads.add(thread_id)
+        if PROFILE_MODE == 'sample':
+            profiler = SamplingProfiler(thread_id, PROFILE_INTERVAL_S)
+            profiler.start()
+        else:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def stop_profiler(self, name: str, span_id: int, profiler):
+        profile_dir = os.path.join(self.trace_dir, 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        base_path = os.path.join(profile_dir, f'{name}-{self.pid}-{span_id}')
+        if isinstance(profiler, SamplingProfiler):
+            profiler.stop()
+            with open(base_path + '.collapsed', 'w') as f:
+                for stack, count in profiler.samples.most_common():
+                    f.write(f'{stack} {count}\n')
+        else:
+            profiler.disable()
+            profiler.dump_stats(base_path + '.prof')
+        with self.lock:
+            self.profiling_threads.discard(threading.get_ident())
+
+    def record(self, span: Span, duration: float, child_cpu: float):
+        record = {
+            'name': span.name,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'pid': self.pid,
+            'thread': threading.current_thread().name,
+            'start': span.start_time,
+            'duration_s': round(duration, 6),
+            'subprocess_cpu_s': round(child_cpu, 6),
+            'attributes': span.attributes
+        }
+        line = json.dumps(record, default=str)
+        with self.lock:
+            with open(self.spans_path, 'a') as f:
+                f.write(line + '\n')
+            self.events.append(to_chrome_event(record, threading.get_ident()))
+
+    def write_chrome_trace(self):
+        with self.lock:
+            if not self.events:
+                return
+            with open(self.trace_path, 'w') as f:
+                json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+
+def to_chrome_event(record: dict, thread_id) -> dict:
+    return {
+        'name': record['name'],
+        'ph': 'X',
+        'ts': int(record['start'] * 1e6),
+        'dur': int(record['duration_s'] * 1e6),
+        'pid': record['pid'],
+        'tid': thread_id,
+        'args': dict(record['attributes'], subprocess_cpu_s=record['subprocess_cpu_s'])
+    }
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Optional[Tracer]:
+    """
+    Return the tracer of this process, or None if tracing is disabled.
+    """
+    global _tracer
+    if TRACE_DIR is None:
+        return None
+    # Forked workers get their own files
+    if _tracer is None or _tracer.pid != os.getpid():
+        with _tracer_lock:
+            if _tracer is None or _tracer.pid != os.getpid():
+                _tracer = Tracer(TRACE_DIR)
+    return _tracer
+
+
+def span(name: str, **attributes):
+    """
+    Context manager that records a span; a no-op unless APR_TRACE_DIR is set.
+    """
+    tracer = get_tracer()
+    if tracer is None:
+        return NOOP_SPAN
+    return Span(tracer, name, attributes)
+
+
+def traced(name: str):
+    """
+    Decorator that records every call of the function as a span.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@atexit.register
+def write_chrome_trace():
+    if _tracer is not None and _tracer.pid == os.getpid():
+        _tracer.write_chrome_trace()
+
+
+def merge_spans(trace_dir: str, output_path: str) -> int:
+    """
+    Merge the spans-*.jsonl files of all processes into one Chrome trace.
+
+    Returns: number of spans merged
+    """
+    events = []
+    thread_ids = {}
+    for file_name in sorted(os.listdir(trace_dir)):
+        if not (file_name.startswith('spans-') and file_name.endswith('.jsonl')):
+            continue
+        with open(os.path.join(trace_dir, file_name), 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                thread_id = thread_ids.setdefault((record['pid'], record['thread']), len(thread_ids) + 1)
+                events.append(to_chrome_event(record, thread_id))
+    with open(output_path, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+    return len(events)
+
+
+def main():
+    import argparse
+    argument_parser = argparse.ArgumentParser(description='Merge span files into one Chrome trace.')
+    argument_parser.add_argument('--merge', required=True, help='Trace directory (APR_TRACE_DIR of the runs)')
+    argument_parser.add_argument('--output', required=True, help='Chrome trace JSON to write')
+    args = argument_parser.parse_args()
+    print(f"Merged {merge_spans(args.merge, args.output)} spans into {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,12 @@
+import os
+import sys
 from abc import ABC, abstractmethod
 from gpt_client import GPTClient
 from message_history import MessageHistory
 from info_dict import InfoDict
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import tracing
 
 class AbstractAgent(ABC):
     def __init__(self, information: InfoDict):
@@ -11,14 +16,17 @@ class AbstractAgent(ABC):
         self.msg_history = MessageHistory()
 
     def run(self, prompt: str) -> tuple[str, MessageHistory]:
-        # TODO: fix enhanced prompt
-        enhanced_prompt = self.get_prompt(prompt) + "\n" + prompt
-        self.msg_history.add_user(enhanced_prompt)
-        result_text = self.gpt_client.receive_response(self.gpt_client.send_prompt(enhanced_prompt))
-        self.msg_history.add_model(result_text)
+        with tracing.span('agent.run', agent=type(self).__name__) as run_span:
+            # TODO: fix enhanced prompt
+            with tracing.span('agent.get_prompt'):
+                enhanced_prompt = self.get_prompt() + "\n" + prompt
+            self.msg_history.add_user(enhanced_prompt)
+            result_text = self.gpt_client.receive_response(self.gpt_client.send_prompt(enhanced_prompt))
+            self.msg_history.add_model(result_text)
+            run_span.set(prompt_bytes=len(enhanced_prompt.encode('utf8')), response_bytes=len((result_text or '').encode('utf8')))
         return result_text, self.msg_history
 
-    def get_prompt(self, prompt: str) -> str:
+    def get_prompt(self) -> str:
         agent_task = self.information.get_info("agent task")
         final_prompt = f"""
         The task of the agent is: {agent_task}
@@ -3,9 +3,13 @@ import sys
 import os
 # Add the context_retrieval directory to the path
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+# Add the api_db directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'api_db'))
 import isolate_bug as ib
 import retrieval_utils as utils
+import api_ranker
 from typing import Tuple
+from tree_sitter import Node
 
 class ApiAgent(AbstractAgent):
     def get_prompt(self) -> str:
@@ -20,18 +24,14 @@ class ApiAgent(AbstractAgent):
         result = ''
         bug_number = 1
 
-        # Iterate through each file
-        for buggy_file_info in bug_locations:
-            java_file_path, bug_locations_list = buggy_file_info
-            with open(java_file_path, 'rb') as f:
-                code = f.read()
-            bugs_in_file = ib.retrieve_buggy_lines_and_node(java_file_path, bug_locations_list)
+        # Iterate through each file; the files are read and parsed concurrently
+        for java_file_path, code, bugs_in_file in ib.retrieve_buggy_lines_and_nodes_in_files(bug_locations):
 
             # Iterate through each bug in the file
             for bug_in_file in bugs_in_file:
                 bug_location, bug_code, buggy_node_info = bug_in_file
-                buggy_node_location, buggy_node = buggy_node_info
-                buggy_node = utils.get_node_text(buggy_node, code)
+                buggy_node_location, buggy_node_tree = buggy_node_info
+                buggy_node = utils.get_node_text(buggy_node_tree, code)
                 result += f'Bug #{bug_number}:\n'
                 result += f'File path: {java_file_path}\n'
                 result += f'Bug line number(s): {bug_location}\n'
@@ -40,15 +40,22 @@ class ApiAgent(AbstractAgent):
                 result += f'Buggy node: {buggy_node}\n'
                 
                 # API database specific additions
-                result += self.format_api_database_retrieval(buggy_node_location, buggy_node)
+                result += self.format_api_database_retrieval(buggy_node_location, buggy_node_tree, code)
                 
                 bug_number += 1
                 result += '\n'
         return result
     
-    def format_api_database_retrieval(self, buggy_node_location: Tuple[int, int], buggy_node: str) -> str:
-        """Format API database retrieval information"""
-        # TODO: Implement API database retrieval
-        return "API database information: [To be implemented]\n"
-    
+    def format_api_database_retrieval(self, buggy_node_location: Tuple[int, int], buggy_node_tree: Node, code: bytes) -> str:
+        """Format the API signatures most relevant to the identifiers used in the buggy node"""
+        query_terms = api_ranker.extract_query_terms(buggy_node_tree, code)
+        signatures = api_ranker.get_api_ranker().retrieve(query_terms, top_k=10, token_budget=300)
+        if not signatures:
+            return "API database information: No related APIs found\n"
+
+        result = "API database information:\n"
+        for signature in signatures:
+            result += f'    - {signature}\n'
+        return result
+
     
\ No newline at end of file
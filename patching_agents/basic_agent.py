@@ -20,12 +20,8 @@ class BasicAgent(AbstractAgent):
         result = ''
         bug_number = 1
 
-        # Iterate through each file
-        for buggy_file_info in bug_locations:
-            java_file_path, bug_locations_list = buggy_file_info
-            with open(java_file_path, 'rb') as f:
-                code = f.read()
-            bugs_in_file = ib.retrieve_buggy_lines_and_node(java_file_path, bug_locations_list)
+        # Iterate through each file; the files are read and parsed concurrently
+        for java_file_path, code, bugs_in_file in ib.retrieve_buggy_lines_and_nodes_in_files(bug_locations):
 
             # Iterate through each bug in the file
             for bug_in_file in bugs_in_file:
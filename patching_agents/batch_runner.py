@@ -0,0 +1,368 @@
+"""
+Resumable batch runner: repairs a list of Defects4J bugs with the agents and validates every candidate patch.
+
+One result record per (bug, agent, candidate) is appended to <output dir>/results/<worker id>.jsonl as soon as it
+is known, so a crashed or interrupted sweep loses at most the candidates in flight. On restart, candidates that
+already have a record are skipped (with --retry-errors, candidates that ended in an error are redone).
+
+Bugs are handed out through a file-based work queue in <output dir>/queue with lease timeouts, so several worker
+processes (--workers) and several machines sharing the output directory can work through the same bug list.
+
+The bug list is a JSON list or a JSONL file of bugs, each naming its modified sources and buggy lines:
+    {"project": "Chart", "version": "1", "locations": {"org.jfree.chart.renderer.category.AbstractCategoryItemRenderer": [[1797, 1797]]}}
+
+Usage:
+    python patching_agents/batch_runner.py --bugs bugs.jsonl --output-dir runs/sweep [--agents basic context api]
+        [--candidates 5] [--rounds 3] [--workers 4] [--validation-workers 1] [--test-mode fail-fast] [--lease-timeout 600]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+# Add the test_suites directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_suites'))
+import info_dict
+from work_queue import FileWorkQueue, DEFAULT_LEASE_TIMEOUT_S, get_worker_id
+from patch_splicer import EDIT_BLOCK_INSTRUCTIONS, splice_edit_blocks, write_patched_files
+
+AGENT_TASK = """
+Generate a patch for the buggy Java code. All buggy locations should be fixed; refactoring and commenting are not fixes.
+Do not assume any methods exist unless they are explicitly called or defined, and do not leave placeholders.
+""" + EDIT_BLOCK_INSTRUCTIONS
+AGENT_PROMPT = 'Fix the buggy code.'
+AGENT_NAMES = ('basic', 'context', 'api')
+
+
+def get_agent_class(agent_name: str):
+    # Imported on demand, so a sweep only loads the agents (and their retrieval backends) it uses
+    if agent_name == 'basic':
+        from basic_agent import BasicAgent
+        return BasicAgent
+    if agent_name == 'context':
+        from context_agent import ContextAgent
+        return ContextAgent
+    if agent_name == 'api':
+        from api_agent import ApiAgent
+        return ApiAgent
+    raise ValueError(f'Unknown agent {agent_name}')
+
+
+########################
+# BUG LIST AND CHECKPOINTS
+########################
+
+def load_bugs(bugs_path: str) -> List[dict]:
+    """
+    Read the bug list from a JSON list or a JSONL file.
+    """
+    with open(bugs_path, 'r') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        bugs = json.loads(text)
+    else:
+        bugs = [json.loads(line) for line in text.splitlines() if line.strip()]
+    for bug in bugs:
+        bug['version'] = str(bug['version'])
+        bug['id'] = f"{bug['project']}-{bug['version']}"
+    return bugs
+
+
+def get_result_key(bug_id: str, agent_name: str, candidate_index: int) -> str:
+    return f'{bug_id}/{agent_name}/{candidate_index}'
+
+
+class CheckpointLog:
+    """
+    Append-only JSONL result records, one file per worker, read back from every worker's file.
+    """
+
+    def __init__(self, output_dir: str, worker_id: str):
+        self.results_dir = os.path.join(output_dir, 'results')
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.path = os.path.join(self.results_dir, f'{worker_id}.jsonl')
+        self.records: Dict[str, dict] = {}
+        self.offsets: Dict[str, int] = {}
+
+    def refresh(self):
+        """
+        Read the records appended to any worker's file since the last refresh.
+        """
+        for file_name in sorted(os.listdir(self.results_dir)):
+            if not file_name.endswith('.jsonl'):
+                continue
+            path = os.path.join(self.results_dir, file_name)
+            with open(path, 'rb') as f:
+                f.seek(self.offsets.get(path, 0))
+                data = f.read()
+            # A worker that crashed mid-write leaves a partial last line; it is never consumed
+            complete = data[:data.rfind(b'\n') + 1]
+            self.offsets[path] = self.offsets.get(path, 0) + len(complete)
+            for line in complete.splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self.add_record(record)
+
+    def add_record(self, record: dict):
+        # The first record of a key wins, in case a worker that lost its lease repeated the work, except that a
+        # successful retry replaces an error
+        existing = self.records.get(record['key'])
+        if existing is None or (existing['status'] == 'error' and record['status'] != 'error'):
+            self.records[record['key']] = record
+
+    def is_done(self, key: str, retry_errors: bool = False) -> bool:
+        record = self.records.get(key)
+        return record is not None and not (retry_errors and record['status'] == 'error')
+
+    def append(self, record: dict):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record, default=str) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.add_record(record)
+
+
+########################
+# REPAIR AND VALIDATION
+########################
+
+def make_record(bug: dict, agent_name: str, candidate_index: int, status: str, **fields) -> dict:
+    record = {
+        'key': get_result_key(bug['id'], agent_name, candidate_index),
+        'project': bug['project'],
+        'version': bug['version'],
+        'agent': agent_name,
+        'candidate': candidate_index,
+        'status': status,
+        'worker': get_worker_id(),
+        'finished': time.time()
+    }
+    record.update(fields)
+    return record
+
+
+def generate_candidate(bug: dict, agent_name: str, candidate_index: int, bug_locations: list, source_names: Dict[str, str],
+                       patches_dir: str) -> Tuple[Optional[dict], Optional[dict]]:
+    """
+    Run one agent once and splice its response into patched files.
+
+    Returns: (java patch files, {'agent_s': agent time}) for a usable candidate, or (None, result record) if there is
+    nothing to validate
+    """
+    start_time = time.perf_counter()
+    try:
+        information = info_dict.InfoDict()
+        information.create_info_dict(agent_name, AGENT_TASK, bug_locations)
+        response, _ = get_agent_class(agent_name)(information).run(AGENT_PROMPT)
+    except Exception as e:
+        return None, make_record(bug, agent_name, candidate_index, 'error', error=f'Agent failed: {e}')
+    agent_time = round(time.perf_counter() - start_time, 3)
+
+    try:
+        patched_code = splice_edit_blocks(bug_locations, response or '')
+    except ValueError as e:
+        return None, make_record(bug, agent_name, candidate_index, 'unparsable', error=str(e), agent_s=agent_time)
+
+    output_dir = os.path.join(patches_dir, bug['id'], f'{agent_name}-{candidate_index}')
+    patch_files = write_patched_files(patched_code, output_dir)
+    java_patch_files = {source_names[java_file_path]: patch_file for java_file_path, patch_file in patch_files.items()}
+    return java_patch_files, {'agent_s': agent_time}
+
+
+def run_repair_loop(bug: dict, agent_name: str, candidate_index: int, bug_locations: list, source_names: Dict[str, str],
+                    validation_pool, patches_dir: str, rounds: int) -> dict:
+    """
+    Repair the bug in up to rounds rounds, feeding the failing tests of each round back to the agent.
+
+    Returns: result record of the candidate
+    """
+    from repair_loop import RepairLoop
+
+    start_time = time.perf_counter()
+    try:
+        information = info_dict.InfoDict()
+        information.create_info_dict(agent_name, AGENT_TASK, bug_locations)
+        agent = get_agent_class(agent_name)(information)
+        output_dir = os.path.join(patches_dir, bug['id'], f'{agent_name}-{candidate_index}')
+        result = RepairLoop(agent, bug['project'], bug['version'], source_names, validation_pool, output_dir, AGENT_PROMPT,
+                            rounds).run()
+    except Exception as e:
+        return make_record(bug, agent_name, candidate_index, 'error', error=f'Repair loop failed: {e}')
+
+    last_round = result['rounds'][-1]
+    return make_record(bug, agent_name, candidate_index, last_round['status'], error=last_round.get('error'),
+                       failing_tests=last_round.get('failing_tests', []), patch_files=result['patch_files'],
+                       rounds=len(result['rounds']), prompt_tokens=[repair_round['prompt_tokens'] for repair_round in result['rounds']],
+                       elapsed=round(time.perf_counter() - start_time, 3))
+
+
+def run_bug(bug: dict, agent_names: List[str], candidates: int, checkpoint: CheckpointLog, checkout_cache, validation_pool,
+            patches_dir: str, retry_errors: bool = False, rounds: int = 1) -> int:
+    """
+    Generate and validate every candidate of the bug that has no result record yet. With more than one round, each
+    candidate is a RepairLoop; the loops run concurrently and validate every round with validation_pool.
+
+    Returns: number of records written
+    """
+    import test_suites_helpers as tsh
+
+    todo = [(agent_name, candidate_index) for agent_name in agent_names for candidate_index in range(candidates)
+            if not checkpoint.is_done(get_result_key(bug['id'], agent_name, candidate_index), retry_errors)]
+    if not todo:
+        return 0
+
+    pristine_path = checkout_cache.get_pristine_checkout(bug['project'], bug['version'])
+    if pristine_path is None:
+        for agent_name, candidate_index in todo:
+            checkpoint.append(make_record(bug, agent_name, candidate_index, 'error', error='Failed to checkout project'))
+        return len(todo)
+
+    # The agents read the buggy sources from the pristine checkout, which is never modified
+    source_names = {}
+    bug_locations = []
+    for modified_source, lines in bug['locations'].items():
+        java_file_path = tsh.get_full_source_path(bug['project'], pristine_path, modified_source, bug['version'])
+        source_names[java_file_path] = modified_source
+        bug_locations.append((java_file_path, [tuple(line_range) for line_range in lines]))
+
+    if rounds > 1:
+        # A loop mostly waits for the model or for its validation, so one thread per loop is enough
+        with ThreadPoolExecutor(max_workers=min(len(todo), validation_pool.max_workers), thread_name_prefix='repair') as executor:
+            futures = [executor.submit(run_repair_loop, bug, agent_name, candidate_index, bug_locations, source_names,
+                                       validation_pool, patches_dir, rounds)
+                       for agent_name, candidate_index in todo]
+            for future in as_completed(futures):
+                checkpoint.append(future.result())
+        return len(todo)
+
+    requests = []
+    pending: Dict[str, dict] = {}
+    for agent_name, candidate_index in todo:
+        java_patch_files, fields = generate_candidate(bug, agent_name, candidate_index, bug_locations, source_names, patches_dir)
+        if java_patch_files is None:
+            checkpoint.append(fields)
+            continue
+        key = get_result_key(bug['id'], agent_name, candidate_index)
+        pending[key] = {'agent_name': agent_name, 'candidate_index': candidate_index, 'patch_files': java_patch_files, **fields}
+        requests.append((key, bug['project'], bug['version'], java_patch_files))
+
+    for key, result in validation_pool.validate(requests):
+        candidate = pending[key]
+        fields = {'agent_s': candidate['agent_s'], 'patch_files': candidate['patch_files']}
+        if isinstance(result, dict):
+            record = make_record(bug, candidate['agent_name'], candidate['candidate_index'], 'error', error=result.get('error'), **fields)
+        else:
+            result = result[0]
+            status = 'plausible' if result.get('success') else 'rejected'
+            record = make_record(bug, candidate['agent_name'], candidate['candidate_index'], status,
+                                 failing_tests=result.get('failing_tests', []), stage=result.get('stage'),
+                                 validation_s=result.get('elapsed'), **fields)
+        checkpoint.append(record)
+    return len(todo)
+
+
+def reopen_unfinished_bugs(args: argparse.Namespace):
+    """
+    Remove the done markers of bugs that still have candidates to run, e.g. after --candidates or --agents grew, or
+    with --retry-errors, so workers claim them again.
+    """
+    checkpoint = CheckpointLog(args.output_dir, get_worker_id())
+    checkpoint.refresh()
+    queue = FileWorkQueue(os.path.join(args.output_dir, 'queue'), args.lease_timeout)
+    for bug in load_bugs(args.bugs):
+        done_path = queue.get_done_path(bug['id'])
+        if not os.path.exists(done_path):
+            continue
+        if not all(checkpoint.is_done(get_result_key(bug['id'], agent_name, candidate_index), args.retry_errors)
+                   for agent_name in args.agents for candidate_index in range(args.candidates)):
+            os.remove(done_path)
+
+
+def run_worker(args: argparse.Namespace):
+    """
+    Claim bugs from the work queue until every bug is done.
+    """
+    from checkout_cache import CheckoutCache
+    from validation_cache import get_validation_cache
+    from validation_pool import ValidationPool
+
+    worker_id = get_worker_id()
+    bugs = {bug['id']: bug for bug in load_bugs(args.bugs)}
+    checkpoint = CheckpointLog(args.output_dir, worker_id)
+    queue = FileWorkQueue(os.path.join(args.output_dir, 'queue'), args.lease_timeout, worker_id)
+    patches_dir = os.path.join(args.output_dir, 'patches')
+    validation_cache = None if args.no_validation_cache else get_validation_cache()
+
+    with ValidationPool(CheckoutCache(), args.validation_workers, args.test_mode, validation_cache) as validation_pool:
+        for lease in queue.iterate(bugs, args.poll_interval):
+            bug = bugs[lease.item_id]
+            # Pick up the records other workers wrote, e.g. for this bug before a crash
+            checkpoint.refresh()
+            with lease.keep_alive():
+                written = run_bug(bug, args.agents, args.candidates, checkpoint, validation_pool.checkout_cache,
+                                  validation_pool, patches_dir, args.retry_errors, args.rounds)
+            lease.complete()
+            print(f"[{worker_id}] {bug['id']}: {written} new result(s)")
+
+
+########################
+# SUMMARY
+########################
+
+def summarize(output_dir: str) -> dict:
+    checkpoint = CheckpointLog(output_dir, get_worker_id())
+    checkpoint.refresh()
+    summary = {'results': len(checkpoint.records), 'statuses': {}, 'plausible_bugs': set()}
+    for record in checkpoint.records.values():
+        summary['statuses'][record['status']] = summary['statuses'].get(record['status'], 0) + 1
+        if record['status'] == 'plausible':
+            summary['plausible_bugs'].add(f"{record['project']}-{record['version']}")
+    summary['plausible_bugs'] = sorted(summary['plausible_bugs'])
+    return summary
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Repair and validate a list of Defects4J bugs, resumably.')
+    argument_parser.add_argument('--bugs', required=True, help='JSON or JSONL bug list')
+    argument_parser.add_argument('--output-dir', required=True, help='Results, patches and work queue; share it between machines')
+    argument_parser.add_argument('--agents', nargs='+', choices=AGENT_NAMES, default=['basic'])
+    argument_parser.add_argument('--candidates', type=int, default=1, help='Candidates per bug and agent')
+    argument_parser.add_argument('--rounds', type=int, default=1,
+                                 help='Repair rounds per candidate; each round feeds the failing tests of the last one back')
+    argument_parser.add_argument('--workers', type=int, default=1, help='Worker processes on this machine')
+    argument_parser.add_argument('--validation-workers', type=int, default=1, help='Concurrent validations per worker')
+    argument_parser.add_argument('--test-mode', choices=('full', 'fail-fast'), default='full')
+    argument_parser.add_argument('--lease-timeout', type=float, default=DEFAULT_LEASE_TIMEOUT_S,
+                                 help='Seconds after which a bug leased by a silent worker is handed out again')
+    argument_parser.add_argument('--poll-interval', type=float, default=30.0,
+                                 help='Seconds between checks while the remaining bugs are leased by other workers')
+    argument_parser.add_argument('--retry-errors', action='store_true', help='Redo candidates whose record is an error')
+    argument_parser.add_argument('--no-validation-cache', action='store_true', help='Do not reuse or store validation results')
+    args = argument_parser.parse_args()
+    args.bugs = os.path.abspath(args.bugs)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    reopen_unfinished_bugs(args)
+
+    if args.workers == 1:
+        run_worker(args)
+    else:
+        workers = [multiprocessing.Process(target=run_worker, args=(args,)) for _ in range(args.workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    summary = summarize(args.output_dir)
+    print(f"{summary['results']} results: {summary['statuses']}")
+    print(f"Bugs with a plausible patch: {len(summary['plausible_bugs'])}")
+
+
+if __name__ == '__main__':
+    main()
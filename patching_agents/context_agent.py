@@ -6,7 +6,6 @@ import os
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
 import isolate_bug as ib
 import retrieval_utils as utils
-from joern_callgraph import JoernSession
 
 class ContextAgent(AbstractAgent):
     
@@ -22,12 +21,8 @@ class ContextAgent(AbstractAgent):
         result = ''
         bug_number = 1
 
-        # Iterate through each file
-        for buggy_file_info in bug_locations:
-            java_file_path, bug_locations_list = buggy_file_info
-            with open(java_file_path, 'rb') as f:
-                code = f.read()
-            bugs_in_file = ib.retrieve_buggy_lines_and_node(java_file_path, bug_locations_list)
+        # Iterate through each file; the files are read and parsed concurrently
+        for java_file_path, code, bugs_in_file in ib.retrieve_buggy_lines_and_nodes_in_files(bug_locations):
 
             # Iterate through each bug in the file
             for bug_in_file in bugs_in_file:
@@ -58,6 +53,7 @@ class ContextAgent(AbstractAgent):
     def format_callgraph_info(self, java_file_path: str, bug_location: Tuple[int, int]) -> str:
         """Format call graph information for the bug location"""
         import os
+        from joern_callgraph import JoernSession
         joern_executable = os.getenv('JOERN_EXECUTABLE', '/usr/local/bin/joern')
         joern_directory = os.getenv('JOERN_DIRECTORY', '/usr/local/share/joern')
         
@@ -1,6 +1,7 @@
 import info_dict
 from context_agent import ContextAgent
 from basic_agent import BasicAgent
+from patch_splicer import EDIT_BLOCK_INSTRUCTIONS
 
 SYSTEM_DESCRIPTION = """
 The task is to generate a patch for the buggy Java code.
@@ -12,10 +13,8 @@ without any placeholder logic.
 All buggy locations should be fixed. Refactoring and commenting should not be considered fixes.
 
 The user cannot modify your code, so do not suggest incomplete code which requires others to modify.
-Suggest the full code instead of partial code or code changes.
-
-Return the patch as a .java file.
-"""
+Every replacement must be complete code, without placeholders.
+""" + EDIT_BLOCK_INSTRUCTIONS
 
 BASIC_PROMPT = "Fix the buggy code."
 
@@ -7,7 +7,6 @@ import os
 sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
 import isolate_bug as ib
 import retrieval_utils as utils
-from joern_callgraph import JoernSession
 
 # Get paths from environment variables with fallbacks
 JOERN_EXECUTABLE = os.getenv('JOERN_EXECUTABLE', '/usr/local/bin/joern')
@@ -24,12 +23,8 @@ def format_context(context_type: str, all_bug_locations: List[Tuple[str, List[Tu
     result = ''
     bug_number = 1
 
-    # Iterate through each file
-    for buggy_file_info in all_bug_locations:
-        java_file_path, bug_locations_list = buggy_file_info
-        with open(java_file_path, 'rb') as f:
-            code = f.read()
-        bugs_in_file = ib.retrieve_buggy_lines_and_node(java_file_path, bug_locations_list)
+    # Iterate through each file; the files are read and parsed concurrently
+    for java_file_path, code, bugs_in_file in ib.retrieve_buggy_lines_and_nodes_in_files(all_bug_locations):
 
         # Iterate through each bug in the file
         for bug_in_file in bugs_in_file:
@@ -69,6 +64,8 @@ def format_api_database_retrieval() -> str:
 
 # TODO: fix json parsing
 def format_callgraph_info(java_file_path: str, bug_location: Tuple[int, int]) -> str:
+    # Joern is only needed for the context retrieval variant, so it is imported here
+    from joern_callgraph import JoernSession
     # Use provided parameters or fall back to environment variables
     joern_executable = JOERN_EXECUTABLE
     joern_directory = JOERN_DIRECTORY
@@ -1,27 +1,45 @@
-import logging
 import sys
 import os
-from openai import OpenAI
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import tracing
 
 from typing import List
-import openai
 
 class GPTClient:
     def __init__(self):
         self.api_key = None
+        self.client = None
     
     def initialize_agent(self):
         self.api_key = os.environ.get("OPENAI_API_KEY")
         if not self.api_key:
             raise ValueError("OpenAI API key not found in environment variables")
-        self.client = OpenAI(api_key=self.api_key)
+        self.client = None
+
+    def get_client(self):
+        # openai takes about half a second to import, so it is only imported once a prompt is sent
+        if self.client is None:
+            from openai import OpenAI
+            self.client = OpenAI(api_key=self.api_key)
+        return self.client
 
     def send_prompt(self, prompt):
-        client = OpenAI(api_key=self.api_key)
+        return self.send_messages([{"role": "user", "content": prompt}])
+
+    def send_messages(self, messages: List[dict]):
+        """
+        Send a conversation (a list of {"role", "content"} messages, e.g. MessageHistory.to_msg()) and return the response.
+        """
+        client = self.get_client()
         
         gpt_model = os.environ.get("GPT_MODEL", "gpt-4-turbo-2024-04-09")
-        response = client.chat.completions.create(model=gpt_model,
-        messages=[{"role": "user", "content": prompt}])
+        prompt_bytes = sum(len(message["content"].encode('utf8')) for message in messages)
+        with tracing.span('llm.send_prompt', model=gpt_model, prompt_bytes=prompt_bytes, messages=len(messages)) as llm_span:
+            response = client.chat.completions.create(model=gpt_model, messages=messages)
+            usage = getattr(response, 'usage', None)
+            if usage is not None:
+                llm_span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
         
         return response
 
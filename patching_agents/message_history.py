@@ -28,6 +28,18 @@ class MessageHistory:
         """
         self.messages.append({"role": role, "content": message})
 
+    def add_user(self, message: str):
+        """
+        Add a user prompt to the thread, in the role the chat completions API expects.
+        """
+        self.messages.append({"role": "user", "content": message})
+
+    def add_model(self, message: str):
+        """
+        Add a model response to the thread; these count as completed rounds.
+        """
+        self.messages.append({"role": "assistant", "content": message})
+
     def to_msg(self) -> list[dict]:
         """
         Convert to the format to be consumed by the model.
@@ -0,0 +1,142 @@
+import re
+import sys
+import os
+from typing import List, Tuple
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import isolate_bug as ib
+
+# Return format for the patch. Bug numbers are the "Bug #n" numbers used when formatting the context.
+EDIT_BLOCK_INSTRUCTIONS = """
+Do not return the whole .java file. Return only the code that changes, using one or more of these blocks:
+
+To replace the buggy node of bug #n, return the complete new declaration of that node:
+<<<<<<< NODE n
+(complete replacement method/constructor/class declaration)
+>>>>>>> END
+
+To replace any other exact piece of the original code, return a search/replace block. The search text must
+appear exactly once in the original file:
+<<<<<<< SEARCH
+(exact original code)
+=======
+(replacement code)
+>>>>>>> REPLACE
+"""
+
+NODE_BLOCK_PATTERN = re.compile(r'^<<<<<<< NODE (\d+)[ \t]*\n(.*?)^>>>>>>> END[ \t]*$', re.DOTALL | re.MULTILINE)
+SEARCH_REPLACE_BLOCK_PATTERN = re.compile(
+    r'^<<<<<<< SEARCH[ \t]*\n(.*?)^=======[ \t]*\n(.*?)^>>>>>>> REPLACE[ \t]*$', re.DOTALL | re.MULTILINE
+)
+
+
+def parse_edit_blocks(response: str) -> Tuple[List[Tuple[int, str]], List[Tuple[str, str]]]:
+    """
+    Parse the edit blocks out of a model response.
+
+    Returns: tuple of (node blocks as (bug number, replacement), search/replace blocks as (search, replace))
+    """
+    node_blocks = [(int(match.group(1)), match.group(2)) for match in NODE_BLOCK_PATTERN.finditer(response)]
+    search_replace_blocks = [(match.group(1), match.group(2)) for match in SEARCH_REPLACE_BLOCK_PATTERN.finditer(response)]
+    return node_blocks, search_replace_blocks
+
+
+def splice_edit_blocks(all_bug_locations: List[Tuple[str, List[Tuple[int, int]]]], response: str) -> dict[str, bytes]:
+    """
+    Splice the edit blocks of a model response back into the original files.
+
+    Args:
+        all_bug_locations: The "bug files and locations" of the InfoDict, in the same order used to number the bugs
+        response: The model response containing the edit blocks
+
+    Returns: dict of {java file path: complete patched file bytes} for every file touched by the response
+    """
+    node_blocks, search_replace_blocks = parse_edit_blocks(response)
+    if not node_blocks and not search_replace_blocks:
+        raise ValueError("No edit blocks found in the model response")
+
+    # Map bug numbers to the byte range of their buggy node, numbered like the agents number the bugs
+    bug_nodes = {}
+    original_code = {}
+    bug_number = 1
+    for java_file_path, bug_locations_list in all_bug_locations:
+        with open(java_file_path, 'rb') as f:
+            original_code[java_file_path] = f.read()
+        for bug_location in bug_locations_list:
+            buggy_node_info = ib.retrieve_buggy_node(java_file_path, bug_location)
+            if buggy_node_info:
+                _, buggy_node = buggy_node_info
+                bug_nodes[bug_number] = (java_file_path, buggy_node.start_byte, buggy_node.end_byte)
+            bug_number += 1
+
+    # Collect the edits as byte ranges of the original files
+    edits = {java_file_path: {} for java_file_path in original_code}
+    for bug_number, replacement in node_blocks:
+        if bug_number not in bug_nodes:
+            raise ValueError(f"Edit block refers to unknown bug #{bug_number}")
+        java_file_path, start_byte, end_byte = bug_nodes[bug_number]
+        add_edit(edits[java_file_path], start_byte, end_byte, replacement.rstrip('\n').encode('utf8'))
+
+    for search, replace in search_replace_blocks:
+        search_bytes = search.encode('utf8')
+        matching_files = [path for path, code in original_code.items() if code.count(search_bytes) == 1]
+        if len(matching_files) != 1:
+            raise ValueError(f"Search text must appear exactly once in the original files:\n{search}")
+        java_file_path = matching_files[0]
+        start_byte = original_code[java_file_path].find(search_bytes)
+        add_edit(edits[java_file_path], start_byte, start_byte + len(search_bytes), replace.encode('utf8'))
+
+    patched_code = {}
+    for java_file_path, file_edits in edits.items():
+        if file_edits:
+            patched_code[java_file_path] = apply_byte_edits(original_code[java_file_path], file_edits)
+    return patched_code
+
+
+def add_edit(file_edits: dict[Tuple[int, int], bytes], start_byte: int, end_byte: int, replacement: bytes):
+    """
+    Register an edit of the byte range [start_byte, end_byte). Several bugs can share one buggy node, so repeating
+    the same edit is allowed, but different edits to overlapping ranges are rejected.
+    """
+    if (start_byte, end_byte) in file_edits:
+        if file_edits[(start_byte, end_byte)] != replacement:
+            raise ValueError(f"Conflicting edits for bytes {start_byte}-{end_byte}")
+        return
+    for other_start, other_end in file_edits:
+        if start_byte < other_end and other_start < end_byte:
+            raise ValueError(f"Overlapping edits for bytes {start_byte}-{end_byte} and {other_start}-{other_end}")
+    file_edits[(start_byte, end_byte)] = replacement
+
+
+def apply_byte_edits(code: bytes, file_edits: dict[Tuple[int, int], bytes]) -> bytes:
+    """
+    Apply non-overlapping byte range edits in a single pass over the original bytes.
+    """
+    parts = []
+    previous_end = 0
+    for (start_byte, end_byte), replacement in sorted(file_edits.items()):
+        parts.append(code[previous_end:start_byte])
+        parts.append(replacement)
+        previous_end = end_byte
+    parts.append(code[previous_end:])
+    return b''.join(parts)
+
+
+def write_patched_files(patched_code: dict[str, bytes], output_dir: str) -> dict[str, str]:
+    """
+    Write the spliced files to output_dir so they can be passed to apply_java_file_patch. Each file keeps its path
+    relative to the directory shared by all the files, so classes of the same name in different packages do not
+    overwrite each other.
+
+    Returns: dict of {original java file path: path to the written patch file}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    common_dir = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in patched_code]) if patched_code else ''
+    patch_files = {}
+    for java_file_path, code in patched_code.items():
+        patch_file_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(java_file_path), common_dir))
+        os.makedirs(os.path.dirname(patch_file_path), exist_ok=True)
+        with open(patch_file_path, 'wb') as f:
+            f.write(code)
+        patch_files[java_file_path] = patch_file_path
+    return patch_files
@@ -0,0 +1,269 @@
+"""
+Iterative repair: generate a patch, validate it, and feed the failing tests back to the model for another round.
+
+Each round sends the bug context, compact one-line summaries of the older rounds and the full exchange (response
+and test feedback) of only the most recent rounds, trimmed to a token cap. The prompt therefore stops growing
+after a few rounds, and so do the per-round latency and cost. Every response is spliced against the original
+buggy files, so each round's patch stands on its own.
+"""
+import os
+import sys
+from typing import Dict, List
+# Add the test_suites directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test_suites'))
+from abstract_agent import AbstractAgent
+from patch_splicer import splice_edit_blocks, write_patched_files
+
+DEFAULT_MAX_ROUNDS = int(os.getenv('REPAIR_MAX_ROUNDS', '5'))
+# Rounds whose response and feedback are sent in full; older rounds are only summarized
+DEFAULT_WINDOW_ROUNDS = int(os.getenv('REPAIR_WINDOW_ROUNDS', '2'))
+DEFAULT_MAX_PROMPT_TOKENS = int(os.getenv('REPAIR_MAX_PROMPT_TOKENS', '16000'))
+
+# Failing tests described per round, and the longest test method included in the feedback
+MAX_FEEDBACK_TESTS = 3
+MAX_TEST_METHOD_CHARS = 2000
+MAX_SUMMARY_MESSAGE_CHARS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for code
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    max_chars = max(0, max_tokens * 4)
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + '\n... (truncated)\n'
+
+
+########################
+# FEEDBACK
+########################
+
+def format_test_feedback(round_number: int, result: dict, failing_test_info: List[dict]) -> str:
+    """
+    Describe a rejected patch for the model: the failing tests with their failure message, failing line and test
+    method, as produced by get_failing_test_info.
+    """
+    failing_tests = result.get('failing_tests', [])
+    if not failing_tests and result.get('compile_errors'):
+        return (f'The patch of round {round_number} does not compile:\n{result["compile_errors"]}\n'
+                f'Return a corrected patch.\n')
+    if not failing_tests:
+        return (f'The patch of round {round_number} was rejected: it does not compile or the tests could not run. '
+                f'Return a corrected patch.\n')
+
+    feedback = f'The patch of round {round_number} was compiled and tested, and {len(failing_tests)} test(s) failed:\n\n'
+    for test_info in failing_test_info[:MAX_FEEDBACK_TESTS]:
+        feedback += f"Failing test: {test_info['failing test']}\n"
+        feedback += f"Failure message: {test_info['failure message']}\n"
+        feedback += f"Failing line in test: {str(test_info['buggy line']).strip()}\n"
+        test_method = test_info['buggy method']
+        if len(test_method) > MAX_TEST_METHOD_CHARS:
+            test_method = test_method[:MAX_TEST_METHOD_CHARS] + '\n... (truncated)'
+        feedback += f'Test method:\n{test_method}\n\n'
+    described = min(len(failing_test_info), MAX_FEEDBACK_TESTS)
+    if len(failing_tests) > described:
+        feedback += f"Also failing: {', '.join(failing_tests[described:described + 10])}"
+        feedback += f" and {len(failing_tests) - described - 10} more\n" if len(failing_tests) > described + 10 else '\n'
+    feedback += 'Return a corrected patch.\n'
+    return feedback
+
+
+def summarize_round(repair_round: dict) -> str:
+    """
+    One line describing a round, used once the round has left the window.
+    """
+    summary = f"Round {repair_round['round']}: {repair_round['status']}"
+    if repair_round.get('failing_tests'):
+        summary += f"; failing tests: {', '.join(repair_round['failing_tests'][:3])}"
+        if len(repair_round['failing_tests']) > 3:
+            summary += f" (+{len(repair_round['failing_tests']) - 3} more)"
+    if repair_round.get('failure_message'):
+        summary += f"; {repair_round['failure_message'][:MAX_SUMMARY_MESSAGE_CHARS]}"
+    elif repair_round.get('compile_errors'):
+        summary += f"; does not compile: {repair_round['compile_errors'].splitlines()[0][:MAX_SUMMARY_MESSAGE_CHARS]}"
+    elif repair_round.get('error'):
+        summary += f"; {repair_round['error'][:MAX_SUMMARY_MESSAGE_CHARS]}"
+    return summary
+
+
+def build_messages(initial_prompt: str, rounds: List[dict], window_rounds: int, max_tokens: int) -> List[dict]:
+    """
+    Build the chat messages for the next round: the initial prompt, a summary of the rounds outside the window,
+    then the response and feedback of each round in the window.
+
+    Rounds leave the window early, and then the oldest summaries are dropped, until the estimated size is under
+    max_tokens. If even the newest round alone does not fit, its response and feedback are truncated to share
+    what is left.
+    """
+    budget = max_tokens - estimate_tokens(initial_prompt)
+    window = rounds[-window_rounds:] if window_rounds > 0 else []
+
+    def exchange_tokens(repair_round: dict) -> int:
+        return estimate_tokens(repair_round['response']) + estimate_tokens(repair_round['feedback'])
+
+    # Shrink the window from its oldest round until the newest rounds fit
+    while len(window) > 1 and sum(exchange_tokens(repair_round) for repair_round in window) > budget:
+        window = window[1:]
+    summarized = rounds[:len(rounds) - len(window)]
+    budget -= sum(exchange_tokens(repair_round) for repair_round in window)
+
+    summaries = [summarize_round(repair_round) for repair_round in summarized]
+    omitted = 0
+    while summaries and estimate_tokens('\n'.join(summaries)) + 20 > budget:
+        summaries.pop(0)
+        omitted += 1
+
+    messages = [{'role': 'user', 'content': initial_prompt}]
+    if summaries or omitted:
+        summary_text = 'Earlier attempts, which all failed:\n'
+        if omitted:
+            summary_text += f'({omitted} earlier round(s) omitted)\n'
+        if summaries:
+            summary_text += '\n'.join(summaries) + '\n'
+        messages.append({'role': 'user', 'content': summary_text})
+    for repair_round in window:
+        response = repair_round['response']
+        feedback = repair_round['feedback']
+        if budget < 0:
+            # Only the newest round is left in the window; give the feedback up to half of the remaining tokens
+            remaining = max(0, budget + exchange_tokens(repair_round))
+            feedback = truncate_to_tokens(feedback, max(remaining // 2, remaining - estimate_tokens(response)))
+            response = truncate_to_tokens(response, remaining - estimate_tokens(feedback))
+        messages.append({'role': 'assistant', 'content': response})
+        messages.append({'role': 'user', 'content': feedback})
+    return messages
+
+
+########################
+# REPAIR LOOP
+########################
+
+class RepairLoop:
+    """
+    Repairs one bug in up to max_rounds rounds with one agent, validating each round's patch with a ValidationPool
+    (and so with its test mode and validation cache). Stops at the first plausible patch or at an error; the rounds
+    finished before an error are kept.
+    """
+
+    def __init__(self, agent: AbstractAgent, project_name: str, version: str, source_names: Dict[str, str], validation_pool,
+                 output_dir: str, prompt: str = 'Fix the buggy code.', max_rounds: int = DEFAULT_MAX_ROUNDS,
+                 window_rounds: int = DEFAULT_WINDOW_ROUNDS, max_prompt_tokens: int = DEFAULT_MAX_PROMPT_TOKENS):
+        """
+        Parameters:
+        - agent: Agent whose information holds the bug files and locations; its context is computed once
+        - source_names: {buggy java file path: modified source name}, for the java_patch_files of run_defects4j_test
+        - validation_pool: ValidationPool the patch of each round is tested with; several loops can share one
+        - output_dir: Directory the patched files of each round are written to
+        """
+        self.agent = agent
+        self.project_name = project_name
+        self.version = version
+        self.source_names = source_names
+        self.validation_pool = validation_pool
+        self.output_dir = output_dir
+        self.prompt = prompt
+        self.max_rounds = max_rounds
+        self.window_rounds = window_rounds
+        self.max_prompt_tokens = max_prompt_tokens
+        self.rounds: List[dict] = []
+
+    def run(self) -> dict:
+        """
+        Returns: dict of {'success', 'rounds' (a dict per round), 'patch_files' (of the plausible or last tested
+        patch, or None)}
+        """
+        import validation_cache as vc
+
+        bug_locations = self.agent.information.get_info("bug files and locations")
+        initial_prompt = self.agent.get_prompt() + "\n" + self.prompt
+        tested_patches: Dict[str, dict] = {}
+        patch_files = None
+
+        for round_number in range(1, self.max_rounds + 1):
+            messages = build_messages(initial_prompt, self.rounds, self.window_rounds, self.max_prompt_tokens)
+            prompt_tokens = sum(estimate_tokens(message['content']) for message in messages)
+            repair_round = {'round': round_number, 'response': '', 'prompt_tokens': prompt_tokens}
+            self.rounds.append(repair_round)
+            try:
+                repair_round['response'] = self.agent.gpt_client.receive_response(self.agent.gpt_client.send_messages(messages)) or ''
+            except Exception as e:
+                repair_round.update(status='error', error=f'Model request failed: {e}', feedback='')
+                break
+            response = repair_round['response']
+
+            try:
+                patched_code = splice_edit_blocks(bug_locations, response)
+            except ValueError as e:
+                repair_round.update(status='unparsable', error=str(e),
+                                    feedback=f'The response of round {round_number} could not be applied: {e}\n'
+                                             f'Return the patch as edit blocks, as instructed.\n')
+                continue
+
+            round_patch_files = write_patched_files(patched_code, os.path.join(self.output_dir, f'round-{round_number}'))
+            java_patch_files = {self.source_names[java_file_path]: path for java_file_path, path in round_patch_files.items()}
+            patch_hash = vc.hash_patch_files(java_patch_files)
+            if patch_hash in tested_patches:
+                # The model repeated itself; the outcome is known, so only remind it
+                earlier_round = tested_patches[patch_hash]
+                repair_round.update(status=earlier_round['status'], failing_tests=earlier_round.get('failing_tests', []),
+                                    failure_message=earlier_round.get('failure_message'), repeated=earlier_round['round'],
+                                    feedback=f"This patch is identical to the patch of round {earlier_round['round']}, which "
+                                             f"failed. Try a different fix.\n")
+                continue
+
+            patch_files = java_patch_files
+            try:
+                self.validate(repair_round, java_patch_files)
+            except Exception as e:
+                repair_round.update(status='error', error=f'Validation failed: {e}', feedback='')
+                break
+            tested_patches[patch_hash] = repair_round
+            if repair_round['status'] in ('plausible', 'error'):
+                break
+
+        return {
+            'success': bool(self.rounds) and self.rounds[-1]['status'] == 'plausible',
+            'rounds': self.rounds,
+            'patch_files': patch_files
+        }
+
+    def validate(self, repair_round: dict, java_patch_files: dict):
+        """
+        Test the patch and set the status, failing tests and feedback of the round.
+        """
+        import test_suites as ts
+        import failure_index as fi
+
+        request = (f"round-{repair_round['round']}", self.project_name, self.version, java_patch_files)
+        _, result = list(self.validation_pool.validate([request]))[0]
+        if isinstance(result, dict):
+            repair_round.update(status='error', error=result.get('error'), feedback='')
+            return
+        result = result[0]
+        if result.get('success'):
+            repair_round.update(status='plausible', feedback='')
+            return
+
+        failing_tests = result.get('failing_tests', [])
+        # The working copy is already reset; the failures come with the result, and the test files of the pristine
+        # checkout are the ones the patch was tested with
+        failure_index = {failure['test_id']: fi.FailureRecord.from_dict(failure) for failure in result.get('failures', [])}
+        try:
+            pristine_path = self.validation_pool.checkout_cache.get_pristine_checkout(self.project_name, self.version)
+            failing_test_info = ts.format_failing_test_info(pristine_path, self.project_name, failing_tests[:MAX_FEEDBACK_TESTS],
+                                                            failure_index, self.version)
+        except Exception as e:
+            print(f"Error reading failing test info: {e}")
+            failing_test_info = []
+
+        repair_round.update(
+            status='rejected',
+            failing_tests=failing_tests,
+            failure_message=(failing_test_info[0]['failure message'] or None) if failing_test_info else None,
+            compile_errors=result.get('compile_errors'),
+            stage=result.get('stage'),
+            feedback=format_test_feedback(repair_round['round'], result, failing_test_info)
+        )
@@ -0,0 +1,168 @@
+"""
+File-based work queue with leases, shared by batch workers on one machine or on machines sharing a file system.
+
+Every worker is given the same list of item ids. A worker claims an item by creating queue_dir/leases/<item>.lease
+exclusively, keeps the lease alive by touching it while it works, and marks the item done with
+queue_dir/done/<item>. A lease that has not been touched for lease_timeout seconds belongs to a crashed worker and
+can be taken over. A worker that stalls past its lease may duplicate work; results must be idempotent.
+"""
+import os
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from typing import Iterable, Iterator, Optional
+
+DEFAULT_LEASE_TIMEOUT_S = float(os.getenv('WORK_QUEUE_LEASE_TIMEOUT_S', '600'))
+
+
+def get_worker_id() -> str:
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+
+class Lease:
+    """
+    A claimed item. Use keep_alive() around the work, then complete() or release().
+    """
+
+    def __init__(self, queue: 'FileWorkQueue', item_id: str):
+        self.queue = queue
+        self.item_id = item_id
+        self.path = queue.get_lease_path(item_id)
+
+    def renew(self) -> bool:
+        """
+        Touch the lease; returns False if it was taken over by another worker.
+        """
+        try:
+            with open(self.path, 'r') as f:
+                if f.read().strip() != self.queue.worker_id:
+                    return False
+            os.utime(self.path)
+            return True
+        except OSError:
+            return False
+
+    @contextmanager
+    def keep_alive(self) -> Iterator['Lease']:
+        """
+        Renew the lease in the background every third of the lease timeout while the block runs.
+        """
+        stopped = threading.Event()
+
+        def renew_periodically():
+            while not stopped.wait(self.queue.lease_timeout / 3):
+                if not self.renew():
+                    print(f"Lost the lease on {self.item_id}")
+                    return
+
+        thread = threading.Thread(target=renew_periodically, daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stopped.set()
+            thread.join()
+
+    def complete(self):
+        """
+        Mark the item done and drop the lease.
+        """
+        with open(self.queue.get_done_path(self.item_id), 'w') as f:
+            f.write(self.queue.worker_id + '\n')
+        self.release()
+
+    def release(self):
+        """
+        Drop the lease without marking the item done, so another worker can claim it.
+        """
+        if self.renew():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class FileWorkQueue:
+
+    def __init__(self, queue_dir: str, lease_timeout: float = DEFAULT_LEASE_TIMEOUT_S, worker_id: str = None):
+        self.queue_dir = queue_dir
+        self.lease_timeout = lease_timeout
+        self.worker_id = worker_id or get_worker_id()
+        os.makedirs(os.path.join(queue_dir, 'leases'), exist_ok=True)
+        os.makedirs(os.path.join(queue_dir, 'done'), exist_ok=True)
+
+    def get_lease_path(self, item_id: str) -> str:
+        return os.path.join(self.queue_dir, 'leases', f'{item_id}.lease')
+
+    def get_done_path(self, item_id: str) -> str:
+        return os.path.join(self.queue_dir, 'done', item_id)
+
+    def is_done(self, item_id: str) -> bool:
+        return os.path.exists(self.get_done_path(item_id))
+
+    def try_claim(self, item_id: str) -> Optional[Lease]:
+        """
+        Claim the item if it is not done and not leased by a live worker.
+        """
+        if self.is_done(item_id):
+            return None
+        lease_path = self.get_lease_path(item_id)
+        try:
+            lease_age = time.time() - os.stat(lease_path).st_mtime
+        except FileNotFoundError:
+            lease_age = None
+        if lease_age is not None:
+            if lease_age < self.lease_timeout:
+                return None
+            # Expired: move it aside first, so only one of the workers racing for it can take it over
+            expired_path = f'{lease_path}.expired-{self.worker_id}'
+            try:
+                os.rename(lease_path, expired_path)
+            except FileNotFoundError:
+                return None
+            if time.time() - os.stat(expired_path).st_mtime < self.lease_timeout:
+                # Renewed between the check and the rename
+                os.rename(expired_path, lease_path)
+                return None
+            os.remove(expired_path)
+            print(f"Taking over the expired lease on {item_id}")
+
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.worker_id + '\n')
+        # Another worker may have finished the item between the done check and the claim
+        if self.is_done(item_id):
+            os.remove(lease_path)
+            return None
+        return Lease(self, item_id)
+
+    def claim(self, item_ids: Iterable[str]) -> Optional[Lease]:
+        """
+        Claim the first available item, or return None if every item is done or leased.
+        """
+        for item_id in item_ids:
+            lease = self.try_claim(item_id)
+            if lease is not None:
+                return lease
+        return None
+
+    def iterate(self, item_ids: Iterable[str], poll_interval: float = 30.0) -> Iterator[Lease]:
+        """
+        Claim items until all of them are done. While the remaining items are leased by other workers, wait for
+        them to finish or for their leases to expire.
+        """
+        item_ids = list(item_ids)
+        while True:
+            lease = self.claim(item_ids)
+            if lease is not None:
+                yield lease
+                continue
+            remaining = [item_id for item_id in item_ids if not self.is_done(item_id)]
+            if not remaining:
+                return
+            item_ids = remaining
+            time.sleep(min(poll_interval, self.lease_timeout))
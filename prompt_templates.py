@@ -1,3 +1,9 @@
+import os
+import sys
+# Add the patching_agents directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patching_agents'))
+from patch_splicer import EDIT_BLOCK_INSTRUCTIONS
+
 SYSTEM_TASK = f"""
 You are given this buggy Java code: {buggy_code_file}. Generate a patch for the bugs.
 
@@ -10,9 +16,7 @@ without any placeholder logic.
 All buggy locations should be fixed. Refactoring and commenting should not be considered fixes.
 
 The user cannot modify your code, so do not suggest incomplete code which requires others to modify.
-Suggest the full code instead of partial code or code changes.
-
-# TODO: Add the return format of the patch (.java file)
-"""
+Every replacement must be complete code, without placeholders.
+""" + EDIT_BLOCK_INSTRUCTIONS
 
 # TODO: prompts for basic, api, repair pattern, and chain of thought agents
\ No newline at end of file
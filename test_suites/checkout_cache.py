@@ -0,0 +1,204 @@
+import os
+import shutil
+import fcntl
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+import test_suites_helpers as tsh
+
+DEFAULT_CACHE_DIR = os.getenv('CHECKOUT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'defects4j_checkout_cache'))
+
+# Marker written into a pristine checkout once it is complete
+PRISTINE_MARKER = '.pristine_complete'
+
+# Files defects4j writes into a working directory while testing
+TEST_OUTPUT_FILES = ['failing_tests', 'all_tests']
+
+
+class WorkingCopy:
+    """
+    A working directory created from a pristine checkout. Patches must be applied through apply_java_file_patch
+    so the modified files can be restored when the working copy is recycled.
+    """
+
+    def __init__(self, path: str, pristine_path: str, lock_file):
+        self.path = path
+        self.pristine_path = pristine_path
+        self.lock_file = lock_file
+        self.modified_paths: List[str] = []
+
+    def apply_java_file_patch(self, java_file: str, target_file_path: str) -> bool:
+        self.modified_paths.append(target_file_path)
+        return tsh.apply_java_file_patch(java_file, target_file_path)
+
+    def reset(self):
+        """
+        Restore the modified files from the pristine checkout and remove the test outputs.
+        Restored files are copied (not linked) so they are newer than the classes compiled from the patch,
+        which makes the next build recompile them.
+        """
+        for modified_path in self.modified_paths:
+            pristine_file = os.path.join(self.pristine_path, os.path.relpath(modified_path, self.path))
+            if os.path.lexists(modified_path):
+                os.remove(modified_path)
+            if os.path.exists(pristine_file):
+                shutil.copyfile(pristine_file, modified_path)
+        self.modified_paths = []
+
+        for test_output_file in TEST_OUTPUT_FILES:
+            test_output_path = os.path.join(self.path, test_output_file)
+            if os.path.exists(test_output_path):
+                os.remove(test_output_path)
+
+
+class CheckoutCache:
+    """
+    Cache of pristine Defects4J checkouts keyed by (project, version), from which cheap working copies are made.
+
+    Working copies are made with reflinks (copy-on-write) when the file system supports them. Otherwise Java sources
+    and git objects, which are only ever read or replaced, are hard linked and everything else (e.g. build outputs,
+    which the build overwrites in place) is copied. Working copies are recycled after use instead of being deleted.
+    File locks make the cache safe to share between processes.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, compile_pristine: bool = True):
+        """
+        Parameters:
+        - cache_dir: Directory holding the pristine checkouts and working copies
+        - compile_pristine: Compile each pristine checkout once so working copies only recompile the patched files
+        """
+        self.cache_dir = cache_dir
+        self.compile_pristine = compile_pristine
+        self.supports_reflink: Optional[bool] = None
+        os.makedirs(os.path.join(cache_dir, 'pristine'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'work'), exist_ok=True)
+        os.makedirs(os.path.join(cache_dir, 'locks'), exist_ok=True)
+
+    def get_bug_key(self, project_name: str, version: str) -> str:
+        return f'{project_name.lower()}_{version}b'
+
+    def get_pristine_checkout(self, project_name: str, version: str) -> Optional[str]:
+        """
+        Return the path of the pristine checkout, checking it out on first use.
+        """
+        bug_key = self.get_bug_key(project_name, version)
+        pristine_path = os.path.join(self.cache_dir, 'pristine', bug_key)
+        if os.path.exists(os.path.join(pristine_path, PRISTINE_MARKER)):
+            return pristine_path
+
+        with open(os.path.join(self.cache_dir, 'locks', f'{bug_key}.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            # Another process may have finished the checkout while we waited for the lock
+            if os.path.exists(os.path.join(pristine_path, PRISTINE_MARKER)):
+                return pristine_path
+
+            if os.path.exists(pristine_path):
+                shutil.rmtree(pristine_path)
+            if not tsh.checkout_defects4j_project(project_name, version, pristine_path):
+                return None
+            tsh.get_metadata_store().record_checkout_properties(project_name, version, pristine_path)
+            if self.compile_pristine:
+                compiled, output = tsh.compile_defects4j_project(pristine_path)
+                if not compiled:
+                    print(f"Warning: pristine checkout {bug_key} does not compile: {output[-500:]}")
+            open(os.path.join(pristine_path, PRISTINE_MARKER), 'w').close()
+        return pristine_path
+
+    @contextmanager
+    def working_copy(self, project_name: str, version: str) -> Iterator[WorkingCopy]:
+        """
+        Lease a working copy of the buggy version. It is reset and returned to the pool when the block exits.
+        """
+        working_copy = self.acquire(project_name, version)
+        try:
+            yield working_copy
+        finally:
+            self.release(working_copy)
+
+    def acquire(self, project_name: str, version: str) -> WorkingCopy:
+        pristine_path = self.get_pristine_checkout(project_name, version)
+        if pristine_path is None:
+            raise RuntimeError(f"Failed to checkout {project_name}-{version}b")
+
+        bug_key = self.get_bug_key(project_name, version)
+        index = 0
+        while True:
+            path = os.path.join(self.cache_dir, 'work', f'{bug_key}_{index}')
+            lock_file = open(os.path.join(self.cache_dir, 'locks', f'{bug_key}_{index}.lock'), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # In use by another thread or process
+                lock_file.close()
+                index += 1
+                continue
+
+            if not os.path.exists(path):
+                # Copy next to the final path and rename, so a crash never leaves a half-copied working copy
+                partial_path = path + '.partial'
+                try:
+                    if os.path.exists(partial_path):
+                        shutil.rmtree(partial_path)
+                    self.copy_tree(pristine_path, partial_path)
+                    os.rename(partial_path, path)
+                except Exception as e:
+                    # Give the slot back, so it can be retried by this or another process
+                    shutil.rmtree(partial_path, ignore_errors=True)
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+                    raise RuntimeError(f"Failed to create working copy {path}: {e}") from e
+            return WorkingCopy(path, pristine_path, lock_file)
+
+    def release(self, working_copy: WorkingCopy):
+        try:
+            working_copy.reset()
+        except Exception as e:
+            # A working copy that cannot be reset is discarded; the next lease recreates it
+            print(f"Error resetting working copy {working_copy.path}: {e}")
+            shutil.rmtree(working_copy.path, ignore_errors=True)
+        finally:
+            fcntl.flock(working_copy.lock_file, fcntl.LOCK_UN)
+            working_copy.lock_file.close()
+
+    def copy_tree(self, source_dir: str, target_dir: str):
+        if self.supports_reflink is None:
+            self.supports_reflink = self.check_reflink_support()
+
+        if self.supports_reflink:
+            result = subprocess.run(['cp', '-a', '--reflink=always', source_dir, target_dir], capture_output=True, text=True)
+            if result.returncode == 0:
+                return
+            print(f"Reflink copy failed, falling back to links: {result.stderr}")
+            shutil.rmtree(target_dir, ignore_errors=True)
+
+        shutil.copytree(source_dir, target_dir, symlinks=True, copy_function=link_or_copy)
+
+    def check_reflink_support(self) -> bool:
+        probe_source = os.path.join(self.cache_dir, 'locks', '.reflink_probe')
+        probe_target = probe_source + '.copy'
+        with open(probe_source, 'w') as f:
+            f.write('probe')
+        try:
+            result = subprocess.run(['cp', '--reflink=always', probe_source, probe_target], capture_output=True)
+            return result.returncode == 0
+        except FileNotFoundError:
+            return False
+        finally:
+            for probe_path in (probe_source, probe_target):
+                if os.path.exists(probe_path):
+                    os.remove(probe_path)
+
+
+def link_or_copy(source_path: str, target_path: str):
+    """
+    Hard link files that are never modified in place (Java sources are replaced by apply_java_file_patch and
+    git objects are immutable); copy everything else.
+    """
+    if source_path.endswith('.java') or f'{os.sep}.git{os.sep}objects{os.sep}' in source_path:
+        try:
+            os.link(source_path, target_path)
+            return target_path
+        except OSError:
+            pass
+    return shutil.copy2(source_path, target_path)
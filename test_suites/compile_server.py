@@ -0,0 +1,209 @@
+import os
+import time
+import queue
+import atexit
+import fcntl
+import tempfile
+import threading
+import subprocess
+from typing import Dict, List, Tuple
+from defects4j_metadata import get_metadata_store
+
+JAVA_SOURCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'java')
+JAVA_BUILD_DIR = os.getenv('JAVA_SERVER_BUILD_DIR', os.path.join(tempfile.gettempdir(), 'apr_java_servers'))
+JAVA_HOME = os.getenv('JAVA_HOME')
+JAVA_SOURCE_ENCODING = os.getenv('JAVA_SOURCE_ENCODING', 'UTF-8')
+DEFAULT_COMPILE_TIMEOUT_S = float(os.getenv('COMPILE_SERVER_TIMEOUT_S', '120'))
+
+
+def get_java_tool(tool_name: str) -> str:
+    if JAVA_HOME:
+        return os.path.join(JAVA_HOME, 'bin', tool_name)
+    return tool_name
+
+
+def unescape(text: str) -> str:
+    """
+    Undo the escaping the Java servers apply to messages (backslash, tab and newline).
+    """
+    result = []
+    index = 0
+    while index < len(text):
+        if text[index] == '\\' and index + 1 < len(text):
+            result.append({'n': '\n', 't': '\t', '\\': '\\'}.get(text[index + 1], text[index + 1]))
+            index += 2
+        else:
+            result.append(text[index])
+            index += 1
+    return ''.join(result)
+
+
+def build_java_server(class_name: str) -> str:
+    """
+    Compile test_suites/java/<class_name>.java into JAVA_BUILD_DIR unless an up-to-date class is already there.
+
+    Returns: the directory to put on the classpath of the server
+    """
+    source_path = os.path.join(JAVA_SOURCE_DIR, f'{class_name}.java')
+    class_path = os.path.join(JAVA_BUILD_DIR, f'{class_name}.class')
+    os.makedirs(JAVA_BUILD_DIR, exist_ok=True)
+
+    with open(os.path.join(JAVA_BUILD_DIR, f'{class_name}.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not os.path.exists(class_path) or os.path.getmtime(class_path) < os.path.getmtime(source_path):
+            # Target Java 8, the version Defects4J runs on
+            result = subprocess.run(
+                [get_java_tool('javac'), '-source', '8', '-target', '8', '-nowarn', '-d', JAVA_BUILD_DIR, source_path],
+                capture_output=True,
+                text=True
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"Failed to compile {class_name}: {result.stderr}")
+    return JAVA_BUILD_DIR
+
+
+class CompileServer:
+    """
+    Client for a long-lived CompileServer JVM that recompiles patched source files against the prebuilt classes of a
+    checkout with the in-process javax.tools compiler. The JVM, the compiler and the opened classpath stay warm
+    between requests, so recompiling one file takes well under a second instead of a full Ant build.
+
+    A request that gets no answer within timeout_s kills the JVM; the next request starts a new one.
+    """
+
+    def __init__(self, classpath: List[str], encoding: str = JAVA_SOURCE_ENCODING, timeout_s: float = DEFAULT_COMPILE_TIMEOUT_S):
+        self.classpath = classpath
+        self.encoding = encoding
+        self.timeout_s = timeout_s
+        self.process = None
+        self.output_lines = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        server_dir = build_java_server('CompileServer')
+        self.process = subprocess.Popen(
+            [get_java_tool('java'), '-cp', server_dir, 'CompileServer', os.pathsep.join(self.classpath), self.encoding],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            bufsize=1
+        )
+        # Read the output on a thread, so a hung JVM cannot block read_response past its deadline
+        self.output_lines = queue.Queue()
+        threading.Thread(target=read_lines, args=(self.process.stdout, self.output_lines), daemon=True).start()
+
+    def compile(self, source_files: List[str], output_dir: str) -> dict:
+        """
+        Compile the source files into output_dir.
+
+        Returns: dict of {'success': bool, 'diagnostics': list of {'kind', 'source', 'line', 'column', 'message'}}
+        """
+        request = '\t'.join(['COMPILE', output_dir] + [os.path.abspath(source_file) for source_file in source_files])
+        with self.lock:
+            for attempt in range(2):
+                if self.process is None or self.process.poll() is not None:
+                    self.start()
+                try:
+                    self.process.stdin.write(request + '\n')
+                    self.process.stdin.flush()
+                    return self.read_response()
+                except (BrokenPipeError, EOFError) as e:
+                    # The JVM died (e.g. out of memory); restart it once and retry
+                    print(f"Compile server stopped ({e}), restarting")
+                    self.process = None
+                except TimeoutError as e:
+                    # The same request would likely hang again, so it is not retried
+                    print(f"{e}, killing it")
+                    self.kill()
+                    return {'success': False, 'diagnostics': [{'kind': 'ERROR', 'source': '', 'line': -1, 'column': -1,
+                                                              'message': str(e)}]}
+        return {'success': False, 'diagnostics': [{'kind': 'ERROR', 'source': '', 'line': -1, 'column': -1,
+                                                  'message': 'Compile server keeps stopping'}]}
+
+    def read_response(self) -> dict:
+        diagnostics = []
+        deadline = time.monotonic() + self.timeout_s
+        while True:
+            try:
+                line = self.output_lines.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                raise TimeoutError(f'Compile server did not answer within {self.timeout_s:.0f} s')
+            if line is None:
+                raise EOFError('Compile server closed its output')
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'DONE':
+                return {'success': parts[1] == 'true', 'diagnostics': diagnostics}
+            if parts[0] == 'DIAG' and len(parts) >= 6:
+                diagnostics.append({
+                    'kind': parts[1],
+                    'source': unescape(parts[2]),
+                    'line': int(parts[3]),
+                    'column': int(parts[4]),
+                    'message': unescape('\t'.join(parts[5:]))
+                })
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def kill(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+
+def read_lines(stream, lines: queue.Queue):
+    """
+    Put every line of the stream on the queue, then None at end of file.
+    """
+    try:
+        for line in stream:
+            lines.put(line)
+    except (OSError, ValueError):
+        pass
+    lines.put(None)
+
+
+def get_checkout_classpath(project_name: str, version: str, working_dir: str, classpath_property: str) -> List[str]:
+    """
+    Return a classpath of a checkout from the metadata store, recording the checkout properties if they are unknown.
+    """
+    metadata_store = get_metadata_store()
+    classpath = metadata_store.get_checkout_property(project_name, version, classpath_property, working_dir)
+    if classpath is None:
+        metadata_store.record_checkout_properties(project_name, version, working_dir)
+        classpath = metadata_store.get_checkout_property(project_name, version, classpath_property, working_dir)
+    if not classpath:
+        raise RuntimeError(f"No {classpath_property} known for {project_name}-{version}b")
+    return [entry for entry in classpath.split(os.pathsep) if entry]
+
+
+_compile_servers: Dict[Tuple[str, str, str], CompileServer] = {}
+_compile_servers_lock = threading.Lock()
+
+
+def get_compile_server(project_name: str, version: str, pristine_path: str) -> CompileServer:
+    """
+    Return the compile server of a (compiled) pristine checkout, starting it on first use.
+    """
+    key = (project_name.lower(), str(version), os.path.abspath(pristine_path))
+    with _compile_servers_lock:
+        if key not in _compile_servers:
+            classpath = get_checkout_classpath(project_name, version, pristine_path, 'cp.compile')
+            _compile_servers[key] = CompileServer(classpath)
+        return _compile_servers[key]
+
+
+@atexit.register
+def close_compile_servers():
+    for compile_server in _compile_servers.values():
+        compile_server.close()
+    _compile_servers.clear()
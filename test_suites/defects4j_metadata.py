@@ -0,0 +1,217 @@
+"""
+Persistent store of Defects4J metadata, so lookups during a sweep do not start a defects4j (Perl) process.
+
+Bug-level metadata (modified classes, triggering and relevant tests) is exported for all bugs of a project with a
+single `defects4j query`. Checkout-level properties (source/test directories, classpaths) need a checkout and are
+recorded with `defects4j export` the first time a checkout of the bug is available.
+
+Usage:
+    python defects4j_metadata.py --export [--project Chart --project Lang]
+"""
+import os
+import csv
+import json
+import sqlite3
+import argparse
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+DEFAULT_METADATA_PATH = os.getenv(
+    'DEFECTS4J_METADATA_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'defects4j_metadata.sqlite')
+)
+
+# `defects4j query` fields exported for every bug; all of them are ';'-separated lists
+BUG_FIELDS = ['classes.modified', 'classes.relevant.src', 'classes.relevant.test', 'tests.trigger', 'tests.relevant']
+
+# `defects4j export` properties recorded per checkout
+CHECKOUT_PROPERTIES = ['dir.src.classes', 'dir.src.tests', 'dir.bin.classes', 'dir.bin.tests', 'cp.compile', 'cp.test']
+
+
+class Defects4JMetadataStore:
+    """
+    SQLite-backed metadata store with an in-process cache in front of it, so repeated lookups are dict lookups.
+    """
+
+    def __init__(self, metadata_path: str = DEFAULT_METADATA_PATH):
+        self.metadata_path = metadata_path
+        self.local = threading.local()
+        self.cache: Dict[tuple, object] = {}
+        connection = self.get_connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS bug_metadata (
+                project TEXT NOT NULL,
+                bug_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (project, bug_id, field)
+            )
+        """)
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS checkout_properties (
+                project TEXT NOT NULL,
+                bug_id TEXT NOT NULL,
+                property TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (project, bug_id, property)
+            )
+        """)
+        connection.commit()
+
+    def get_connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = sqlite3.connect(self.metadata_path, timeout=30)
+        return self.local.connection
+
+    ########################
+    # EXPORT
+    ########################
+
+    def export_project(self, project_name: str) -> int:
+        """
+        Export the bug-level metadata of all bugs of a project with one `defects4j query`.
+
+        Returns: number of bugs exported
+        """
+        result = subprocess.run(
+            ['defects4j', 'query', '-p', project_name, '-q', ','.join(BUG_FIELDS)],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            print(f"Failed to query {project_name}: {result.stderr}")
+            return 0
+
+        rows = []
+        for row in csv.reader(result.stdout.splitlines()):
+            if len(row) != len(BUG_FIELDS) + 1:
+                continue
+            bug_id = row[0]
+            for field, value in zip(BUG_FIELDS, row[1:]):
+                values = [item.strip() for item in value.split(';') if item.strip()]
+                rows.append((project_name.lower(), bug_id, field, json.dumps(values)))
+
+        connection = self.get_connection()
+        connection.executemany('INSERT OR REPLACE INTO bug_metadata VALUES (?, ?, ?, ?)', rows)
+        connection.commit()
+        self.cache.clear()
+        return len(rows) // len(BUG_FIELDS)
+
+    def export_all(self, project_names: List[str] = None) -> int:
+        if not project_names:
+            result = subprocess.run(['defects4j', 'pids'], capture_output=True, text=True)
+            project_names = [line.strip() for line in result.stdout.splitlines() if line.strip()]
+        return sum(self.export_project(project_name) for project_name in project_names)
+
+    def set_bug_field(self, project_name: str, version: str, field: str, values: List[str]):
+        """
+        Store one bug-level field, e.g. when it was looked up for a bug that has not been exported yet.
+        """
+        connection = self.get_connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO bug_metadata VALUES (?, ?, ?, ?)',
+            (project_name.lower(), str(version), field, json.dumps(values))
+        )
+        connection.commit()
+        self.cache[('bug', project_name.lower(), str(version), field)] = values
+
+    def record_checkout_properties(self, project_name: str, version: str, working_dir: str):
+        """
+        Record the checkout-level properties of a bug from an existing checkout, unless they are already known.
+        """
+        if self.get_checkout_property(project_name, version, CHECKOUT_PROPERTIES[0]) is not None:
+            return
+
+        rows = []
+        for checkout_property in CHECKOUT_PROPERTIES:
+            result = subprocess.run(
+                ['defects4j', 'export', '-p', checkout_property, '-w', working_dir],
+                capture_output=True,
+                text=True,
+                cwd=working_dir
+            )
+            if result.returncode != 0:
+                print(f"Failed to export {checkout_property}: {result.stderr}")
+                continue
+            value = result.stdout.strip()
+            # Classpaths are absolute paths into this checkout; store them relative to it so any copy can use them
+            value = value.replace(os.path.abspath(working_dir), '${working_dir}')
+            rows.append((project_name.lower(), str(version), checkout_property, value))
+
+        connection = self.get_connection()
+        connection.executemany('INSERT OR REPLACE INTO checkout_properties VALUES (?, ?, ?, ?)', rows)
+        connection.commit()
+        self.cache.clear()
+
+    ########################
+    # LOOKUPS
+    ########################
+
+    def get_bug_field(self, project_name: str, version: str, field: str) -> Optional[List[str]]:
+        key = ('bug', project_name.lower(), str(version), field)
+        if key not in self.cache:
+            row = self.get_connection().execute(
+                'SELECT value FROM bug_metadata WHERE project = ? AND bug_id = ? AND field = ?', key[1:]
+            ).fetchone()
+            self.cache[key] = json.loads(row[0]) if row else None
+        return self.cache[key]
+
+    def get_checkout_property(self, project_name: str, version: str, checkout_property: str, working_dir: str = None) -> Optional[str]:
+        key = ('checkout', project_name.lower(), str(version), checkout_property)
+        if key not in self.cache:
+            row = self.get_connection().execute(
+                'SELECT value FROM checkout_properties WHERE project = ? AND bug_id = ? AND property = ?', key[1:]
+            ).fetchone()
+            self.cache[key] = row[0] if row else None
+        value = self.cache[key]
+        if value is not None and working_dir is not None:
+            value = value.replace('${working_dir}', os.path.abspath(working_dir))
+        return value
+
+    def get_modified_classes(self, project_name: str, version: str) -> Optional[List[str]]:
+        return self.get_bug_field(project_name, version, 'classes.modified')
+
+    def get_trigger_tests(self, project_name: str, version: str) -> Optional[List[str]]:
+        return self.get_bug_field(project_name, version, 'tests.trigger')
+
+    def get_relevant_tests(self, project_name: str, version: str) -> Optional[List[str]]:
+        return self.get_bug_field(project_name, version, 'tests.relevant')
+
+    def get_source_dir(self, project_name: str, version: str) -> Optional[str]:
+        return self.get_checkout_property(project_name, version, 'dir.src.classes')
+
+    def get_test_dir(self, project_name: str, version: str) -> Optional[str]:
+        return self.get_checkout_property(project_name, version, 'dir.src.tests')
+
+
+_metadata_store: Optional[Defects4JMetadataStore] = None
+_metadata_store_lock = threading.Lock()
+
+
+def get_metadata_store() -> Defects4JMetadataStore:
+    """
+    Return the process-wide metadata store.
+    """
+    global _metadata_store
+    with _metadata_store_lock:
+        if _metadata_store is None:
+            _metadata_store = Defects4JMetadataStore()
+    return _metadata_store
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Export Defects4J metadata into a local store.')
+    argument_parser.add_argument('--export', action='store_true', help='Export bug metadata for all (or the given) projects')
+    argument_parser.add_argument('--project', action='append', default=[], help='Project to export (repeatable)')
+    argument_parser.add_argument('--output', default=DEFAULT_METADATA_PATH, help='Path of the metadata store')
+    args = argument_parser.parse_args()
+
+    store = Defects4JMetadataStore(args.output)
+    if args.export:
+        print(f"Exported metadata of {store.export_all(args.project)} bugs to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import os
+import signal
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, List, Optional
+
+# Seconds between reads of the failing_tests file while the tests run
+FAILING_TESTS_POLL_INTERVAL = 0.2
+# Seconds a cancelled run gets to exit after SIGTERM before its process group is killed
+CANCEL_GRACE_PERIOD = 5
+# Lines of output kept for error reports
+OUTPUT_TAIL_LINES = 200
+
+
+class Defects4JTestRun:
+    """
+    A `defects4j test` run whose failing tests are reported while it runs.
+
+    Defects4J's JUnit formatter appends a "--- test id" section to the failing_tests file of the working directory
+    as soon as a test fails, while the "  - test id" summary on stdout only appears after the last test. The file
+    is tailed so failures are seen early, and the run can be cancelled as soon as a failure makes the rest of it
+    pointless. The run gets its own process group, so cancelling also stops the Ant and JUnit JVMs it forked.
+    """
+
+    def __init__(self, working_dir: str, test: str = None, relevant: bool = False,
+                 on_failing_test: Callable[[str], None] = None, stop_on_failure: bool = False,
+                 cancel_event: threading.Event = None):
+        """
+        Parameters:
+        - working_dir: Absolute path to the project directory
+        - test: Test identifier passed to `defects4j test -t`; None runs the full suite
+        - relevant: Only run the tests relevant to the bug (`defects4j test -r`)
+        - on_failing_test: Called with each failing test identifier as soon as it is seen
+        - stop_on_failure: Cancel the run at the first failing test
+        - cancel_event: Cancel the run when this event is set (e.g. by a caller that no longer needs the result)
+        """
+        self.working_dir = working_dir
+        self.command = ['defects4j', 'test', '-w', working_dir]
+        if test:
+            self.command += ['-t', test]
+        elif relevant:
+            self.command.append('-r')
+        self.on_failing_test = on_failing_test
+        self.stop_on_failure = stop_on_failure
+        self.cancel_event = cancel_event
+        self.finished = threading.Event()
+
+        self.process: Optional[subprocess.Popen] = None
+        self.failing_tests: List[str] = []
+        self.output_tail = deque(maxlen=OUTPUT_TAIL_LINES)
+        self.failing_tests_offset = 0
+        self.cancelled = False
+        self.lock = threading.Lock()
+
+    def run(self) -> dict:
+        """
+        Run the tests to completion or cancellation.
+
+        Returns:
+        - dict: {'success', 'failing_tests', 'return_code', 'cancelled'}. The failing tests of a cancelled run are
+          the ones seen before it was cancelled.
+        """
+        failing_tests_path = os.path.join(self.working_dir, 'failing_tests')
+        # A recycled working directory may still hold the failing_tests file of an earlier run
+        if os.path.exists(failing_tests_path):
+            os.remove(failing_tests_path)
+
+        try:
+            self.process = subprocess.Popen(
+                self.command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+                errors='replace',
+                cwd=self.working_dir,
+                start_new_session=True
+            )
+        except Exception as e:
+            print(f"Error running tests: {e}")
+            return {'success': False, 'failing_tests': [], 'return_code': -1, 'cancelled': False}
+
+        watcher = threading.Thread(target=self.watch_failing_tests, args=(failing_tests_path,), daemon=True)
+        watcher.start()
+        # Ant and JVM warnings go to stderr; drain it without parsing, so none of it is taken for a failing test
+        stderr_reader = threading.Thread(target=self.drain_stderr, daemon=True)
+        stderr_reader.start()
+        try:
+            for line in self.process.stdout:
+                self.output_tail.append(line)
+                stripped = line.strip()
+                if stripped.startswith('- '):
+                    self.report_failing_test(stripped[2:].strip())
+            return_code = self.process.wait()
+        finally:
+            self.finished.set()
+            watcher.join()
+            if self.process.poll() is None:
+                self.kill_process_group(signal.SIGKILL)
+                self.process.wait()
+            stderr_reader.join()
+
+        # Pick up failures written just before the process exited
+        self.read_new_failing_tests(failing_tests_path)
+        return {
+            'success': return_code == 0 and not self.failing_tests and not self.cancelled,
+            'failing_tests': list(self.failing_tests),
+            'return_code': return_code,
+            'cancelled': self.cancelled
+        }
+
+    def drain_stderr(self):
+        for line in self.process.stderr:
+            self.output_tail.append(line)
+
+    def cancel(self):
+        """
+        Stop the run: SIGTERM to its process group, then SIGKILL if it has not exited after the grace period.
+        """
+        with self.lock:
+            if self.cancelled or self.process is None or self.process.poll() is not None:
+                return
+            self.cancelled = True
+        self.kill_process_group(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=CANCEL_GRACE_PERIOD)
+        except subprocess.TimeoutExpired:
+            self.kill_process_group(signal.SIGKILL)
+
+    def kill_process_group(self, sig: int):
+        try:
+            os.killpg(self.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def report_failing_test(self, test_id: str):
+        with self.lock:
+            if not test_id or test_id in self.failing_tests:
+                return
+            self.failing_tests.append(test_id)
+        if self.on_failing_test is not None:
+            self.on_failing_test(test_id)
+        if self.stop_on_failure:
+            # Cancelling waits for the process; do not block the reader of its output
+            threading.Thread(target=self.cancel, daemon=True).start()
+
+    def watch_failing_tests(self, failing_tests_path: str):
+        while not self.finished.wait(FAILING_TESTS_POLL_INTERVAL):
+            self.read_new_failing_tests(failing_tests_path)
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                self.cancel()
+                return
+
+    def read_new_failing_tests(self, failing_tests_path: str):
+        """
+        Report the "--- test id" lines appended to the failing_tests file since the last read.
+        """
+        try:
+            with open(failing_tests_path, 'rb') as f:
+                f.seek(self.failing_tests_offset)
+                for line in f:
+                    # Leave an incomplete last line for the next read
+                    if not line.endswith(b'\n'):
+                        break
+                    self.failing_tests_offset += len(line)
+                    if line.startswith(b'--- '):
+                        self.report_failing_test(line[4:].decode('utf-8', errors='replace').strip())
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,170 @@
+"""
+Single-pass parser for the failing_tests file `defects4j test` writes.
+
+The file holds one section per failing test:
+
+    --- org.foo.BarTest::testBaz
+    java.lang.AssertionError: expected:<1> but was:<2>
+        at org.junit.Assert.fail(Assert.java:88)
+        ...
+        at org.foo.BarTest.testBaz(BarTest.java:42)
+        ...
+
+Sections of a timed-out or looping test can be megabytes of frames, so the file is read line by line and only a
+bounded prefix of each stack trace is kept: memory use does not depend on the size of the file.
+"""
+import os
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Frames kept per failure; the rest are only counted
+MAX_FRAMES = int(os.getenv('FAILURE_INDEX_MAX_FRAMES', '40'))
+# Characters kept of an exception message (messages of assertion failures can embed whole documents)
+MAX_MESSAGE_LENGTH = 2000
+
+SECTION_PREFIX = '--- '
+FRAME_PATTERN = re.compile(r'^at (?P<method>[^(]+)\((?P<location>[^)]*)\)')
+
+
+class FailureRecord:
+    """
+    The failure of one test: exception type, message, the first MAX_FRAMES stack frames and the line of the
+    test method that failed.
+    """
+
+    def __init__(self, test_id: str):
+        self.test_id = test_id
+        self.exception = ''
+        self.message = ''
+        self.frames: List[str] = []
+        self.frame_count = 0
+        self.test_line = -1
+        self.test_frame_prefix = test_id.replace('::', '.') + '('
+
+    @property
+    def test_class(self) -> str:
+        return self.test_id.split('::')[0]
+
+    @property
+    def test_method(self) -> str:
+        return self.test_id.split('::')[1] if '::' in self.test_id else ''
+
+    @property
+    def failure_message(self) -> str:
+        """
+        The exception line of the trace ("exception: message"), as get_failure_message returns it.
+        """
+        if self.message:
+            return f'{self.exception}: {self.message}'
+        return self.exception
+
+    def add_line(self, line: str):
+        stripped = line.strip()
+        if not stripped.startswith('at '):
+            if self.frame_count == 0:
+                self.add_message_line(line)
+            return
+
+        self.frame_count += 1
+        if len(self.frames) < MAX_FRAMES:
+            self.frames.append(stripped[3:])
+        # Only frames of the test method itself are parsed further
+        if self.test_line == -1 and stripped.startswith(self.test_frame_prefix, 3):
+            match = FRAME_PATTERN.match(stripped)
+            location = match.group('location') if match else ''
+            if ':' in location:
+                try:
+                    self.test_line = int(location.rsplit(':', 1)[1])
+                except ValueError:
+                    pass
+
+    def add_message_line(self, line: str):
+        if not self.exception:
+            # The first line is "exception" or "exception: message"
+            exception, _, message = line.strip().partition(': ')
+            self.exception = exception
+            self.message = message[:MAX_MESSAGE_LENGTH]
+        elif len(self.message) < MAX_MESSAGE_LENGTH:
+            # Multi-line messages continue until the first frame
+            self.message = (self.message + '\n' + line.rstrip('\n'))[:MAX_MESSAGE_LENGTH]
+
+    def to_dict(self) -> dict:
+        return {
+            'test_id': self.test_id,
+            'exception': self.exception,
+            'message': self.message,
+            'frames': self.frames,
+            'frame_count': self.frame_count,
+            'test_line': self.test_line
+        }
+
+    @classmethod
+    def from_dict(cls, record_dict: dict) -> 'FailureRecord':
+        record = cls(record_dict['test_id'])
+        record.exception = record_dict.get('exception', '')
+        record.message = record_dict.get('message', '')
+        record.frames = list(record_dict.get('frames', []))
+        record.frame_count = record_dict.get('frame_count', len(record.frames))
+        record.test_line = record_dict.get('test_line', -1)
+        return record
+
+
+def iter_failure_records(lines: Iterable[str], test_ids: Optional[set] = None) -> Iterator[FailureRecord]:
+    """
+    Yield a FailureRecord per section of a failing_tests stream. If test_ids is given, the lines of other
+    sections are skipped without being parsed.
+    """
+    record = None
+    for line in lines:
+        if line.startswith(SECTION_PREFIX):
+            if record is not None:
+                yield record
+            test_id = line[len(SECTION_PREFIX):].strip()
+            record = FailureRecord(test_id) if test_ids is None or test_id in test_ids else None
+        elif record is not None and line.strip():
+            record.add_line(line)
+    if record is not None:
+        yield record
+
+
+def build_failure_index(lines: Iterable[str], test_ids: Optional[Iterable[str]] = None) -> Dict[str, FailureRecord]:
+    """
+    Index the sections of a failing_tests stream by test identifier. The first section of a test wins.
+    """
+    wanted = set(test_ids) if test_ids is not None else None
+    index = {}
+    for record in iter_failure_records(lines, wanted):
+        index.setdefault(record.test_id, record)
+    return index
+
+
+def read_failure_index(failing_tests_path: str, test_ids: Optional[Iterable[str]] = None) -> Dict[str, FailureRecord]:
+    """
+    Index the failing_tests file of a working directory. Returns an empty index if the file does not exist.
+    """
+    try:
+        with open(failing_tests_path, 'r', encoding='utf-8', errors='replace') as f:
+            return build_failure_index(f, test_ids)
+    except FileNotFoundError:
+        return {}
+
+
+def format_failures_for_prompt(records: Iterable[FailureRecord], max_frames: int = 8) -> str:
+    """
+    Describe failures for an agent prompt: the failing test, its exception and message, the failing test line
+    and the top stack frames.
+    """
+    result = ''
+    for record in records:
+        result += f'Failing test: {record.test_id}\n'
+        result += f'Failure: {record.failure_message or "unknown"}\n'
+        if record.test_line != -1:
+            result += f'Failing line in test: {record.test_line}\n'
+        if record.frames:
+            result += 'Stack trace:\n'
+            for frame in record.frames[:max_frames]:
+                result += f'    at {frame}\n'
+            if record.frame_count > max_frames:
+                result += f'    ... {record.frame_count - max_frames} more\n'
+        result += '\n'
+    return result
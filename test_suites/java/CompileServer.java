@@ -0,0 +1,108 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.Charset;
+import java.util.ArrayList;
+import java.util.Arrays;
+import java.util.Collections;
+import java.util.List;
+import java.util.Locale;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.StandardLocation;
+import javax.tools.ToolProvider;
+
+/**
+ * Long-lived compile service for one checkout. Keeps the compiler and its file manager (with the opened
+ * classpath jars) warm and recompiles only the requested source files against the prebuilt classes.
+ *
+ * Usage: java CompileServer <classpath> <encoding>
+ *
+ * Protocol (one request per line on stdin, tab-separated):
+ *   COMPILE \t output dir \t source file \t source file ...
+ * Response on stdout:
+ *   DIAG \t kind \t source \t line \t column \t message     (zero or more)
+ *   DONE \t true|false
+ * Messages are escaped so that they contain no tabs or newlines.
+ */
+public class CompileServer {
+
+    public static void main(String[] args) throws Exception {
+        if (args.length < 2) {
+            System.err.println("Usage: java CompileServer <classpath> <encoding>");
+            System.exit(2);
+        }
+        String classpath = args[0];
+        String encoding = args[1];
+
+        JavaCompiler compiler = ToolProvider.getSystemJavaCompiler();
+        if (compiler == null) {
+            System.err.println("No system Java compiler; run the server with a JDK, not a JRE");
+            System.exit(2);
+        }
+        StandardJavaFileManager fileManager =
+                compiler.getStandardFileManager(null, Locale.ROOT, Charset.forName(encoding));
+
+        List<File> classpathEntries = new ArrayList<File>();
+        for (String entry : classpath.split(File.pathSeparator)) {
+            if (!entry.isEmpty()) {
+                classpathEntries.add(new File(entry));
+            }
+        }
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        PrintStream out = new PrintStream(System.out, true, "UTF-8");
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t");
+            if (parts.length < 3 || !parts[0].equals("COMPILE")) {
+                out.println("DONE\tfalse");
+                continue;
+            }
+            File outputDir = new File(parts[1]);
+            outputDir.mkdirs();
+
+            // Classes compiled from the patch go first, so they shadow the prebuilt ones
+            List<File> requestClasspath = new ArrayList<File>();
+            requestClasspath.add(outputDir);
+            requestClasspath.addAll(classpathEntries);
+            fileManager.setLocation(StandardLocation.CLASS_OUTPUT, Collections.singletonList(outputDir));
+            fileManager.setLocation(StandardLocation.CLASS_PATH, requestClasspath);
+            // Never pick up other sources from the classpath; everything else is prebuilt
+            fileManager.setLocation(StandardLocation.SOURCE_PATH, Collections.<File>emptyList());
+
+            List<File> sources = new ArrayList<File>();
+            for (int i = 2; i < parts.length; i++) {
+                sources.add(new File(parts[i]));
+            }
+
+            DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<JavaFileObject>();
+            boolean success;
+            try {
+                Iterable<? extends JavaFileObject> units = fileManager.getJavaFileObjectsFromFiles(sources);
+                List<String> options = Arrays.asList("-g", "-nowarn", "-encoding", encoding, "-implicit:none");
+                success = compiler.getTask(null, fileManager, diagnostics, options, null, units).call();
+            } catch (RuntimeException e) {
+                out.println("DIAG\tERROR\t\t-1\t-1\t" + escape(String.valueOf(e)));
+                success = false;
+            }
+
+            for (Diagnostic<? extends JavaFileObject> diagnostic : diagnostics.getDiagnostics()) {
+                String source = diagnostic.getSource() == null ? "" : diagnostic.getSource().getName();
+                out.println("DIAG\t" + diagnostic.getKind() + "\t" + escape(source) + "\t"
+                        + diagnostic.getLineNumber() + "\t" + diagnostic.getColumnNumber() + "\t"
+                        + escape(diagnostic.getMessage(Locale.ROOT)));
+            }
+            out.println("DONE\t" + success);
+        }
+    }
+
+    private static String escape(String text) {
+        return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\r", "").replace("\n", "\\n");
+    }
+}
@@ -0,0 +1,148 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.util.ArrayList;
+import java.util.List;
+
+/**
+ * Long-lived JUnit runner for one checkout. Each request loads the project, test and JUnit classes in a fresh
+ * class loader (with the candidate's recompiled classes first), so the JVM stays warm while no state leaks
+ * between candidates. JUnit is used through reflection, so this class compiles without JUnit on the classpath.
+ *
+ * Usage: java TestRunnerServer <test classpath>
+ *
+ * Protocol (one request per line on stdin, tab-separated):
+ *   RUN \t candidate classes dir (or -) \t timeout per test in ms \t test id \t test id ...
+ * where a test id is package.Class::method. Response on stdout:
+ *   RESULT \t test id \t PASS|FAIL|TIMEOUT|ERROR \t stack trace     (one per test)
+ *   DONE
+ * Stack traces are escaped so that they contain no tabs or newlines. After a timeout the server exits once the
+ * response is written, because the timed-out test thread cannot be stopped safely.
+ */
+public class TestRunnerServer {
+
+    public static void main(String[] args) throws Exception {
+        if (args.length < 1) {
+            System.err.println("Usage: java TestRunnerServer <test classpath>");
+            System.exit(2);
+        }
+        List<URL> baseUrls = new ArrayList<URL>();
+        for (String entry : args[0].split(File.pathSeparator)) {
+            if (!entry.isEmpty()) {
+                baseUrls.add(new File(entry).toURI().toURL());
+            }
+        }
+
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        PrintStream out = new PrintStream(System.out, true, "UTF-8");
+        // Tests write to stdout/stderr; keep them away from the protocol stream
+        System.setOut(new PrintStream(new OutputStream() {
+            @Override
+            public void write(int b) {
+            }
+
+            @Override
+            public void write(byte[] b, int off, int len) {
+            }
+        }));
+
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] parts = line.split("\t");
+            if (parts.length < 3 || !parts[0].equals("RUN")) {
+                out.println("DONE");
+                continue;
+            }
+            List<URL> urls = new ArrayList<URL>();
+            if (!parts[1].equals("-")) {
+                urls.add(new File(parts[1]).toURI().toURL());
+            }
+            urls.addAll(baseUrls);
+            long timeoutMillis = Long.parseLong(parts[2]);
+
+            boolean mustExit = false;
+            // The parent is the bootstrap/extension loader, so every project class is loaded fresh
+            URLClassLoader loader = new URLClassLoader(urls.toArray(new URL[0]), ClassLoader.getSystemClassLoader().getParent());
+            try {
+                for (int i = 3; i < parts.length; i++) {
+                    String testId = parts[i];
+                    String[] result = runTest(loader, testId, timeoutMillis);
+                    out.println("RESULT\t" + escape(testId) + "\t" + result[0] + "\t" + escape(result[1]));
+                    if (result[0].equals("TIMEOUT")) {
+                        mustExit = true;
+                        break;
+                    }
+                }
+            } finally {
+                try {
+                    loader.close();
+                } catch (Exception e) {
+                    // Ignore; the loader is unreachable anyway
+                }
+            }
+            out.println("DONE");
+            if (mustExit) {
+                System.exit(3);
+            }
+        }
+    }
+
+    private static String[] runTest(final ClassLoader loader, String testId, long timeoutMillis) {
+        int separator = testId.indexOf("::");
+        if (separator < 0) {
+            return new String[] {"ERROR", "Invalid test id " + testId};
+        }
+        final String className = testId.substring(0, separator);
+        final String methodName = testId.substring(separator + 2);
+        final String[][] result = new String[1][];
+
+        Thread thread = new Thread(new Runnable() {
+            public void run() {
+                try {
+                    Class<?> testClass = Class.forName(className, true, loader);
+                    Class<?> requestClass = Class.forName("org.junit.runner.Request", true, loader);
+                    Class<?> coreClass = Class.forName("org.junit.runner.JUnitCore", true, loader);
+                    Object request = requestClass.getMethod("method", Class.class, String.class)
+                            .invoke(null, testClass, methodName);
+                    Object core = coreClass.newInstance();
+                    Object junitResult = coreClass.getMethod("run", requestClass).invoke(core, request);
+                    List<?> failures = (List<?>) junitResult.getClass().getMethod("getFailures").invoke(junitResult);
+                    if (failures.isEmpty()) {
+                        result[0] = new String[] {"PASS", ""};
+                    } else {
+                        Object failure = failures.get(0);
+                        Method getTrace = failure.getClass().getMethod("getTrace");
+                        result[0] = new String[] {"FAIL", String.valueOf(getTrace.invoke(failure))};
+                    }
+                } catch (Throwable t) {
+                    StringWriter trace = new StringWriter();
+                    t.printStackTrace(new PrintWriter(trace));
+                    result[0] = new String[] {"ERROR", trace.toString()};
+                }
+            }
+        }, "test-" + testId);
+        thread.setDaemon(true);
+        thread.setContextClassLoader(loader);
+        thread.start();
+        try {
+            thread.join(timeoutMillis);
+        } catch (InterruptedException e) {
+            Thread.currentThread().interrupt();
+        }
+        if (thread.isAlive()) {
+            return new String[] {"TIMEOUT", "Test timed out after " + timeoutMillis + " ms"};
+        }
+        return result[0];
+    }
+
+    private static String escape(String text) {
+        return text.replace("\\", "\\\\").replace("\t", "\\t").replace("\r", "").replace("\n", "\\n");
+    }
+}
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Optional
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import java_parser
+
+COMMENT_NODE_TYPES = {'line_comment', 'block_comment'}
+
+DEFAULT_MEMO_PATH = os.getenv(
+    'PATCH_MEMO_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'patch_memo.sqlite')
+)
+
+
+########################
+# FINGERPRINTING
+########################
+
+def fingerprint_java_code(code: bytes) -> str:
+    """
+    Fingerprint Java code by its syntax tree, so that whitespace, comments and formatting do not matter.
+    Two files get the same fingerprint iff they have the same sequence of non-comment tokens and the same tree shape.
+    """
+    tree = java_parser.parse(code)
+    digest = hashlib.sha256()
+    cursor = tree.walk()
+
+    # Iterative pre-order walk; recursion would overflow on deeply nested expressions
+    visited_children = False
+    while True:
+        node = cursor.node
+        if not visited_children:
+            if node.type in COMMENT_NODE_TYPES:
+                pass
+            elif node.child_count == 0:
+                # Leaf token: its text identifies it (keywords, identifiers, literals, punctuation)
+                digest.update(code[node.start_byte:node.end_byte])
+                digest.update(b'\0')
+            else:
+                digest.update(node.type.encode('utf8'))
+                digest.update(b'(')
+                if cursor.goto_first_child():
+                    continue
+                digest.update(b')')
+        if cursor.goto_next_sibling():
+            visited_children = False
+            continue
+        if not cursor.goto_parent():
+            break
+        # Close the parent we are returning to
+        digest.update(b')')
+        visited_children = True
+
+    return digest.hexdigest()
+
+
+def fingerprint_patch(patched_code: dict[str, bytes]) -> str:
+    """
+    Fingerprint a (possibly multi-file) patch given as {modified source name: patched file bytes}.
+    """
+    digest = hashlib.sha256()
+    for modified_source in sorted(patched_code):
+        digest.update(modified_source.encode('utf8') + b'\0')
+        digest.update(fingerprint_java_code(patched_code[modified_source]).encode('utf8'))
+    return digest.hexdigest()
+
+
+def fingerprint_patch_files(java_patch_files: dict[str, str]) -> str:
+    """
+    Fingerprint a patch given as {modified source name: path to java patch file}, as passed to run_defects4j_test.
+    """
+    patched_code = {}
+    for modified_source, java_patch_file in java_patch_files.items():
+        with open(java_patch_file, 'rb') as f:
+            patched_code[modified_source] = f.read()
+    return fingerprint_patch(patched_code)
+
+
+########################
+# PERSISTENT TEST-OUTCOME MEMO
+########################
+
+class PatchOutcomeMemo:
+    """
+    Persistent memo of test outcomes keyed by (project, bug id, patch fingerprint).
+    Backed by SQLite so several processes of a sweep can share it.
+
+    Two kinds of entries are kept apart: test outcomes, in the shape run_defects4j_test returns, and the verdicts
+    of the PatchSelector, which may reject a patch at the compile or trigger tests stage without knowing which
+    tests of the full suite fail.
+    """
+
+    def __init__(self, memo_path: str = DEFAULT_MEMO_PATH):
+        self.memo_path = memo_path
+        self.connection = sqlite3.connect(memo_path, timeout=30)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS outcomes (
+                project TEXT NOT NULL,
+                bug_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (project, bug_id, fingerprint)
+            )
+        """)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS selector_verdicts (
+                project TEXT NOT NULL,
+                bug_id TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                passed INTEGER NOT NULL,
+                stage TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (project, bug_id, fingerprint)
+            )
+        """)
+        self.connection.commit()
+
+    def get(self, project_name: str, bug_id: str, fingerprint: str) -> Optional[dict]:
+        row = self.connection.execute(
+            'SELECT outcome FROM outcomes WHERE project = ? AND bug_id = ? AND fingerprint = ?',
+            (project_name.lower(), str(bug_id), fingerprint)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, project_name: str, bug_id: str, fingerprint: str, outcome):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO outcomes (project, bug_id, fingerprint, outcome, created) VALUES (?, ?, ?, ?, ?)',
+            (project_name.lower(), str(bug_id), fingerprint, json.dumps(outcome), time.time())
+        )
+        self.connection.commit()
+
+    def get_selector_verdict(self, project_name: str, bug_id: str, fingerprint: str) -> Optional[dict]:
+        """
+        Return the verdict of an earlier PatchSelector run as {'passed', 'stage', 'reason'}, or None.
+        """
+        row = self.connection.execute(
+            'SELECT passed, stage, reason FROM selector_verdicts WHERE project = ? AND bug_id = ? AND fingerprint = ?',
+            (project_name.lower(), str(bug_id), fingerprint)
+        ).fetchone()
+        return {'passed': bool(row[0]), 'stage': row[1], 'reason': row[2]} if row else None
+
+    def put_selector_verdict(self, project_name: str, bug_id: str, fingerprint: str, passed: bool, stage: str, reason: str):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO selector_verdicts VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (project_name.lower(), str(bug_id), fingerprint, int(passed), stage, reason, time.time())
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,423 @@
+import os
+import sys
+import shutil
+import tempfile
+from typing import Callable, List, Tuple
+import test_suites_helpers as tsh
+import patch_fingerprint as pf
+from compile_server import CompileServer
+from test_runner_server import TestRunnerServer
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import isolate_bug as ib
+import java_parser
+
+
+class PatchCandidate:
+    """
+    A candidate patch produced by an agent.
+    java_patch_files has the same shape as in run_defects4j_test: {modified source name: path to java patch file}
+    """
+
+    def __init__(self, candidate_id: str, java_patch_files: dict[str, str]):
+        self.candidate_id = candidate_id
+        self.java_patch_files = java_patch_files
+        self.patched_code: dict[str, bytes] = {}
+        self.fingerprint = None
+        self.passed_stages: list[str] = []
+        self.skipped_stages: list[str] = []
+        self.rejected_stage = None
+        self.rejection_reason = None
+
+
+class PatchSelector:
+    """
+    Staged patch selector. Candidates go through the stages in order of cost and are dropped at the
+    first stage they fail, so only plausible candidates ever reach the (multi-minute) test stages.
+
+    Stages, cheapest first:
+    - parse: the patched file must parse without syntax errors
+    - unchanged: the patch must differ from the original buggy file
+    - duplicate: the patch must differ from every earlier candidate after comments and formatting are stripped
+    - edit scope: only the buggy methods/constructors may be modified
+    - compile: the patched project must compile
+    - trigger tests: the bug's triggering tests must pass
+    - full suite: the whole test suite must pass
+
+    If a CompileServer is given, the compile stage recompiles only the patched files against the prebuilt classes
+    instead of running the Defects4J build. If a TestRunnerServer is given as well, the trigger tests stage runs the
+    triggering tests against those recompiled classes in the warm test runner instead of `defects4j test`.
+
+    A stage that cannot run for the bug (trigger tests, when the bug has none) is skipped explicitly: it is
+    recorded in the candidate's skipped_stages instead of passed_stages, and the later stages still run.
+
+    If a PatchOutcomeMemo is given, candidates tested in an earlier run resolve from it before the expensive
+    stages, from an earlier selector verdict or from a test outcome stored by run_defects4j_test_memoized. Every
+    verdict of the expensive stages is stored in it, apart from the test outcomes.
+    """
+
+    EXPENSIVE_STAGES = ('compile', 'trigger tests', 'full suite')
+
+    def __init__(self, project_name: str, version: str, working_dir: str, bug_locations: dict[str, List[Tuple[int, int]]], memo: pf.PatchOutcomeMemo = None,
+                 compile_server: CompileServer = None, test_runner: TestRunnerServer = None):
+        """
+        Parameters:
+        - project_name: Project name (e.g., 'Chart', 'Closure', 'Math')
+        - version: Bug version (e.g., '2', '3', '4')
+        - working_dir: Absolute path to the project directory
+        - bug_locations: {modified source name: list of (start line, end line) bug locations in that source}
+        - memo: Optional persistent memo of earlier outcomes
+        - compile_server: Optional compile server of a compiled checkout of the bug
+        - test_runner: Optional test runner server of the same checkout (only used together with compile_server)
+        """
+        self.project_name = project_name
+        self.version = version
+        self.working_dir = working_dir
+        self.bug_locations = bug_locations
+        self.memo = memo
+        self.compile_server = compile_server
+        self.test_runner = test_runner
+
+        self.original_code: dict[str, bytes] = {}
+        self.source_paths: dict[str, str] = {}
+        self.seen_patches: set[str] = set()
+        self.trigger_tests = None
+        self.rejections: list[dict] = []
+
+        self.stages: list[tuple[str, Callable[[PatchCandidate], tuple[bool, str]]]] = [
+            ('parse', self.check_parse),
+            ('unchanged', self.check_unchanged),
+            ('duplicate', self.check_duplicate),
+            ('edit scope', self.check_edit_scope),
+            ('compile', self.check_compile),
+            ('trigger tests', self.check_trigger_tests),
+            ('full suite', self.check_full_suite),
+        ]
+
+    def prepare(self) -> bool:
+        """
+        Check out the buggy project once and read the original version of every modified source.
+        """
+        if not tsh.checkout_defects4j_project(self.project_name, self.version, self.working_dir):
+            return False
+        tsh.get_metadata_store().record_checkout_properties(self.project_name, self.version, self.working_dir)
+
+        for modified_source in tsh.get_modified_sources(self.project_name, self.version):
+            full_source_path = tsh.get_full_source_path(self.project_name, self.working_dir, modified_source, self.version)
+            try:
+                with open(full_source_path, 'rb') as f:
+                    self.original_code[modified_source] = f.read()
+                self.source_paths[modified_source] = full_source_path
+            except FileNotFoundError:
+                print(f"Error: File {full_source_path} not found")
+                return False
+        return True
+
+    def select(self, candidates: List[PatchCandidate]) -> List[PatchCandidate]:
+        """
+        Run all candidates through the stages and return those that pass every stage.
+        Rejected candidates are recorded in self.rejections with the stage and the reason.
+        """
+        if not self.original_code and not self.prepare():
+            return []
+
+        surviving = []
+        for candidate in candidates:
+            if self.load_candidate(candidate):
+                surviving.append(candidate)
+
+        # Run stage by stage so each stage only sees the candidates that survived all cheaper ones
+        memoized = []
+        for stage_name, stage in self.stages:
+            if stage_name == self.EXPENSIVE_STAGES[0] and self.memo is not None:
+                surviving, memoized = self.resolve_from_memo(surviving)
+
+            if not self.can_run_stage(stage_name):
+                print(f"Skipping the {stage_name} stage: no {stage_name} for {self.project_name}-{self.version}")
+                for candidate in surviving:
+                    candidate.skipped_stages.append(stage_name)
+                continue
+
+            next_surviving = []
+            for candidate in surviving:
+                passed, reason = stage(candidate)
+                if passed:
+                    candidate.passed_stages.append(stage_name)
+                    next_surviving.append(candidate)
+                else:
+                    self.reject(candidate, stage_name, reason)
+                    if stage_name in self.EXPENSIVE_STAGES:
+                        self.remember(candidate, False, stage_name, reason)
+            surviving = next_surviving
+
+        for candidate in surviving:
+            if self.EXPENSIVE_STAGES[-1] in candidate.passed_stages:
+                self.remember(candidate, True, self.EXPENSIVE_STAGES[-1], '')
+
+        return memoized + surviving
+
+    def can_run_stage(self, stage_name: str) -> bool:
+        """
+        Whether the stage has anything to check for this bug.
+        """
+        if stage_name == 'trigger tests':
+            if self.trigger_tests is None:
+                self.trigger_tests = tsh.get_trigger_tests_cached(self.project_name, self.version, self.working_dir)
+            return bool(self.trigger_tests)
+        return True
+
+    def resolve_from_memo(self, candidates: List[PatchCandidate]) -> tuple[List[PatchCandidate], List[PatchCandidate]]:
+        """
+        Split candidates into (still to be tested, passed according to the memo).
+        Candidates the memo says failed are rejected at the stage they failed in the earlier run.
+        """
+        to_test = []
+        passed = []
+        for candidate in candidates:
+            verdict = self.memo.get_selector_verdict(self.project_name, self.version, candidate.fingerprint)
+            if verdict is not None:
+                if verdict['passed']:
+                    candidate.passed_stages.extend(self.EXPENSIVE_STAGES)
+                    passed.append(candidate)
+                else:
+                    self.reject(candidate, verdict['stage'], f"{verdict['reason']} (memoized)")
+                continue
+
+            # Test outcomes stored by run_defects4j_test_memoized come from the full suite
+            outcome = self.memo.get(self.project_name, self.version, candidate.fingerprint)
+            if not outcome:
+                to_test.append(candidate)
+            elif all(result['success'] for result in outcome):
+                candidate.passed_stages.extend(self.EXPENSIVE_STAGES)
+                passed.append(candidate)
+            else:
+                reason = f'Failing tests: {", ".join(outcome[0].get("failing_tests", []))}'
+                self.reject(candidate, self.EXPENSIVE_STAGES[-1], f'{reason} (memoized)')
+        return to_test, passed
+
+    def remember(self, candidate: PatchCandidate, passed: bool, stage_name: str, reason: str):
+        """
+        Store the verdict in the memo. It is kept apart from test outcomes, since a compile or trigger tests
+        rejection does not say which tests of the full suite fail.
+        """
+        if self.memo is not None:
+            self.memo.put_selector_verdict(self.project_name, self.version, candidate.fingerprint, passed, stage_name, reason)
+
+    def reject(self, candidate: PatchCandidate, stage_name: str, reason: str):
+        candidate.rejected_stage = stage_name
+        candidate.rejection_reason = reason
+        self.rejections.append({
+            'candidate': candidate.candidate_id,
+            'stage': stage_name,
+            'reason': reason
+        })
+
+    def get_rejection_summary(self) -> dict[str, int]:
+        """
+        Return the number of candidates dropped at each stage.
+        """
+        summary = {stage_name: 0 for stage_name, _ in self.stages}
+        summary['load'] = 0
+        for rejection in self.rejections:
+            summary[rejection['stage']] += 1
+        return summary
+
+    def load_candidate(self, candidate: PatchCandidate) -> bool:
+        for modified_source, java_patch_file in candidate.java_patch_files.items():
+            if modified_source not in self.original_code:
+                self.reject(candidate, 'load', f'{modified_source} is not a modified source of the bug')
+                return False
+            try:
+                with open(java_patch_file, 'rb') as f:
+                    candidate.patched_code[modified_source] = f.read()
+            except FileNotFoundError:
+                self.reject(candidate, 'load', f'Patch file {java_patch_file} not found')
+                return False
+        return True
+
+    ########################
+    # CHEAP STAGES
+    ########################
+
+    def check_parse(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        for modified_source, code in candidate.patched_code.items():
+            tree = java_parser.parse(code)
+            if tree.root_node.has_error:
+                return False, f'Syntax error in patched {modified_source}'
+        return True, ''
+
+    def check_unchanged(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        for modified_source, code in candidate.patched_code.items():
+            if code != self.original_code[modified_source]:
+                return True, ''
+        return False, 'Patch is identical to the original buggy code'
+
+    def check_duplicate(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        candidate.fingerprint = pf.fingerprint_patch(candidate.patched_code)
+        if candidate.fingerprint in self.seen_patches:
+            return False, 'Patch is identical to an earlier candidate'
+        self.seen_patches.add(candidate.fingerprint)
+        return True, ''
+
+    def check_edit_scope(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        for modified_source, code in candidate.patched_code.items():
+            if modified_source not in self.bug_locations:
+                continue
+            if not self.is_edit_in_scope(modified_source, code):
+                return False, f'Patch modifies {modified_source} outside of the buggy methods'
+        return True, ''
+
+    def is_edit_in_scope(self, modified_source: str, patched_code: bytes) -> bool:
+        """
+        Check that the patched file equals the original file everywhere except inside the buggy nodes.
+        The code between the buggy nodes must appear unchanged and in the same order in the patched file.
+        """
+        original_code = self.original_code[modified_source]
+
+        buggy_ranges = []
+        for bug_location in self.bug_locations[modified_source]:
+            buggy_node_info = ib.retrieve_buggy_node(self.source_paths[modified_source], bug_location)
+            if buggy_node_info is None:
+                # The bug is outside any class, so there is no node to restrict the edit to
+                return True
+            _, buggy_node = buggy_node_info
+            buggy_ranges.append((buggy_node.start_byte, buggy_node.end_byte))
+        buggy_ranges = merge_byte_ranges(buggy_ranges)
+
+        # Split the original file into the fixed segments around the buggy nodes
+        segments = []
+        previous_end = 0
+        for start_byte, end_byte in buggy_ranges:
+            segments.append(original_code[previous_end:start_byte])
+            previous_end = end_byte
+        segments.append(original_code[previous_end:])
+
+        if not patched_code.startswith(segments[0]) or not patched_code.endswith(segments[-1]):
+            return False
+        if len(segments[0]) + len(segments[-1]) > len(patched_code):
+            return False
+
+        position = len(segments[0])
+        end_limit = len(patched_code) - len(segments[-1])
+        for segment in segments[1:-1]:
+            position = patched_code.find(segment, position, end_limit)
+            if position == -1:
+                return False
+            position += len(segment)
+        return True
+
+    ########################
+    # EXPENSIVE STAGES
+    ########################
+
+    def check_compile(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        if not self.apply_candidate(candidate):
+            return False, 'Failed to apply Java file patch'
+        try:
+            if self.compile_server is not None:
+                return self.compile_with_server(candidate)
+            compiled, output = tsh.compile_defects4j_project(self.working_dir)
+        finally:
+            self.restore_original()
+        if not compiled:
+            return False, f'Compilation failed: {output[-2000:]}'
+        return True, ''
+
+    def compile_with_server(self, candidate: PatchCandidate, output_dir: str = None) -> tuple[bool, str]:
+        """
+        Recompile the patched files (which must be applied) with the compile server. The classes are written to
+        output_dir if given, and otherwise discarded.
+        """
+        keep_classes = output_dir is not None
+        output_dir = output_dir or tempfile.mkdtemp(prefix='patch_classes_')
+        try:
+            patched_paths = [self.source_paths[modified_source] for modified_source in candidate.java_patch_files]
+            result = self.compile_server.compile(patched_paths, output_dir)
+        finally:
+            if not keep_classes:
+                shutil.rmtree(output_dir, ignore_errors=True)
+        if not result['success']:
+            errors = [
+                f"{os.path.basename(diagnostic['source'])}:{diagnostic['line']}: {diagnostic['message']}"
+                for diagnostic in result['diagnostics'] if diagnostic['kind'] == 'ERROR'
+            ]
+            return False, 'Compilation failed: ' + '\n'.join(errors)[-2000:]
+        return True, ''
+
+    def check_trigger_tests(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        if not self.can_run_stage('trigger tests'):
+            return False, 'No triggering tests to run'
+
+        if self.compile_server is not None and self.test_runner is not None:
+            return self.run_trigger_tests_with_server(candidate)
+
+        if not self.apply_candidate(candidate):
+            return False, 'Failed to apply Java file patch'
+        try:
+            for trigger_test in self.trigger_tests:
+                result = tsh.run_defects4j_tests(self.working_dir, trigger_test, stop_on_failure=True)
+                if not result['success']:
+                    return False, f'Triggering test failed: {trigger_test}'
+        finally:
+            self.restore_original()
+        return True, ''
+
+    def run_trigger_tests_with_server(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        output_dir = tempfile.mkdtemp(prefix='patch_classes_')
+        try:
+            if not self.apply_candidate(candidate):
+                return False, 'Failed to apply Java file patch'
+            try:
+                compiled, reason = self.compile_with_server(candidate, output_dir)
+            finally:
+                self.restore_original()
+            if not compiled:
+                return False, reason
+
+            results = self.test_runner.run_tests(self.trigger_tests, output_dir)
+        finally:
+            shutil.rmtree(output_dir, ignore_errors=True)
+        for trigger_test in self.trigger_tests:
+            if results[trigger_test]['status'] != 'PASS':
+                return False, f'Triggering test failed: {trigger_test}'
+        return True, ''
+
+    def check_full_suite(self, candidate: PatchCandidate) -> tuple[bool, str]:
+        if not self.apply_candidate(candidate):
+            return False, 'Failed to apply Java file patch'
+        try:
+            # One failing test rejects the candidate, so the rest of the suite is not run
+            result = tsh.run_defects4j_tests(self.working_dir, stop_on_failure=True)
+        finally:
+            self.restore_original()
+        if not result['success']:
+            return False, f'Failing tests: {", ".join(result["failing_tests"])}'
+        return True, ''
+
+    def apply_candidate(self, candidate: PatchCandidate) -> bool:
+        for modified_source, java_patch_file in candidate.java_patch_files.items():
+            if not tsh.apply_java_file_patch(java_patch_file, self.source_paths[modified_source]):
+                self.restore_original()
+                return False
+        return True
+
+    def restore_original(self):
+        """
+        Write the original buggy sources back so the working directory can be reused without a new checkout.
+        """
+        for modified_source, code in self.original_code.items():
+            with open(self.source_paths[modified_source], 'wb') as f:
+                f.write(code)
+
+
+def merge_byte_ranges(byte_ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Sort and merge overlapping (start byte, end byte) ranges.
+    """
+    merged = []
+    for start_byte, end_byte in sorted(byte_ranges):
+        if merged and start_byte <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end_byte))
+        else:
+            merged.append((start_byte, end_byte))
+    return merged
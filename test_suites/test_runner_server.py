@@ -0,0 +1,141 @@
+import os
+import atexit
+import threading
+import subprocess
+from typing import Dict, List, Tuple
+import failure_index as fi
+from compile_server import build_java_server, get_checkout_classpath, get_java_tool, unescape
+
+DEFAULT_TEST_TIMEOUT_S = float(os.getenv('TEST_RUNNER_TIMEOUT_S', '60'))
+
+# Exit code of the server after a timed-out test (its thread cannot be stopped, so the JVM is replaced)
+TIMEOUT_EXIT_CODE = 3
+
+
+class TestRunnerServer:
+    """
+    Client for a long-lived TestRunnerServer JVM that runs single test methods of a compiled checkout.
+    Every request runs in a fresh class loader with the candidate's recompiled classes in front of the prebuilt
+    ones, so repeated validations of one bug skip JVM startup, Ant and test discovery without leaking state
+    between candidates.
+
+    The JVM runs in the checkout's directory, as `defects4j test` does, so tests that load resources by relative
+    path find them.
+    """
+
+    def __init__(self, classpath: List[str], working_dir: str):
+        self.classpath = classpath
+        self.working_dir = working_dir
+        self.process = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        server_dir = build_java_server('TestRunnerServer')
+        self.process = subprocess.Popen(
+            [get_java_tool('java'), '-cp', server_dir, 'TestRunnerServer', os.pathsep.join(self.classpath)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding='utf-8',
+            bufsize=1,
+            cwd=self.working_dir
+        )
+
+    def run_tests(self, test_ids: List[str], candidate_classes_dir: str = None, timeout_s: float = DEFAULT_TEST_TIMEOUT_S) -> Dict[str, dict]:
+        """
+        Run test methods (package.Class::method) against the prebuilt classes, shadowed by the classes in
+        candidate_classes_dir if given.
+
+        Returns: dict of {test id: {'status': 'PASS'|'FAIL'|'TIMEOUT'|'ERROR', 'trace': str}}
+        """
+        request = '\t'.join(['RUN', os.path.abspath(candidate_classes_dir) if candidate_classes_dir else '-',
+                             str(int(timeout_s * 1000))] + list(test_ids))
+        with self.lock:
+            for attempt in range(2):
+                if self.process is None or self.process.poll() is not None:
+                    self.start()
+                try:
+                    self.process.stdin.write(request + '\n')
+                    self.process.stdin.flush()
+                    results = self.read_response()
+                    break
+                except (BrokenPipeError, EOFError) as e:
+                    # The JVM died (e.g. out of memory); restart it once and retry
+                    print(f"Test runner server stopped ({e}), restarting")
+                    self.process = None
+            else:
+                return {test_id: {'status': 'ERROR', 'trace': 'Test runner server keeps stopping'} for test_id in test_ids}
+
+            if any(result['status'] == 'TIMEOUT' for result in results.values()):
+                # The server exits after a timeout; reap it so the next request starts a fresh JVM
+                try:
+                    self.process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self.process.kill()
+                self.process = None
+
+        # The server stops at the first timeout, so the tests after it did not run
+        for test_id in test_ids:
+            results.setdefault(test_id, {'status': 'ERROR', 'trace': 'Not run after an earlier test timed out'})
+        return results
+
+    def read_response(self) -> Dict[str, dict]:
+        results = {}
+        while True:
+            line = self.process.stdout.readline()
+            if not line:
+                raise EOFError('Test runner server closed its output')
+            parts = line.rstrip('\n').split('\t')
+            if parts[0] == 'DONE':
+                return results
+            if parts[0] == 'RESULT' and len(parts) >= 3:
+                results[unescape(parts[1])] = {
+                    'status': parts[2],
+                    'trace': unescape('\t'.join(parts[3:]))
+                }
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+def get_failure_index(results: Dict[str, dict]) -> Tuple[List[str], Dict[str, fi.FailureRecord]]:
+    """
+    Convert run_tests results into the failing tests and their failure index, parsed from the same
+    "--- test id" + stack trace sections `defects4j test` writes, so test_suites.format_failing_test_info can use them.
+    """
+    failing_tests = [test_id for test_id, result in results.items() if result['status'] != 'PASS']
+    failure_index = {}
+    for test_id in failing_tests:
+        lines = [f"--- {test_id}"] + results[test_id]['trace'].split('\n')
+        failure_index.update(fi.build_failure_index(lines))
+    return failing_tests, failure_index
+
+
+_test_runner_servers: Dict[Tuple[str, str, str], TestRunnerServer] = {}
+_test_runner_servers_lock = threading.Lock()
+
+
+def get_test_runner_server(project_name: str, version: str, pristine_path: str) -> TestRunnerServer:
+    """
+    Return the test runner server of a (compiled) pristine checkout, starting it on first use.
+    """
+    key = (project_name.lower(), str(version), os.path.abspath(pristine_path))
+    with _test_runner_servers_lock:
+        if key not in _test_runner_servers:
+            classpath = get_checkout_classpath(project_name, version, pristine_path, 'cp.test')
+            _test_runner_servers[key] = TestRunnerServer(classpath, key[2])
+        return _test_runner_servers[key]
+
+
+@atexit.register
+def close_test_runner_servers():
+    for test_runner_server in _test_runner_servers.values():
+        test_runner_server.close()
+    _test_runner_servers.clear()
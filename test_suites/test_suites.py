@@ -1,9 +1,27 @@
 import test_suites_helpers as tsh
+import patch_fingerprint as pf
+import failure_index as fi
+from checkout_cache import CheckoutCache
+import validation_cache as vc
+from validation_cache import ValidationCache
 import os
-import subprocess
-from ..context_retrieval import retrieval_utils as cr
+import sys
+import time
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import retrieval_utils as cr
+import tracing
 
-def run_defects4j_test(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str]) -> list:
+# Test modes: run the full suite, or fail fast by running the triggering tests, then the relevant tests, then the full suite
+TEST_MODES = ('full', 'fail-fast')
+
+# Failing tests whose failure is kept in the result, and the stack frames kept of each
+MAX_FAILURE_DETAILS = 3
+MAX_FAILURE_DETAIL_FRAMES = 10
+
+
+def run_defects4j_test(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str], checkout_cache: CheckoutCache = None,
+                       test_mode: str = 'full', validation_cache: ValidationCache = None) -> list:
     '''
     Run the test suite for a given project and version.
     
@@ -12,57 +30,175 @@ def run_defects4j_test(project_name: str, version: str, working_dir: str, java_p
     - version: Bug version (e.g., '2', '3', '4')
     - working_dir: Absolute path to the project directory
     - java_patch_files: Dict containing entries in the form of {modified source name: path to java patch file}
+    - checkout_cache: If given, test in a recycled working copy of a cached pristine checkout instead of
+      checking the project out into working_dir
+    - test_mode: 'full' runs the whole test suite; 'fail-fast' runs the triggering tests first and only runs the
+      relevant tests and then the whole suite if they pass
+    - validation_cache: If given, a patch validated before in the same test mode returns its stored result without
+      any checkout, compile or test run, and new results are stored in it
     '''
+    with tracing.span('defects4j.run_test', project=project_name, version=version, test_mode=test_mode) as test_span:
+        result = run_defects4j_test_with_cache(project_name, version, working_dir, java_patch_files, checkout_cache,
+                                               test_mode, validation_cache, test_span)
+        if isinstance(result, dict):
+            test_span.set(error=result.get('error'))
+        else:
+            test_span.set(success=result[0].get('success'), failing_tests=len(result[0].get('failing_tests', [])))
+    return result
+
+
+def run_defects4j_test_with_cache(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str],
+                                  checkout_cache: CheckoutCache, test_mode: str, validation_cache: ValidationCache, test_span) -> list:
+    if validation_cache is None:
+        return run_defects4j_test_uncached(project_name, version, working_dir, java_patch_files, checkout_cache, test_mode)
+
+    try:
+        patch_hash = vc.hash_patch_files(java_patch_files)
+    except OSError as e:
+        return {'error': f'Failed to read Java patch file: {e}'}
+    result = validation_cache.get(project_name, version, patch_hash, test_mode)
+    test_span.set(cached=result is not None)
+    if result is not None:
+        return result
+
+    result = run_defects4j_test_uncached(project_name, version, working_dir, java_patch_files, checkout_cache, test_mode)
+    validation_cache.put(project_name, version, patch_hash, test_mode, result)
+    return result
+
+
+def run_defects4j_test_uncached(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str],
+                                checkout_cache: CheckoutCache = None, test_mode: str = 'full') -> list:
+    if checkout_cache is not None:
+        try:
+            with checkout_cache.working_copy(project_name, version) as working_copy:
+                return test_patch_in_working_dir(project_name, version, working_copy.path, java_patch_files,
+                                                 working_copy.apply_java_file_patch, test_mode)
+        except RuntimeError as e:
+            return {'error': str(e)}
+
     if not tsh.checkout_defects4j_project(project_name, version, working_dir):
         return {'error': 'Failed to checkout project'}
-    
-    results = []
 
+    return test_patch_in_working_dir(project_name, version, working_dir, java_patch_files, test_mode=test_mode)
+
+
+def test_patch_in_working_dir(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str],
+                              apply_patch=tsh.apply_java_file_patch, test_mode: str = 'full') -> list:
+    '''
+    Apply the patch to a checked out project and run its test suite.
+    apply_patch(java patch file, target path) is used to apply each patched source.
+
+    A rejected patch's result also says why, since the working directory is reset after the run: 'failures' holds
+    the FailureRecord dicts of the first failing tests, or 'compile_errors' the javac errors if the patched project
+    does not compile.
+    '''
     modified_sources = tsh.get_modified_sources(project_name, version)
-    for modified_source in modified_sources:
-        full_source_path = tsh.get_full_source_path(project_name, working_dir, modified_source)
-        
-        try:
-            if not tsh.apply_java_file_patch(java_patch_files[modified_source], full_source_path):
+    patched_sources = [modified_source for modified_source in modified_sources if modified_source in java_patch_files]
+    if not patched_sources:
+        return {'error': 'Patch does not modify any modified source of the bug'}
+
+    try:
+        # Apply every patched source before testing, so multi-file patches are tested as a whole
+        for modified_source in patched_sources:
+            full_source_path = tsh.get_full_source_path(project_name, working_dir, modified_source, version)
+            if not apply_patch(java_patch_files[modified_source], full_source_path):
                 return {'error': 'Failed to apply Java file patch'}
-        
+
+        if test_mode == 'fail-fast':
+            result = run_fail_fast_tests(project_name, version, working_dir)
+        else:
             # Run the test command
-            result = subprocess.run(
-                ['defects4j', 'test', '-w', working_dir],
-                capture_output=True,
-                text=True,
-                cwd=working_dir
-            )
-        
-            # Parse the output to extract test results
-            output = result.stdout
-            return_code = result.returncode
-            
-                # Parse failing test names
-            failing_tests = []
-            lines = output.split('\n')
-
-            for line in lines:
-                if line.strip().startswith('- '):
-                    # Remove the "  - " prefix and get the test name
-                    test_name = line.strip()[2:].strip()
-                    failing_tests.append(test_name)
-
-            results.append({
-            'success': return_code == 0,
-            'failing_tests': failing_tests,
-            'return_code': return_code
-            })
-        
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            return {'error': str(e)}
+            start_time = time.perf_counter()
+            result = tsh.run_defects4j_tests(working_dir)
+            elapsed = time.perf_counter() - start_time
+            result.update({'stage': 'full suite', 'elapsed': elapsed, 'stage_times': {'full suite': elapsed}})
+        add_failure_details(result, working_dir)
+        return [result]
 
-    return results
+    except Exception as e:
+        print(f"Error occurred: {e}")
+        return {'error': str(e)}
+
+
+def add_failure_details(result: dict, working_dir: str):
+    '''
+    Add the failures of the first failing tests, or the compile errors of a run that failed before any test did.
+    '''
+    if result.get('success') or result.get('cancelled') and not result.get('failing_tests'):
+        return
+    if result.get('failing_tests'):
+        failure_index = fi.read_failure_index(os.path.join(working_dir, 'failing_tests'),
+                                              result['failing_tests'][:MAX_FAILURE_DETAILS])
+        failures = []
+        for test_id in result['failing_tests'][:MAX_FAILURE_DETAILS]:
+            if test_id in failure_index:
+                failure = failure_index[test_id].to_dict()
+                failure['frames'] = failure['frames'][:MAX_FAILURE_DETAIL_FRAMES]
+                failures.append(failure)
+        result['failures'] = failures
+        return
+
+    # `defects4j test` compiles first and reports no failing tests if that fails; compiling again tells why
+    compiled, output = tsh.compile_defects4j_project(working_dir)
+    if not compiled:
+        result['compile_errors'] = tsh.get_compile_errors(output)
+
+
+def run_fail_fast_tests(project_name: str, version: str, working_dir: str) -> dict:
+    '''
+    Run the tests of a patched project in stages of increasing cost and stop at the first failing stage:
+    the triggering tests one by one, then the relevant tests, then the full suite. Each run is killed at its
+    first failing test, so the failing tests of the failed stage are only the ones seen up to that point.
+
+    Returns the run_defects4j_test result dict plus 'stage' (the stage that failed, or the last stage),
+    'elapsed' (total seconds) and 'stage_times' ({stage: seconds}).
+    '''
+    start_time = time.perf_counter()
+    stage_times = {}
+
+    def finish(result: dict, stage: str) -> dict:
+        result.update({'stage': stage, 'elapsed': time.perf_counter() - start_time, 'stage_times': stage_times})
+        return result
+
+    stage_start = time.perf_counter()
+    for trigger_test in tsh.get_trigger_tests_cached(project_name, version, working_dir):
+        result = tsh.run_defects4j_tests(working_dir, test=trigger_test, stop_on_failure=True)
+        if not result['success']:
+            stage_times['trigger tests'] = time.perf_counter() - stage_start
+            return finish(result, 'trigger tests')
+    stage_times['trigger tests'] = time.perf_counter() - stage_start
+
+    stage_start = time.perf_counter()
+    result = tsh.run_defects4j_tests(working_dir, relevant=True, stop_on_failure=True)
+    stage_times['relevant tests'] = time.perf_counter() - stage_start
+    if not result['success']:
+        return finish(result, 'relevant tests')
+
+    stage_start = time.perf_counter()
+    result = tsh.run_defects4j_tests(working_dir, stop_on_failure=True)
+    stage_times['full suite'] = time.perf_counter() - stage_start
+    return finish(result, 'full suite')
+
+
+def run_defects4j_test_memoized(project_name: str, version: str, working_dir: str, java_patch_files: dict[str, str], memo: pf.PatchOutcomeMemo) -> list:
+    '''
+    Same as run_defects4j_test, but candidates that only differ from an earlier one in whitespace, comments or
+    formatting resolve from the persistent memo instead of another checkout and test run.
+    '''
+    fingerprint = pf.fingerprint_patch_files(java_patch_files)
+    outcome = memo.get(project_name, version, fingerprint)
+    if outcome is not None:
+        return outcome
+
+    outcome = run_defects4j_test(project_name, version, working_dir, java_patch_files)
+    # Errors and cancelled or killed runs are about the environment, not the patch, so they are not remembered
+    if vc.is_conclusive(outcome):
+        memo.put(project_name, version, fingerprint, outcome)
+    return outcome
 
 
 # Call this function if success code is 0
-def get_failing_test_info(working_dir: str, project_name: str, failing_tests: list[str]) -> list[dict[str]]:
+def get_failing_test_info(working_dir: str, project_name: str, failing_tests: list[str], version: str = None) -> list[dict[str]]:
     """
     Extract detailed information about failing tests.
 
@@ -70,29 +206,38 @@ def get_failing_test_info(working_dir: str, project_name: str, failing_tests: li
     list of failing tests, each containing: a dict of strings identifying the exception name, entire buggy
     function, and the exact failing line
     """
-    all_info = []
+    # Index the failing_tests file in one streaming pass
+    failure_index = fi.read_failure_index(os.path.join(working_dir, 'failing_tests'), failing_tests)
 
-    # get failing_tests_info
-    failing_tests_path = os.path.join(working_dir, 'failing_tests')
-    failing_tests_info = subprocess.run(['cat', failing_tests_path], capture_output=True, text=True).stdout
-    info_for_each_test = tsh.get_each_failing_test_info(failing_tests, failing_tests_info)
+    return format_failing_test_info(working_dir, project_name, failing_tests, failure_index, version)
+
+
+def format_failing_test_info(working_dir: str, project_name: str, failing_tests: list[str], failure_index: dict[str, fi.FailureRecord],
+                             version: str = None) -> list[dict[str]]:
+    """
+    Build the failing test dicts from a failure index, whether it comes from the failing_tests file of
+    `defects4j test` or from the test runner server.
+    """
+    all_info = []
 
     for test_identifier in failing_tests:
-        test_info = info_for_each_test.get(test_identifier)
-        failure_message = tsh.get_failure_message(test_info)
+        record = failure_index.get(test_identifier) or fi.FailureRecord(test_identifier)
+        failure_message = record.failure_message
 
         buggy_method = "not found"
         buggy_line = "not found"
 
-        package_path, method_name, line_number = tsh.get_failing_test_method_and_line(test_identifier, test_info)
+        package_path, method_name, line_number = record.test_class, record.test_method, record.test_line
         if (line_number != -1):
-            test_path = tsh.get_full_test_path(project_name, working_dir, package_path)
+            test_path = tsh.get_full_test_path(project_name, working_dir, package_path, version)
 
             with open(test_path, 'rb') as f:
                 code = f.read()
-            buggy_method = cr.get_node_text(cr.retrieve_method_by_name(test_path, method_name), code)
+            method_node = cr.retrieve_method_by_name(test_path, method_name, line_number)
+            if method_node is not None:
+                buggy_method = cr.get_node_text(method_node, code)
 
-            buggy_line = cr.retrieve_code_by_line_number(test_path, [(line_number, line_number)])
+            buggy_line = cr.retrieve_code_by_line_number(test_path, (line_number, line_number))
 
         test_info = {
             'failing test': test_identifier,
@@ -102,4 +247,4 @@ def get_failing_test_info(working_dir: str, project_name: str, failing_tests: li
         }
         all_info.append(test_info)
     
-    return all_info
\ No newline at end of file
+    return all_info
@@ -2,6 +2,11 @@ import subprocess
 import os
 import shutil
 import sys
+from defects4j_metadata import get_metadata_store
+from defects4j_test_run import Defects4JTestRun
+# Add the context_retrieval directory to the path
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'context_retrieval'))
+import tracing
 
 ########################
 # HELPER FUNCTION FOR WORKING DIRECTORY AND PACKAGE PATHS
@@ -18,6 +23,7 @@ def connect_paths(project_name: str, working_dir: str, paths: dict[str, str], pa
 # HELPER FUNCTIONS FOR RUN_DEFECTS4J_TEST
 ########################
 
+@tracing.traced('defects4j.checkout')
 def checkout_defects4j_project(project_name: str, version: str, working_dir: str):
     """Checkout a Defects4J project to create the working directory with buggy code.
     
@@ -51,14 +57,122 @@ def checkout_defects4j_project(project_name: str, version: str, working_dir: str
 # Replace a buggy file (target_file_path) with the patched program (java_file)
 def apply_java_file_patch(java_file: str, target_file_path: str):
     try:
-        # Copy the Java file to the target location
-        shutil.copy2(java_file, target_file_path)
+        # Remove the target first: it may be a hard link into a pristine checkout, which must not be written through
+        if os.path.lexists(target_file_path):
+            os.remove(target_file_path)
+        # Copy without the original timestamp so the patched file is newer than its compiled class and gets rebuilt
+        shutil.copyfile(java_file, target_file_path)
         return True
     except Exception as e:
         print(f"Error applying Java file patch: {e}")
         return False
 
 
+def parse_failing_tests(output: str) -> list[str]:
+    """Parse the failing test names from the output of `defects4j test`.
+
+    Parameters:
+    - output: stdout of `defects4j test`
+
+    Returns:
+    - list[str]: Failing test identifiers (e.g., ['org.jfree.chart.plot.junit.PiePlot3DTests::testDrawWithNullDataset'])
+    """
+    failing_tests = []
+    for line in output.split('\n'):
+        if line.strip().startswith('- '):
+            # Remove the "  - " prefix and get the test name
+            failing_tests.append(line.strip()[2:].strip())
+    return failing_tests
+
+
+@tracing.traced('defects4j.compile')
+def compile_defects4j_project(working_dir: str) -> tuple[bool, str]:
+    """Compile the checked out project in working_dir.
+
+    Returns:
+    - tuple[bool, str]: (True if compilation succeeded, compiler output)
+    """
+    try:
+        result = subprocess.run(
+            ['defects4j', 'compile', '-w', working_dir],
+            capture_output=True,
+            text=True,
+            cwd=working_dir
+        )
+        return result.returncode == 0, result.stdout + result.stderr
+    except Exception as e:
+        print(f"Error during compilation: {e}")
+        return False, str(e)
+
+
+def get_compile_errors(output: str, max_chars: int = 3000) -> str:
+    """Extract the javac errors from the output of `defects4j compile`: the javac lines from the first error on,
+    or the end of the output if it has no javac errors.
+    """
+    javac_lines = [line.split('[javac] ', 1)[1].rstrip() for line in output.splitlines() if '[javac] ' in line]
+    first_error = next((index for index, line in enumerate(javac_lines) if 'error' in line), None)
+    if first_error is None:
+        return output[-max_chars:].strip()
+    return '\n'.join(javac_lines[first_error:])[:max_chars]
+
+
+def run_defects4j_tests(working_dir: str, test: str = None, relevant: bool = False, on_failing_test=None,
+                        stop_on_failure: bool = False, cancel_event=None) -> dict:
+    """Run `defects4j test` in working_dir, optionally restricted to a single test or to the relevant tests.
+    The output is streamed, so failing tests are reported while the tests still run.
+
+    Parameters:
+    - working_dir: Absolute path to the project directory
+    - test: Test identifier passed to `defects4j test -t` (e.g., 'org.foo.BarTest::testBaz'); None runs the full suite
+    - relevant: Only run the tests relevant to the bug (`defects4j test -r`)
+    - on_failing_test: Called with each failing test identifier as soon as it is seen
+    - stop_on_failure: Kill the run at the first failing test (the failing tests are then incomplete)
+    - cancel_event: threading.Event that kills the run when set
+
+    Returns:
+    - dict: {'success', 'failing_tests', 'return_code', 'cancelled'}, the same shape run_defects4j_test produces
+    """
+    with tracing.span('defects4j.test', test=test, relevant=relevant) as test_span:
+        test_run = Defects4JTestRun(working_dir, test, relevant, on_failing_test, stop_on_failure, cancel_event)
+        result = test_run.run()
+        test_span.set(failing_tests=len(result['failing_tests']), cancelled=result['cancelled'])
+    return result
+
+
+def get_trigger_tests(working_dir: str) -> list[str]:
+    """Get the triggering tests of the bug checked out in working_dir.
+
+    Returns:
+    - list[str]: Triggering test identifiers, empty if the export failed
+    """
+    try:
+        result = subprocess.run(
+            ['defects4j', 'export', '-p', 'tests.trigger', '-w', working_dir],
+            capture_output=True,
+            text=True,
+            cwd=working_dir
+        )
+        if result.returncode != 0:
+            print(f"Failed to export triggering tests: {result.stderr}")
+            return []
+        return [line.strip() for line in result.stdout.split('\n') if line.strip()]
+    except Exception as e:
+        print(f"Error exporting triggering tests: {e}")
+        return []
+
+
+def get_trigger_tests_cached(project_name: str, version: str, working_dir: str) -> list[str]:
+    """Get the triggering tests of a bug from the metadata store, exporting them only if the store does not have them.
+    """
+    metadata_store = get_metadata_store()
+    trigger_tests = metadata_store.get_trigger_tests(project_name, version)
+    if trigger_tests is None:
+        trigger_tests = get_trigger_tests(working_dir)
+        if trigger_tests:
+            metadata_store.set_bug_field(project_name, version, 'tests.trigger', trigger_tests)
+    return trigger_tests
+
+
 def get_modified_sources(project_name: str, bug_id: str) -> list[str]:
     """Get the list of modified sources for a specific bug.
     
@@ -69,6 +183,11 @@ def get_modified_sources(project_name: str, bug_id: str) -> list[str]:
     Returns:
     - list[str]: List of modified source packages (e.g., ['com.google.javascript.jscomp.TypeCheck'])
     """
+    # Answer from the metadata store when the bug has been exported
+    modified_sources = get_metadata_store().get_modified_classes(project_name, bug_id)
+    if modified_sources is not None:
+        return modified_sources
+
     try:
         # Run the info command for specific bug
         result = subprocess.run(
@@ -101,6 +220,7 @@ def get_modified_sources(project_name: str, bug_id: str) -> list[str]:
                     # Empty line indicates end of modified sources section
                     break
             
+            get_metadata_store().set_bug_field(project_name, bug_id, 'classes.modified', modified_sources)
             return modified_sources
         else:
             print(f"Failed to get bug info: {result.stderr}")
@@ -111,16 +231,22 @@ def get_modified_sources(project_name: str, bug_id: str) -> list[str]:
         return []
 
 
-def get_full_source_path(project_name: str, working_dir: str, package_path: str):
+def get_full_source_path(project_name: str, working_dir: str, package_path: str, version: str = None):
     """Construct the target_java_path by combining connecting path with modified source.
     
     Parameters:
     - project_name: Project name (e.g., 'Chart', 'Closure', 'Math')
     - modified_source: Modified source from Defects4J (e.g., 'org.apache.commons.math3.dfp.Dfp')
+    - version: Bug version; if the metadata store knows this version's source directory it is used instead of
+      the per-project default (some projects moved their sources between versions)
     
     Returns:
     - str: Full target_java_path relative to working_dir
     """
+    if version is not None:
+        source_dir = get_metadata_store().get_source_dir(project_name, version)
+        if source_dir:
+            return os.path.join(working_dir, source_dir, package_path.replace('.', '/') + '.java')
 
     # Get the connecting path for this project
     paths = {
@@ -142,31 +268,25 @@ def get_full_source_path(project_name: str, working_dir: str, package_path: str)
 ########################
 
 def get_each_failing_test_info(failing_tests: list[str], failing_tests_info: str) -> dict[str, str]:
-    info_for_each_test = {}
-
-    for test_identifier in failing_tests:
-        # Find the start of this test's info (starts with "--- test_identifier")
-        start_marker = f"--- {test_identifier}"
-        start_index = failing_tests_info.find(start_marker)
-        
-        if start_index == -1:
-            # Test info not found, add empty dict
-            all_info.append({test_identifier: ""})
-            continue
-        
-        # Find the end of this test's info (next "---" or end of string)
-        next_start = failing_tests_info.find("---", start_index + 1)
-        
-        if next_start == -1:
-            # This is the last test, take everything to the end
-            test_info = failing_tests_info[start_index:]
-        else:
-            # Take everything up to the next test
-            test_info = failing_tests_info[start_index:next_start]
-        
-        info_for_each_test[test_identifier] = test_info
+    """
+    Split the contents of a failing_tests file into the section of each failing test ("--- test_identifier"
+    followed by its stack trace) in a single pass. Tests without a section map to an empty string.
+    For large files, prefer failure_index.read_failure_index, which streams the file.
+    """
+    wanted = set(failing_tests)
+    sections = {}
+    current_test = None
+    current_lines = []
+    for line in failing_tests_info.split('\n') + ['--- ']:
+        if line.startswith('--- '):
+            if current_test in wanted and current_test not in sections:
+                sections[current_test] = '\n'.join(current_lines) + '\n'
+            current_test = line[4:].strip()
+            current_lines = [line]
+        elif current_test is not None:
+            current_lines.append(line)
 
-    return info_for_each_test
+    return {test_identifier: sections.get(test_identifier, "") for test_identifier in failing_tests}
 
 
 def get_failure_message(test_info: str) -> str:
@@ -188,7 +308,12 @@ def get_failure_message(test_info: str) -> str:
     return ""  # Return empty string if not found
 
 
-def get_full_test_path(project_name: str, working_dir: str, test_identifier_without_method: str) -> str:
+def get_full_test_path(project_name: str, working_dir: str, test_identifier_without_method: str, version: str = None) -> str:
+    if version is not None:
+        test_dir = get_metadata_store().get_test_dir(project_name, version)
+        if test_dir:
+            return os.path.join(working_dir, test_dir, test_identifier_without_method.replace('.', '/') + '.java')
+
         # Get the connecting path for this project
     paths = {
         'chart': 'tests',
@@ -0,0 +1,146 @@
+"""
+Persistent cache of run_defects4j_test results, so re-running a sweep only validates candidates it has not seen.
+
+Results are keyed by (project, bug id, hash of the patched sources, test mode). Unlike the PatchOutcomeMemo, which
+matches patches that only differ in formatting, the key is the exact bytes of every patched file, so a hit is
+always a result of the same code.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.getenv(
+    'VALIDATION_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'validation_cache.sqlite')
+)
+
+
+def hash_patch_files(java_patch_files: dict[str, str]) -> str:
+    """
+    Hash a patch given as {modified source name: path to java patch file} by the contents of each patched source.
+    """
+    digest = hashlib.sha256()
+    for modified_source in sorted(java_patch_files):
+        with open(java_patch_files[modified_source], 'rb') as f:
+            source_digest = hashlib.sha256(f.read()).hexdigest()
+        digest.update(modified_source.encode('utf8') + b'\0' + source_digest.encode('utf8') + b'\0')
+    return digest.hexdigest()
+
+
+def is_conclusive(result) -> bool:
+    """
+    Whether a run_defects4j_test result says something about the patch and may be stored. Errors, runs whose
+    process could not be started (return code -1) and runs that were cancelled or killed before any test failed
+    describe the environment rather than the patch. A run cancelled at its first failing test is conclusive.
+    """
+    if not isinstance(result, list) or not result:
+        return False
+    run = result[0]
+    if run.get('return_code') == -1:
+        return False
+    if not run.get('success') and not run.get('failing_tests'):
+        return not run.get('cancelled') and (run.get('return_code') or 0) >= 0
+    return True
+
+
+class ValidationCache:
+    """
+    SQLite-backed cache of validation results, shared by the threads of a ValidationPool and by concurrent sweeps.
+    """
+
+    def __init__(self, cache_path: str = DEFAULT_CACHE_PATH):
+        self.cache_path = cache_path
+        self.local = threading.local()
+        connection = self.get_connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS validation_results (
+                project TEXT NOT NULL,
+                bug_id TEXT NOT NULL,
+                patch_hash TEXT NOT NULL,
+                test_mode TEXT NOT NULL,
+                passed INTEGER NOT NULL,
+                failing_tests TEXT NOT NULL,
+                elapsed REAL,
+                stage_times TEXT,
+                result TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (project, bug_id, patch_hash, test_mode)
+            )
+        """)
+        connection.commit()
+
+    def get_connection(self) -> sqlite3.Connection:
+        # SQLite connections cannot be shared between threads
+        if not hasattr(self.local, 'connection'):
+            self.local.connection = sqlite3.connect(self.cache_path, timeout=30)
+        return self.local.connection
+
+    def get(self, project_name: str, bug_id: str, patch_hash: str, test_mode: str) -> Optional[list]:
+        """
+        Return the cached run_defects4j_test result, or None if this patch has not been validated in this mode.
+        """
+        row = self.get_connection().execute(
+            'SELECT result FROM validation_results WHERE project = ? AND bug_id = ? AND patch_hash = ? AND test_mode = ?',
+            (project_name.lower(), str(bug_id), patch_hash, test_mode)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, project_name: str, bug_id: str, patch_hash: str, test_mode: str, result: list):
+        """
+        Store a run_defects4j_test result. Results that are not conclusive (see is_conclusive) are not stored.
+        """
+        if not is_conclusive(result):
+            return
+        run = result[0]
+        connection = self.get_connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO validation_results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                project_name.lower(), str(bug_id), patch_hash, test_mode,
+                int(bool(run.get('success'))),
+                json.dumps(run.get('failing_tests', [])),
+                run.get('elapsed'),
+                json.dumps(run.get('stage_times', {})),
+                json.dumps(result),
+                time.time()
+            )
+        )
+        connection.commit()
+
+    def get_summary(self, project_name: str = None) -> dict:
+        """
+        Count the cached results, e.g. to report how much of a sweep is already validated.
+
+        Returns: dict of {'results', 'passed', 'elapsed'} (elapsed is the total validation time saved on a rerun)
+        """
+        query = 'SELECT COUNT(*), COALESCE(SUM(passed), 0), COALESCE(SUM(elapsed), 0) FROM validation_results'
+        parameters = ()
+        if project_name is not None:
+            query += ' WHERE project = ?'
+            parameters = (project_name.lower(),)
+        results, passed, elapsed = self.get_connection().execute(query, parameters).fetchone()
+        return {'results': results, 'passed': passed, 'elapsed': elapsed}
+
+    def close(self):
+        if hasattr(self.local, 'connection'):
+            self.local.connection.close()
+            del self.local.connection
+
+
+_validation_cache: Optional[ValidationCache] = None
+_validation_cache_lock = threading.Lock()
+
+
+def get_validation_cache() -> ValidationCache:
+    """
+    Return the process-wide validation cache.
+    """
+    global _validation_cache
+    with _validation_cache_lock:
+        if _validation_cache is None:
+            _validation_cache = ValidationCache()
+    return _validation_cache
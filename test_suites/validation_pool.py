@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, Optional, Tuple
+import test_suites as ts
+from checkout_cache import CheckoutCache
+from validation_cache import ValidationCache
+
+# Resources one `defects4j test` run needs (an Ant JVM plus the forked JUnit JVM)
+CPUS_PER_VALIDATION = float(os.getenv('VALIDATION_CPUS_PER_JOB', '1'))
+MEMORY_GB_PER_VALIDATION = float(os.getenv('VALIDATION_MEMORY_GB_PER_JOB', '2'))
+
+# A validation request is (candidate id, project name, version, {modified source name: path to java patch file})
+ValidationRequest = Tuple[str, str, str, dict]
+
+
+def get_available_memory_gb() -> Optional[float]:
+    """
+    Return the memory available for new processes, or None if it cannot be determined.
+    """
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / (1024 * 1024)
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / (1024 ** 3)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def get_default_worker_count() -> int:
+    """
+    Number of validations that can run at once, limited by both CPU count and available memory.
+    """
+    cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    worker_count = int(cpu_count / CPUS_PER_VALIDATION)
+
+    available_memory_gb = get_available_memory_gb()
+    if available_memory_gb is not None:
+        worker_count = min(worker_count, int(available_memory_gb / MEMORY_GB_PER_VALIDATION))
+    return max(worker_count, 1)
+
+
+class ValidationPool:
+    """
+    Validates many candidate patches at once, each in its own working copy of a cached pristine checkout.
+    The work is done by defects4j subprocesses, so threads are enough to keep all cores busy.
+    With a ValidationCache, candidates validated in an earlier run resolve without using a working copy.
+    """
+
+    def __init__(self, checkout_cache: CheckoutCache = None, max_workers: int = None, test_mode: str = 'full',
+                 validation_cache: ValidationCache = None):
+        self.checkout_cache = checkout_cache or CheckoutCache()
+        self.test_mode = test_mode
+        self.validation_cache = validation_cache
+        self.max_workers = max_workers or get_default_worker_count()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='validation')
+
+    def validate_one(self, request: ValidationRequest) -> Tuple[str, list]:
+        candidate_id, project_name, version, java_patch_files = request
+        # working_dir is unused when a checkout cache is given
+        result = ts.run_defects4j_test(project_name, version, None, java_patch_files,
+                                       checkout_cache=self.checkout_cache, test_mode=self.test_mode,
+                                       validation_cache=self.validation_cache)
+        return candidate_id, result
+
+    def validate(self, requests: Iterable[ValidationRequest]) -> Iterator[Tuple[str, list]]:
+        """
+        Validate the candidates and yield (candidate id, run_defects4j_test result) as each one finishes.
+        """
+        futures = {self.executor.submit(self.validate_one, request): request[0] for request in requests}
+        try:
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield futures[future], {'error': str(e)}
+        finally:
+            # If the caller stops early, drop the candidates that have not started yet
+            for future in futures:
+                future.cancel()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()